@@ -0,0 +1,111 @@
+"""
+ Copyright (C) 2023 Università degli Studi di Camerino and Sigma S.p.A.
+ Authors: Alessandro Antinori, Rosario Capparuccia, Riccardo Coltrinari, Flavio Corradini, Marco Piangerelli, Barbara Re, Marco Scarpetta
+
+ This program is free software: you can redistribute it and/or modify
+ it under the terms of the GNU Affero General Public License as
+ published by the Free Software Foundation, either version 3 of the
+ License, or (at your option) any later version.
+
+ This program is distributed in the hope that it will be useful,
+ but WITHOUT ANY WARRANTY; without even the implied warranty of
+ MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+ GNU Affero General Public License for more details.
+
+ You should have received a copy of the GNU Affero General Public License
+ along with this program.  If not, see <https://www.gnu.org/licenses/>.
+ """
+
+# Compares the peak memory and the time of the writing of the artifacts of a Dataflow before and after they were
+# streamed to a temporary file, on ui.json made of copies of the nodes in the test fixture. The requirements are not
+# computed. Run from the backend folder:
+#
+#   python benchmarks/bench_artifacts.py [--copies 100 1000 5000]
+
+import argparse
+import copy
+import io
+import json
+import sys
+import tempfile
+import time
+import tracemalloc
+import zipfile
+from datetime import datetime
+from pathlib import Path
+
+import yaml
+
+sys.path.append('.')
+from simple_backend import config  # noqa: E402
+from simple_backend.schemas.nodes import UI  # noqa: E402
+from simple_backend.service import config_service  # noqa: E402
+
+
+def generate_artifacts_in_memory(repository: str, script: str, ui: UI) -> Path:
+    """
+    The previous implementation
+    """
+    timestamp = int(time.time() * 1000)
+    requirements = config_service.get_requirements(ui.nodes.values(), ui.structures)
+    zip_buffer = io.BytesIO()
+    with zipfile.ZipFile(zip_buffer, "a", zipfile.ZIP_DEFLATED, False) as zip_file:
+        zip_file.writestr("script.py", script)
+        zip_file.writestr("requirements.txt", "\n".join(requirements))
+        zip_file.writestr("metadata.yml", yaml.dump(
+            {"created_at": datetime.fromtimestamp(timestamp / 1000), "generated_by": "MarcoScarp94",
+             "company": "Sigma Spa"}, default_flow_style=False))
+        zip_file.writestr("ui.json", ui.json())
+    zip_buffer.seek(0)
+    dataflow_path = config_service.get_repository_path(repository) / f"dataflow{timestamp}.zip"
+    with dataflow_path.open('wb') as zipObj:
+        zipObj.write(zip_buffer.getvalue())
+    return dataflow_path
+
+
+def create_ui(copies: int) -> UI:
+    with open('tests/fixtures/config.json') as f:
+        ui = json.load(f)["ui"]
+    nodes, configs = dict(ui["nodes"]), dict(ui["configs"])
+    ui["nodes"], ui["configs"] = {}, {}
+    for n in range(copies):
+        for node_id, node in nodes.items():
+            ui["nodes"][f"{node_id}_{n}"] = copy.deepcopy(node)
+        for node_id, node_config in configs.items():
+            ui["configs"][f"{node_id}_{n}"] = copy.deepcopy(node_config)
+    return UI.parse_obj(ui)
+
+
+def measure(function, ui: UI):
+    """
+    Returns the peak memory traced during a call and the time of another, untraced, call
+    """
+    tracemalloc.start()
+    function("bench", "print('bench')\n", ui).unlink()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    start = time.perf_counter()
+    function("bench", "print('bench')\n", ui).unlink()
+    return peak, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--copies", type=int, nargs="+", default=[100, 1000, 5000])
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        config.BASE_OUTPUT_DIR = Path(directory)
+        config.REPOSITORY_INDEX_PATH = Path(directory) / "index.sqlite"
+        config_service.get_requirements = lambda ui_nodes, ui_structures: [config.RAIN_REQUIREMENT]
+        for copies in args.copies:
+            ui = create_ui(copies)
+            size = len(ui.json()) / 2 ** 20
+            old_peak, old_time = measure(generate_artifacts_in_memory, ui)
+            new_peak, new_time = measure(config_service.generate_artifacts, ui)
+            print(f"ui.json {size:8.1f} MB: in memory {old_peak / 2 ** 20:8.1f} MB {old_time * 1000:8.1f} ms, "
+                  f"streamed {new_peak / 2 ** 20:8.1f} MB {new_time * 1000:8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
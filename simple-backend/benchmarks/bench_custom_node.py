@@ -0,0 +1,90 @@
+"""
+ Copyright (C) 2023 Università degli Studi di Camerino and Sigma S.p.A.
+ Authors: Alessandro Antinori, Rosario Capparuccia, Riccardo Coltrinari, Flavio Corradini, Marco Piangerelli, Barbara Re, Marco Scarpetta
+
+ This program is free software: you can redistribute it and/or modify
+ it under the terms of the GNU Affero General Public License as
+ published by the Free Software Foundation, either version 3 of the
+ License, or (at your option) any later version.
+
+ This program is distributed in the hope that it will be useful,
+ but WITHOUT ANY WARRANTY; without even the implied warranty of
+ MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+ GNU Affero General Public License for more details.
+
+ You should have received a copy of the GNU Affero General Public License
+ along with this program.  If not, see <https://www.gnu.org/licenses/>.
+ """
+
+# Compares the extraction of the inputs and outputs of a custom node through CustomNodeIOVisitor with the previous
+# implementation, which unparsed the body and searched it with regular expressions, on generated functions. Run from
+# the backend folder:
+#
+#   python benchmarks/bench_custom_node.py [--sizes 100 1000 10000]
+
+import argparse
+import ast
+import re
+import sys
+import time
+
+sys.path.append('.')
+from simple_backend.service.node_service import find_custom_node_params, parse_custom_node_code  # noqa: E402
+
+
+def find_custom_node_params_regex(code):
+    """
+    The previous implementation
+    """
+    params = [x.arg for x in code.args.args]
+    body = ast.unparse(code.body)
+    inputs = [x.group("param") for x in re.finditer(
+        r"{}(\[|\.get\()(\"|\')(?P<param>[a-zA-Z_\d-]+)(\"|\')(\]|\))".format(params[0]), body, re.MULTILINE)]
+    outputs = [x.group("param") for x in re.finditer(
+        r"{}\[(\"|\')(?P<param>[a-zA-Z_\d-]+)(\"|\')\]".format(params[1]), body, re.MULTILINE)]
+    return inputs, outputs
+
+
+def generate_code(size: int) -> str:
+    """
+    Generates a custom node with size statements, each reading an input or writing an output
+    """
+    lines = ["def node(i, o):"]
+    for n in range(size):
+        if n % 3 == 0:
+            lines.append(f"    v{n} = i['in{n % 50}'] + len(str(v{n - 1 if n else 0} if {n} else 0))")
+        elif n % 3 == 1:
+            lines.append(f"    v{n} = i.get('in{n % 50}') or [x * 2 for x in range({n % 7})]")
+        else:
+            lines.append(f"    o['out{n % 50}'] = {{'a': v{n - 1}, 'b': v{n - 2}}}")
+    return "\n".join(lines) + "\n"
+
+
+def measure(function, *args, runs: int) -> float:
+    best = float("inf")
+    for _ in range(runs):
+        start = time.perf_counter()
+        function(*args)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1000, 10000])
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    for size in args.sizes:
+        function = parse_custom_node_code(generate_code(size), "node")
+        inputs, outputs = find_custom_node_params_regex(function)
+        params = find_custom_node_params(function, "node")
+        assert params.inputs == list(dict.fromkeys(inputs)) and params.outputs == list(dict.fromkeys(outputs))
+        regex = measure(find_custom_node_params_regex, function, runs=args.runs)
+        visitor = measure(find_custom_node_params, function, "node", runs=args.runs)
+        print(f"{size:6} statements: unparse and regex {regex * 1000:8.2f} ms, visitor {visitor * 1000:8.2f} ms, "
+              f"{regex / visitor:.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+"""
+ Copyright (C) 2023 Università degli Studi di Camerino and Sigma S.p.A.
+ Authors: Alessandro Antinori, Rosario Capparuccia, Riccardo Coltrinari, Flavio Corradini, Marco Piangerelli, Barbara Re, Marco Scarpetta
+
+ This program is free software: you can redistribute it and/or modify
+ it under the terms of the GNU Affero General Public License as
+ published by the Free Software Foundation, either version 3 of the
+ License, or (at your option) any later version.
+
+ This program is distributed in the hope that it will be useful,
+ but WITHOUT ANY WARRANTY; without even the implied warranty of
+ MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+ GNU Affero General Public License for more details.
+
+ You should have received a copy of the GNU Affero General Public License
+ along with this program.  If not, see <https://www.gnu.org/licenses/>.
+ """
+
+# Compares DagCreator with the previous networkx based implementation on synthetic data flows, timing the creation of
+# the graph, the cycle check and the topological sort as done by config_service.generate_script. Run from the backend
+# folder:
+#
+#   python benchmarks/bench_dag.py [--sizes 10000 50000 100000]
+
+import argparse
+import random
+import sys
+import time
+
+sys.path.append('.')
+from simple_backend.schemas.nodes import Node, NodeThen  # noqa: E402
+from simple_backend.service.dag_generator import DagCreator, get_edges  # noqa: E402
+
+
+class NetworkxDagCreator:
+    """
+    The networkx based DagCreator replaced by the adjacency lists one
+    """
+
+    def __init__(self):
+        import networkx as nx
+        self._nx = nx
+        self._graph = nx.DiGraph()
+        self._nodes = {}
+
+    def create_dag(self, nodes):
+        self._edges = get_edges(nodes)
+        self._graph.add_edges_from([(edge.source, edge.destination) for edge in self._edges.values()])
+        self._nodes.update({node.node_id: node for node in nodes})
+
+    def has_cycles(self):
+        return not self._nx.is_directed_acyclic_graph(self._graph)
+
+    def get_ordered_nodes(self):
+        return [self._nodes.get(node_id) for node_id in self._nx.topological_sort(self._graph)]
+
+
+def generate_nodes(size: int, seed: int = 0):
+    """
+    Generates a data flow where each node has up to 3 edges towards the following 100 nodes
+    """
+    rng = random.Random(seed)
+    nodes = []
+    for i in range(size):
+        targets = {rng.randrange(i + 1, min(i + 100, size)) for _ in range(rng.randint(0, 3))} if i < size - 1 else []
+        nodes.append(Node.construct(node_id=f"Node{i}", node="rain.nodes.custom.custom.CustomNode", parameters={},
+                                    then=[NodeThen.construct(to_node=f"Node{t}", from_port="o", to_port=f"i{i}")
+                                          for t in sorted(targets)]))
+    rng.shuffle(nodes)
+    return nodes
+
+
+def measure(creator_class, nodes, runs: int) -> float:
+    best = float("inf")
+    for _ in range(runs):
+        start = time.perf_counter()
+        dag = creator_class()
+        dag.create_dag(nodes)
+        assert not dag.has_cycles()
+        dag.get_ordered_nodes()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main(sizes, runs: int):
+    start = time.perf_counter()
+    import networkx  # noqa: F401
+    print(f"networkx import: {(time.perf_counter() - start) * 1000:.1f} ms")
+    for size in sizes:
+        nodes = generate_nodes(size)
+        new = measure(DagCreator, nodes, runs)
+        old = measure(NetworkxDagCreator, nodes, runs)
+        print(f"{size} nodes: adjacency lists {new * 1000:.1f} ms, networkx {old * 1000:.1f} ms "
+              f"({old / new:.1f}x)")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark of DagCreator")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 50000, 100000])
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args()
+    main(args.sizes, args.runs)
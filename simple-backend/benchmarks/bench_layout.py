@@ -0,0 +1,78 @@
+"""
+ Copyright (C) 2023 Università degli Studi di Camerino and Sigma S.p.A.
+ Authors: Alessandro Antinori, Rosario Capparuccia, Riccardo Coltrinari, Flavio Corradini, Marco Piangerelli, Barbara Re, Marco Scarpetta
+
+ This program is free software: you can redistribute it and/or modify
+ it under the terms of the GNU Affero General Public License as
+ published by the Free Software Foundation, either version 3 of the
+ License, or (at your option) any later version.
+
+ This program is distributed in the hope that it will be useful,
+ but WITHOUT ANY WARRANTY; without even the implied warranty of
+ MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+ GNU Affero General Public License for more details.
+
+ You should have received a copy of the GNU Affero General Public License
+ along with this program.  If not, see <https://www.gnu.org/licenses/>.
+ """
+
+# Compares the layered layout with the spring layout of networkx used by POST /api/v1/script, on generated data flows
+# where each node has up to 3 edges towards the following 20 nodes. Run from the backend folder:
+#
+#   python benchmarks/bench_layout.py [--sizes 100 1000 5000]
+
+import argparse
+import random
+import sys
+import time
+
+sys.path.append('.')
+from simple_backend.service.dag_layout import layered_layout  # noqa: E402
+
+
+def generate_graph(size: int, seed: int = 0):
+    rng = random.Random(seed)
+    node_ids = [f"Node{i}" for i in range(size)]
+    edges = []
+    for i in range(size - 1):
+        for t in sorted({rng.randrange(i + 1, min(i + 20, size)) for _ in range(rng.randint(1, 3))}):
+            edges.append((node_ids[i], node_ids[t]))
+    return node_ids, edges
+
+
+def spring_layout(node_ids, edges):
+    import networkx as nx
+    g = nx.DiGraph()
+    g.add_nodes_from(node_ids)
+    g.add_edges_from(edges)
+    return nx.spring_layout(g, scale=500)
+
+
+def measure(function, *args) -> float:
+    start = time.perf_counter()
+    function(*args)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1000, 5000])
+    args = parser.parse_args()
+
+    import networkx  # noqa: F401, imported here to leave it out of the timings
+    for size in args.sizes:
+        node_ids, edges = generate_graph(size)
+        assert layered_layout(node_ids, edges) == layered_layout(node_ids, edges)
+        layered = measure(layered_layout, node_ids, edges)
+        try:
+            spring = measure(spring_layout, node_ids, edges)
+        except ImportError as e:
+            # networkx needs scipy for the spring layout of more than 500 nodes
+            print(f"{size:6} nodes, {len(edges):6} edges: spring failed ({e}), layered {layered * 1000:8.1f} ms")
+            continue
+        print(f"{size:6} nodes, {len(edges):6} edges: spring {spring * 1000:9.1f} ms, "
+              f"layered {layered * 1000:8.1f} ms, {spring / layered:.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+"""
+ Copyright (C) 2023 Università degli Studi di Camerino and Sigma S.p.A.
+ Authors: Alessandro Antinori, Rosario Capparuccia, Riccardo Coltrinari, Flavio Corradini, Marco Piangerelli, Barbara Re, Marco Scarpetta
+
+ This program is free software: you can redistribute it and/or modify
+ it under the terms of the GNU Affero General Public License as
+ published by the Free Software Foundation, either version 3 of the
+ License, or (at your option) any later version.
+
+ This program is distributed in the hope that it will be useful,
+ but WITHOUT ANY WARRANTY; without even the implied warranty of
+ MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+ GNU Affero General Public License for more details.
+
+ You should have received a copy of the GNU Affero General Public License
+ along with this program.  If not, see <https://www.gnu.org/licenses/>.
+ """
+
+# Measures the requests per second served by GET /api/v1/nodes before and after the responses were pre-encoded, on a
+# catalogue made of copies of the nodes in the test fixture. Run from the backend folder:
+#
+#   python benchmarks/bench_nodes.py [--nodes 200] [--requests 500]
+
+import argparse
+import copy
+import json
+import sys
+import time
+
+sys.path.append('.')
+from fastapi import FastAPI  # noqa: E402
+from fastapi.testclient import TestClient  # noqa: E402
+from simple_backend.controller import node_api  # noqa: E402
+from simple_backend.schemas.nodes import NodeStructure  # noqa: E402
+from simple_backend.service import node_service  # noqa: E402
+from simple_backend.service.node_catalogue import NodeCatalogue  # noqa: E402
+
+
+def create_catalogue(size: int) -> NodeCatalogue:
+    with open('tests/fixtures/rain_structure.json') as f:
+        structure = json.load(f)
+    nodes = []
+    for i in range(size):
+        node = copy.deepcopy(structure["nodes"][i % len(structure["nodes"])])
+        node["clazz"] = f"{node['clazz']}{i}"
+        node["package"] = f"{node['package']}{i}"
+        nodes.append(node)
+    return NodeCatalogue({**structure, "nodes": nodes}, f"bench-{size}")
+
+
+def create_previous_app() -> FastAPI:
+    """
+    The previous endpoint, validating and serializing the catalogue at each request
+    """
+    app = FastAPI()
+
+    @app.get('/api/v1/nodes', response_model=list[NodeStructure])
+    async def get_nodes():
+        return node_service.get_nodes_structure()
+
+    return app
+
+
+def create_app() -> FastAPI:
+    app = FastAPI()
+    app.include_router(node_api.router, prefix='/api/v1/nodes')
+    return app
+
+
+def measure(client: TestClient, requests: int, headers: dict) -> float:
+    client.get('/api/v1/nodes', headers=headers)
+    start = time.perf_counter()
+    for _ in range(requests):
+        client.get('/api/v1/nodes', headers=headers)
+    return requests / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--nodes", type=int, default=200)
+    parser.add_argument("--requests", type=int, default=500)
+    args = parser.parse_args()
+
+    node_service.set_catalogue(create_catalogue(args.nodes))
+    previous = TestClient(create_previous_app())
+    current = TestClient(create_app())
+    etag = current.get('/api/v1/nodes', headers={"Accept-Encoding": "gzip"}).headers["ETag"]
+    results = [
+        ("previous", measure(previous, args.requests, {"Accept-Encoding": "identity"})),
+        ("pre-encoded", measure(current, args.requests, {"Accept-Encoding": "identity"})),
+        ("pre-encoded gzip", measure(current, args.requests, {"Accept-Encoding": "gzip"})),
+        ("304", measure(current, args.requests, {"Accept-Encoding": "gzip", "If-None-Match": etag})),
+    ]
+    print(f"{args.nodes} nodes, {args.requests} requests")
+    for name, rate in results:
+        print(f"{name:>20}: {rate:10.0f} requests/s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+"""
+ Copyright (C) 2023 Università degli Studi di Camerino and Sigma S.p.A.
+ Authors: Alessandro Antinori, Rosario Capparuccia, Riccardo Coltrinari, Flavio Corradini, Marco Piangerelli, Barbara Re, Marco Scarpetta
+
+ This program is free software: you can redistribute it and/or modify
+ it under the terms of the GNU Affero General Public License as
+ published by the Free Software Foundation, either version 3 of the
+ License, or (at your option) any later version.
+
+ This program is distributed in the hope that it will be useful,
+ but WITHOUT ANY WARRANTY; without even the implied warranty of
+ MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+ GNU Affero General Public License for more details.
+
+ You should have received a copy of the GNU Affero General Public License
+ along with this program.  If not, see <https://www.gnu.org/licenses/>.
+ """
+
+# Compares the parsing of the scripts by script_service.parse_script with the previous regular expressions based
+# implementation of POST /api/v1/script, on generated scripts. The layout of the nodes is not included. Run from the
+# backend folder:
+#
+#   python benchmarks/bench_script.py [--sizes 500 1000 2000 5000]
+
+import argparse
+import ast
+import re
+import sys
+import time
+
+sys.path.append('.')
+from simple_backend.service.script_service import parse_script  # noqa: E402
+
+
+def parse_script_regex(code: str):
+    """
+    The previous implementation, up to the layout of the nodes
+    """
+    ast.parse(code)
+    if 'import rain as' in code:
+        library = re.compile(r'import rain as (?P<library>.*)').search(code).group('library').strip()
+    else:
+        library = 'rain'
+    nodes_classes = re.compile(r'(?P<node>.+?) *?= *?' + re.escape(library) + r'\.(?P<clazz>.+?)\([^\"]').findall(code)
+    params = {}
+    for n, c in nodes_classes:
+        node_params = re.compile(
+            re.escape(n) + r' *?= *?' + re.escape(library) + r'\.' + re.escape(c) + r'\((?P<params>.+?)\)',
+            re.DOTALL)
+        params[n] = {}
+        for param_line in node_params.search(code).group("params").strip().splitlines():
+            (name, value) = re.compile(r'(?P<name>.+?) *?= *(?P<value>.*?),?$').search(param_line.strip()).groups()
+            params[n][name] = value
+    edges = []
+    for edge_line in re.compile(r'add_edges\(\[(?P<edges>.+?)\]\)', re.DOTALL).search(code).group("edges")\
+            .strip().splitlines():
+        edges.append(re.compile(
+            r'(?P<from_node>.+?) *?@ *?\'(?P<from_var>.+?)\' *?> *(?P<to_node>.*?) *?@ *?\'(?P<to_var>.+?)\',?$')
+            .search(edge_line.strip()).groups())
+    return nodes_classes, params, edges
+
+
+def generate_script(size: int) -> str:
+    """
+    Generates a script with a chain of size nodes, alternately rain and custom ones
+    """
+    lines = ["import rain as sr", "", "", "def step(i, o):", "    o['out'] = i['in']", "", "",
+             'df = sr.DataFlow("dataflow")', ""]
+    for n in range(size):
+        if n % 2:
+            lines += [f"Node{n} = sr.CustomNode(", f'    node_id="Node{n}",', "    use_function=step,", ")", ""]
+        else:
+            lines += [f"Node{n} = sr.PandasCSVLoader(", f'    node_id="Node{n}",', f'    path="data{n}.csv",',
+                      '    delim=",",', ")", ""]
+    lines.append("df.add_edges([")
+    lines += [f"    Node{n} @ 'out' > Node{n + 1} @ 'in'," for n in range(size - 1)]
+    lines += ["])", "", "df.execute()", ""]
+    return "\n".join(lines)
+
+
+def measure(function, code: str, runs: int) -> float:
+    best = float("inf")
+    for _ in range(runs):
+        start = time.perf_counter()
+        function(code)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[500, 1000, 2000, 5000])
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args()
+
+    for size in args.sizes:
+        code = generate_script(size)
+        nodes_classes, _, edges = parse_script_regex(code)
+        script = parse_script(code)
+        assert [(n.node_id, n.clazz) for n in script.nodes] == nodes_classes and script.edges == edges
+        regex = measure(parse_script_regex, code, args.runs)
+        visitor = measure(parse_script, code, args.runs)
+        print(f"{size:6} nodes: regular expressions {regex * 1000:9.1f} ms, AST {visitor * 1000:7.1f} ms, "
+              f"{regex / visitor:.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+"""
+ Copyright (C) 2023 Università degli Studi di Camerino and Sigma S.p.A.
+ Authors: Alessandro Antinori, Rosario Capparuccia, Riccardo Coltrinari, Flavio Corradini, Marco Piangerelli, Barbara Re, Marco Scarpetta
+
+ This program is free software: you can redistribute it and/or modify
+ it under the terms of the GNU Affero General Public License as
+ published by the Free Software Foundation, either version 3 of the
+ License, or (at your option) any later version.
+
+ This program is distributed in the hope that it will be useful,
+ but WITHOUT ANY WARRANTY; without even the implied warranty of
+ MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+ GNU Affero General Public License for more details.
+
+ You should have received a copy of the GNU Affero General Public License
+ along with this program.  If not, see <https://www.gnu.org/licenses/>.
+ """
+
+# Measures the latency of NodeCatalogue.search, used by GET /api/v1/nodes/search, on synthetic catalogues. Run from
+# the backend folder:
+#
+#   python benchmarks/bench_search.py [--sizes 1000 5000] [--runs 1000]
+
+import argparse
+import random
+import sys
+import time
+
+sys.path.append('.')
+from simple_backend.service.node_catalogue import NodeCatalogue  # noqa: E402
+
+WORDS = ["data", "frame", "column", "csv", "json", "model", "train", "test", "split", "load", "write", "filter",
+         "group", "merge", "scale", "encode", "cluster", "regression", "tree", "forest", "mean", "sum", "index",
+         "table", "spark", "pandas", "image", "text", "token", "vector"]
+LIBRARIES = ["Pandas", "Scikit-Learn", "Spark", "TensorFlow", "Base"]
+TYPES = ["Input", "Output", "Transformer", "Estimator", "Custom"]
+QUERIES = [("", {}), ("csv", {}), ("lo", {}), ("train split", {}), ("data fr", {"libraries": ["Pandas"]}),
+           ("", {"types": ["Transformer"]}), ("zzz", {})]
+
+
+def create_structure(size: int, seed: int = 0) -> dict:
+    rng = random.Random(seed)
+    nodes = []
+    for i in range(size):
+        clazz = "".join(word.capitalize() for word in rng.sample(WORDS, 3)) + str(i)
+        nodes.append({
+            "clazz": clazz,
+            "package": f"rain.nodes.{clazz}",
+            "description": " ".join(rng.choices(WORDS, k=12)),
+            "parameter": [{"name": "_".join(rng.sample(WORDS, 2))} for _ in range(rng.randint(0, 6))],
+            "tags": {"library": rng.choice(LIBRARIES), "type": rng.choice(TYPES)},
+        })
+    return {"nodes": nodes}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 5000])
+    parser.add_argument("--runs", type=int, default=1000)
+    args = parser.parse_args()
+
+    for size in args.sizes:
+        structure = create_structure(size)
+        start = time.perf_counter()
+        catalogue = NodeCatalogue(structure)
+        print(f"{size} nodes, index built in {(time.perf_counter() - start) * 1000:.1f} ms")
+        for query, filters in QUERIES:
+            start = time.perf_counter()
+            for _ in range(args.runs):
+                total, _, _ = catalogue.search(query, **filters)
+            elapsed = (time.perf_counter() - start) / args.runs * 1000
+            print(f"{query!r:>16} {str(filters):>30}: {total:6} matches, {elapsed:.3f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+"""
+ Copyright (C) 2023 Università degli Studi di Camerino and Sigma S.p.A.
+ Authors: Alessandro Antinori, Rosario Capparuccia, Riccardo Coltrinari, Flavio Corradini, Marco Piangerelli, Barbara Re, Marco Scarpetta
+
+ This program is free software: you can redistribute it and/or modify
+ it under the terms of the GNU Affero General Public License as
+ published by the Free Software Foundation, either version 3 of the
+ License, or (at your option) any later version.
+
+ This program is distributed in the hope that it will be useful,
+ but WITHOUT ANY WARRANTY; without even the implied warranty of
+ MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+ GNU Affero General Public License for more details.
+
+ You should have received a copy of the GNU Affero General Public License
+ along with this program.  If not, see <https://www.gnu.org/licenses/>.
+ """
+
+# Compares the latency of running a script in a new interpreter (cold) with running it in a warm runner.
+# The script imports the preloaded modules, as a generated script imports rain. Run from the backend folder:
+#
+#   python benchmarks/bench_zygote.py [--preload rain,numpy,pandas,sklearn] [--runs 10]
+
+import argparse
+import asyncio
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.append('.')
+from simple_backend import config  # noqa: E402
+from simple_backend.service import zygote_service  # noqa: E402
+
+
+async def run_cold(script: str, cwd: str) -> float:
+    start = time.perf_counter()
+    process = await asyncio.create_subprocess_exec(sys.executable, script, cwd=cwd, stdout=asyncio.subprocess.PIPE)
+    await process.communicate()
+    return time.perf_counter() - start
+
+
+async def run_warm(zygote: zygote_service.Zygote, script: str, cwd: str) -> float:
+    start = time.perf_counter()
+    reader, writer = await zygote.run(script, cwd)
+    while await reader.readline():
+        pass
+    writer.close()
+    return time.perf_counter() - start
+
+
+async def main(preload: str, runs: int):
+    config.WARM_RUNNER_PRELOAD = preload
+    with tempfile.TemporaryDirectory() as cwd:
+        script = Path(cwd) / "script.py"
+        modules = [module for module in preload.split(",") if module]
+        script.write_text("".join(f"try:\n    import {m}\nexcept ImportError:\n    pass\n" for m in modules)
+                          + "print('done')\n")
+
+        cold = [await run_cold(str(script), cwd) for _ in range(runs)]
+
+        start = time.perf_counter()
+        zygote = zygote_service.Zygote(sys.executable)
+        await zygote.start()
+        startup = time.perf_counter() - start
+        try:
+            warm = [await run_warm(zygote, str(script), cwd) for _ in range(runs)]
+        finally:
+            zygote.stop()
+
+    print(f"preloaded modules: {preload}")
+    print(f"cold: mean {statistics.mean(cold) * 1000:.1f} ms, median {statistics.median(cold) * 1000:.1f} ms")
+    print(f"warm: mean {statistics.mean(warm) * 1000:.1f} ms, median {statistics.median(warm) * 1000:.1f} ms "
+          f"(runner startup {startup * 1000:.1f} ms)")
+
+
+if __name__ == '__main__':
+    if not zygote_service.is_supported():
+        sys.exit("The warm runner requires os.fork")
+    parser = argparse.ArgumentParser(description="Benchmark of the warm runner")
+    parser.add_argument("--preload", default=config.WARM_RUNNER_PRELOAD)
+    parser.add_argument("--runs", type=int, default=10)
+    args = parser.parse_args()
+    asyncio.run(main(args.preload, args.runs))
@@ -24,7 +24,7 @@ import uvicorn
 from fastapi import FastAPI
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
-from simple_backend.service import node_service
+from simple_backend.service import catalogue_service, execution_service, node_service, venv_pool, zygote_service
 from simple_backend.config import here
 from simple_backend.controller.routes import initialize_api_routes, initialize_ws_routes
 from simple_backend.errors import register_errors
@@ -41,6 +41,9 @@ def create_app(is_testing: bool):
     app.include_router(initialize_api_routes())
     app.include_router(initialize_ws_routes())
     register_errors(app)
+    app.add_event_handler("shutdown", zygote_service.manager.stop)
+    app.add_event_handler("shutdown", catalogue_service.manager.stop)
+    app.add_event_handler("shutdown", execution_service.scheduler.stop)
 
     if not app.debug:
         static_files_folder = os.path.join(os.path.dirname(__file__), 'static')
@@ -55,6 +58,9 @@ def create_app(is_testing: bool):
 
     node_service.download_rain_structure(is_testing)
 
+    if not is_testing:
+        venv_pool.manager.start()
+
     return app
 
 
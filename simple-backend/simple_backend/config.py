@@ -42,3 +42,60 @@ def here(resource: str):
 
 BASE_OUTPUT_DIR = Path(here("../output_repositories")).resolve()
 ARCHIVE_DIR = Path(BASE_OUTPUT_DIR / ".archive").resolve()
+# kept out of the repositories, since the changes of the files of the index would change their mtime
+REPOSITORY_INDEX_PATH = Path(os.environ.get("REPOSITORY_INDEX_PATH", here("../repository_index.sqlite"))).resolve()
+# advisory locks serializing the changes of each repository among the workers
+REPOSITORY_LOCK_DIR = Path(os.environ.get("REPOSITORY_LOCK_DIR", here("../repository_locks"))).resolve()
+ARTIFACTS_COMPRESSION_LEVEL = int(os.environ.get("ARTIFACTS_COMPRESSION_LEVEL", "6"))
+
+VENV_CACHE_DIR = Path(os.environ.get("VENV_CACHE_DIR", here("../venv_cache"))).resolve()
+VENV_CACHE_MAX_ENTRIES = int(os.environ.get("VENV_CACHE_MAX_ENTRIES", "10"))
+VENV_CACHE_MAX_SIZE_MB = int(os.environ.get("VENV_CACHE_MAX_SIZE_MB", "10240"))
+VENV_CACHE_LEASE_TIMEOUT = int(os.environ.get("VENV_CACHE_LEASE_TIMEOUT", str(24 * 60 * 60)))
+
+MAX_CONCURRENT_EXECUTIONS = int(os.environ.get("MAX_CONCURRENT_EXECUTIONS", "2"))
+# shared by the workers, so that the executions can be followed and cancelled through any of them
+EXECUTION_REGISTRY_PATH = Path(os.environ.get("EXECUTION_REGISTRY_PATH",
+                                              here("../execution_registry.sqlite"))).resolve()
+EXECUTION_POLL_INTERVAL = float(os.environ.get("EXECUTION_POLL_INTERVAL", "0.5"))
+EXECUTION_HISTORY_SIZE = int(os.environ.get("EXECUTION_HISTORY_SIZE", "100"))
+EXECUTION_REPLAY_LINES = int(os.environ.get("EXECUTION_REPLAY_LINES", "1000"))
+EXECUTION_FRAME_SIZE = int(os.environ.get("EXECUTION_FRAME_SIZE", str(64 * 1024)))
+EXECUTION_FRAME_INTERVAL = float(os.environ.get("EXECUTION_FRAME_INTERVAL", "0.05"))
+EXECUTION_QUEUE_SIZE = int(os.environ.get("EXECUTION_QUEUE_SIZE", str(1024 * 1024)))
+EXECUTION_OVERFLOW_POLICY = os.environ.get("EXECUTION_OVERFLOW_POLICY", "block")
+EXECUTION_LOG_SEGMENT_SIZE = int(os.environ.get("EXECUTION_LOG_SEGMENT_SIZE", str(8 * 1024 * 1024)))
+
+WHEELHOUSE_DIR = Path(os.environ.get("WHEELHOUSE_DIR", here("../wheelhouse"))).resolve()
+
+RAIN_REQUIREMENT = os.environ.get("RAIN_REQUIREMENT", "git+https://github.com/SIMPLE-DVS/rain@master#egg=rain")
+
+VENV_POOL_DIR = Path(os.environ.get("VENV_POOL_DIR", here("../venv_pool"))).resolve()
+VENV_POOL_SIZE = int(os.environ.get("VENV_POOL_SIZE", "0"))
+VENV_POOL_REFILL_CONCURRENCY = int(os.environ.get("VENV_POOL_REFILL_CONCURRENCY", "1"))
+VENV_POOL_MAX_IDLE = int(os.environ.get("VENV_POOL_MAX_IDLE", str(24 * 60 * 60)))
+VENV_POOL_CHECK_INTERVAL = int(os.environ.get("VENV_POOL_CHECK_INTERVAL", "30"))
+
+WARM_RUNNER_PRELOAD = os.environ.get("WARM_RUNNER_PRELOAD", "rain,numpy,pandas,sklearn")
+WARM_RUNNER_IDLE_TIMEOUT = float(os.environ.get("WARM_RUNNER_IDLE_TIMEOUT", "600"))
+WARM_RUNNER_MAX_MEMORY_MB = float(os.environ.get("WARM_RUNNER_MAX_MEMORY_MB", "2048"))
+WARM_RUNNER_START_TIMEOUT = float(os.environ.get("WARM_RUNNER_START_TIMEOUT", "120"))
+
+EXECUTION_METRICS_INTERVAL = float(os.environ.get("EXECUTION_METRICS_INTERVAL", "1"))
+EXECUTION_MAX_MEMORY_MB = int(os.environ.get("EXECUTION_MAX_MEMORY_MB", "0"))
+EXECUTION_MAX_CPU_SECONDS = int(os.environ.get("EXECUTION_MAX_CPU_SECONDS", "0"))
+
+CHECKPOINT_DIR = Path(os.environ.get("CHECKPOINT_DIR", here("../checkpoints"))).resolve()
+CHECKPOINT_MAX_ENTRIES = int(os.environ.get("CHECKPOINT_MAX_ENTRIES", "1000"))
+CHECKPOINT_MAX_SIZE_MB = int(os.environ.get("CHECKPOINT_MAX_SIZE_MB", "10240"))
+
+RAIN_STRUCTURE_URL = os.environ.get("RAIN_STRUCTURE_URL",
+                                    "https://raw.githubusercontent.com/SIMPLE-DVS/rain/json/rain_structure.json")
+CATALOGUE_DIR = Path(os.environ.get("CATALOGUE_DIR", here("../catalogue"))).resolve()
+CATALOGUE_REFRESH_INTERVAL = int(os.environ.get("CATALOGUE_REFRESH_INTERVAL", "3600"))
+CATALOGUE_REQUEST_TIMEOUT = float(os.environ.get("CATALOGUE_REQUEST_TIMEOUT", "10"))
+
+NODES_MAX_AGE = int(os.environ.get("NODES_MAX_AGE", "0"))
+NODES_MIN_COMPRESSED_SIZE = int(os.environ.get("NODES_MIN_COMPRESSED_SIZE", "1024"))
+
+CUSTOM_NODE_CACHE_SIZE = int(os.environ.get("CUSTOM_NODE_CACHE_SIZE", "256"))
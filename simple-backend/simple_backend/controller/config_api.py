@@ -18,6 +18,7 @@
 
 from typing import Union
 from fastapi import APIRouter
+from starlette.concurrency import run_in_threadpool
 from pydantic import BaseModel
 from simple_backend.schemas.nodes import ConfigurationSchema, CustomNode, Node
 from simple_backend.service import config_service
@@ -44,7 +45,7 @@ async def post_config(config: ConfigurationSchema):
 
     script = config_service.generate_script(config.nodes)
 
-    zip_file = config_service.generate_artifacts(config.repository, script, config.ui)
+    zip_file = await run_in_threadpool(config_service.generate_artifacts, config.repository, script, config.ui)
 
     return ConfigResponse(id=zip_file.stem, path=str(zip_file),
                           url=f"/repositories/{config.repository}/dataflows/{zip_file.stem}")
@@ -16,23 +16,66 @@
  along with this program.  If not, see <https://www.gnu.org/licenses/>.
  """
 
-from fastapi import APIRouter, Response
+from fastapi import APIRouter, Query, Request, Response
+from starlette.concurrency import run_in_threadpool
 from starlette.status import HTTP_204_NO_CONTENT
-from simple_backend.schemas.dataflow import DataFlow
-from simple_backend.service import repository_service as rs
+from simple_backend.errors import BadRequestError, HttpQueryError
+from simple_backend.schemas.dataflow import DataFlow, DataFlowPage
+from simple_backend.service import dataflow_archive, repository_index, repository_service as rs
 
 
 router = APIRouter()
 
 
-@router.get('/{id}', response_model=DataFlow)
-async def get(repository: str, id: str):
-    """ Gets the specified Dataflow from the repository. """
-    return rs.get_dataflow_from_repository(repository, id)
+@router.get('', responses={200: {"model": DataFlowPage}, 404: {"schema": BadRequestError}})
+async def get_all(repository: str, archived: bool = False, sort: str = "id",
+                  order: str = Query("asc", regex="^(asc|desc)$"), offset: int = Query(0, ge=0),
+                  limit: int = Query(50, ge=1, le=1000)):
+    """ Gets a page of the Dataflows of the repository, sorted by id, created, modified, size or nodes. """
+    try:
+        total, dataflows = await run_in_threadpool(repository_index.list_dataflows, repository, archived, sort, order,
+                                                   offset, limit)
+    except FileNotFoundError as e:
+        raise BadRequestError(e.__str__())
+    return DataFlowPage(total=total, offset=offset, limit=limit, dataflows=dataflows)
+
+
+@router.get('/{id}', response_model=DataFlow, response_model_exclude_unset=True,
+            responses={400: {"schema": HttpQueryError}, 404: {"schema": BadRequestError}})
+async def get(repository: str, id: str, fields: str = None):
+    """
+    Gets the specified Dataflow from the repository.
+    The comma separated fields (script, metadata, requirements, ui) select the members that are read and returned.
+    """
+    if fields is not None:
+        fields = [field.strip() for field in fields.split(",") if field.strip()]
+        unknown = [field for field in fields if field not in rs.DATAFLOW_MEMBERS]
+        if unknown:
+            raise HttpQueryError(f"Unknown fields {', '.join(unknown)}, "
+                                 f"the available ones are {', '.join(rs.DATAFLOW_MEMBERS)}")
+    return await run_in_threadpool(rs.get_dataflow_from_repository, repository, id, fields)
+
+
+@router.get('/{id}/archive', response_class=Response,
+            responses={200: {"content": {"application/zip": {}}}, 404: {"schema": BadRequestError}})
+async def get_archive(repository: str, id: str, request: Request):
+    """ Downloads the zip of the Dataflow, supporting a single byte range. """
+    dataflow_path = rs.get_dataflow_path(repository, id)
+    return await run_in_threadpool(dataflow_archive.get_archive_response, dataflow_path, request.headers)
+
+
+@router.get('/{id}/members/{member}', response_class=Response, responses={404: {"schema": BadRequestError}})
+async def get_member(repository: str, id: str, member: str, request: Request):
+    """ Downloads a single file of the Dataflow, such as script.py or ui.json. """
+    dataflow_path = rs.get_dataflow_path(repository, id)
+    response = await run_in_threadpool(dataflow_archive.get_member_response, dataflow_path, member, request.headers)
+    if response is None:
+        raise BadRequestError(f"Dataflow {id} does not contain {member}!")
+    return response
 
 
 @router.delete('/{id}', status_code=204, response_class=Response)
 async def delete(repository: str, id: str) -> None:
     """ Deletes a Dataflow in the repository. """
-    rs.delete_dataflow(repository, id)
+    await run_in_threadpool(rs.delete_dataflow, repository, id)
     return Response(status_code=HTTP_204_NO_CONTENT)
@@ -0,0 +1,70 @@
+"""
+ Copyright (C) 2023 Università degli Studi di Camerino and Sigma S.p.A.
+ Authors: Alessandro Antinori, Rosario Capparuccia, Riccardo Coltrinari, Flavio Corradini, Marco Piangerelli, Barbara Re, Marco Scarpetta
+
+ This program is free software: you can redistribute it and/or modify
+ it under the terms of the GNU Affero General Public License as
+ published by the Free Software Foundation, either version 3 of the
+ License, or (at your option) any later version.
+
+ This program is distributed in the hope that it will be useful,
+ but WITHOUT ANY WARRANTY; without even the implied warranty of
+ MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+ GNU Affero General Public License for more details.
+
+ You should have received a copy of the GNU Affero General Public License
+ along with this program.  If not, see <https://www.gnu.org/licenses/>.
+ """
+
+from fastapi import APIRouter, Query
+from starlette.concurrency import run_in_threadpool
+from simple_backend.errors import BadRequestError
+from simple_backend.schemas.execution import ExecutionJobStatus, ExecutionLogPage
+from simple_backend.schemas.nodes import ConfigurationSchema
+from simple_backend.service.execution_service import scheduler
+
+
+router = APIRouter()
+
+
+@router.post('', response_model=ExecutionJobStatus)
+async def submit_execution(config: ConfigurationSchema, priority: int = 0):
+    """
+    Api used to submit the execution of a Dataflow. The output can be followed with the WebSocket
+    /ws/execution?job_id={id}
+    """
+    job = await scheduler.submit(config, priority)
+    return ExecutionJobStatus.parse_obj(await scheduler.get_record(job.id))
+
+
+@router.get('', response_model=list[ExecutionJobStatus])
+async def get_executions():
+    """ Gets the queued and running executions of all the workers and the recently finished ones. """
+    return [ExecutionJobStatus.parse_obj(record) for record in await scheduler.get_all()]
+
+
+@router.get('/{job_id}', responses={200: {"model": ExecutionJobStatus}, 404: {"schema": BadRequestError}})
+async def get_execution(job_id: str):
+    """ Gets the status of the specified execution. """
+    return ExecutionJobStatus.parse_obj(await scheduler.get_record(job_id))
+
+
+@router.get('/{job_id}/logs', responses={200: {"model": ExecutionLogPage}, 404: {"schema": BadRequestError}})
+async def get_execution_logs(job_id: str, offset: int = Query(0, ge=0), limit: int = Query(1000, ge=1, le=10000)):
+    """
+    Gets a page of the output of the specified execution, starting from the given line offset. The output of the
+    executions that aren't in the memory of the worker is read from their directory.
+    """
+    log = await scheduler.get_log(job_id)
+    lines = await run_in_threadpool(log.read, offset, limit)
+    return ExecutionLogPage(id=job_id, offset=offset, next_offset=offset + len(lines), line_count=log.line_count,
+                            lines=lines)
+
+
+@router.delete('/{job_id}', responses={200: {"model": ExecutionJobStatus}, 404: {"schema": BadRequestError}})
+async def cancel_execution(job_id: str):
+    """
+    Cancels the specified execution, removing it from the queue or killing its process. An execution submitted to
+    another worker is cancelled by it within config.EXECUTION_POLL_INTERVAL seconds.
+    """
+    return ExecutionJobStatus.parse_obj(await scheduler.cancel(job_id))
@@ -17,24 +17,23 @@
  """
 
 from typing import Union
-from fastapi import APIRouter
+from fastapi import APIRouter, Query, Request
 from simple_backend.errors import BadRequestError
 from simple_backend.schemas.nodes import NodeStructure, CustomNodeIOParams, CustomNodeSchema, UINode, \
-    CustomNodeStructure
+    CustomNodeStructure, NodeSearchResult, CustomNodeCacheStats
 from simple_backend.service import node_service
 from simple_backend.service.config_service import get_requirements
-from simple_backend.service.node_service import parse_custom_node_code
 
 
 router = APIRouter()
 
 
 @router.get('', response_model=list[NodeStructure])
-async def get_nodes():
+async def get_nodes(request: Request):
     """
     Api used to get all the available nodes
     """
-    return node_service.get_nodes_structure()
+    return node_service.get_nodes_response().get_response(request.headers)
 
 
 @router.post('', response_model=list[str])
@@ -53,17 +52,34 @@ async def check_custom_node(custom: CustomNodeSchema):
     """
     language = custom.language
     # TODO: use language variable to support and perform the correct analysis of other programming languages' code
-    parsed_code = parse_custom_node_code(custom.code, custom.function_name)
-    return node_service.find_custom_node_params(parsed_code, custom.function_name)
+    return node_service.get_custom_node_analysis(custom.code, custom.function_name).io_params
+
+
+@router.get('/custom/cache', response_model=CustomNodeCacheStats)
+async def get_custom_node_cache():
+    """
+    Api used to get the size and the hit rate of the cache of the analyzed custom nodes
+    """
+    return node_service.custom_node_cache.get_stats()
+
+
+@router.get('/search', response_model=NodeSearchResult)
+async def search_nodes(q: str = "", library: list[str] = Query(None), node_type: list[str] = Query(None, alias="type"),
+                       offset: int = Query(0, ge=0), limit: int = Query(20, ge=1, le=100)):
+    """
+    Api used to search the nodes by the words, or their prefixes, of clazz, description and parameter names, filtering
+    them by tags.library and tags.type
+    """
+    return node_service.search_nodes(q, library, node_type, offset, limit)
 
 
 @router.get('/{clazz}', responses={200: {"model": NodeStructure}, 404: {"schema": BadRequestError}})
-async def get_node(clazz):
+async def get_node(clazz, request: Request):
     """
     Api used to get a single node
     """
-    node = node_service.get_node(clazz)
-    if node:
-        return node
+    response = node_service.get_nodes_response(clazz)
+    if response:
+        return response.get_response(request.headers)
     else:
         raise BadRequestError(f"Node {clazz} not found")
@@ -16,11 +16,12 @@
  along with this program.  If not, see <https://www.gnu.org/licenses/>.
  """
 
-from fastapi import APIRouter, Response
+from fastapi import APIRouter, Query, Response
+from starlette.concurrency import run_in_threadpool
 from simple_backend import config
 from simple_backend.errors import BadRequestError
-from simple_backend.schemas.repository_schemas import RepositoryGet, RepositoryPost
-from simple_backend.service import repository_service as rs
+from simple_backend.schemas.repository_schemas import RepositoryGet, RepositoryPost, RepositoryPage
+from simple_backend.service import repository_index, repository_service as rs
 
 
 router = APIRouter()
@@ -29,20 +30,33 @@ router = APIRouter()
 @router.get('', response_model=list[str])
 async def get_repositories():
     """ Gets all the repositories within the output directory. """
-    return rs.get_repositories_names()
+    return await run_in_threadpool(rs.get_repositories_names)
 
 
 @router.get('/archived', response_model=list[str])
 async def get_archived_repositories():
     """ Gets all the archived repositories within the output directory. """
-    return rs.get_archived_repositories_names()
+    return await run_in_threadpool(rs.get_archived_repositories_names)
+
+
+@router.get('/summary', response_model=RepositoryPage)
+async def get_repositories_summary(archived: bool = False, name: str = None, sort: str = "name",
+                                   order: str = Query("asc", regex="^(asc|desc)$"), offset: int = Query(0, ge=0),
+                                   limit: int = Query(50, ge=1, le=1000)):
+    """
+    Gets a page of the repositories whose name contains the given one, with the number and the size of their
+    Dataflows, sorted by name, created, modified, size or dataflows.
+    """
+    total, repositories = await run_in_threadpool(repository_index.list_repositories, archived, name, sort, order,
+                                                  offset, limit)
+    return RepositoryPage(total=total, offset=offset, limit=limit, repositories=repositories)
 
 
 @router.get('/{repository}', responses={200: {"model": RepositoryGet}, 404: {"schema": BadRequestError}})
 async def get_repository(repository: str):
     """ Gets the content of the repository. """
     try:
-        content = rs.get_repository_content(repository)
+        content = await run_in_threadpool(rs.get_repository_content, repository)
     except FileNotFoundError as e:
         raise BadRequestError(e.__str__())
 
@@ -53,7 +67,7 @@ async def get_repository(repository: str):
 async def create_repository(repository: str):
     """ Creates a new repository within the output directory. """
     try:
-        rs.create_repository(repository)
+        await run_in_threadpool(rs.create_repository, repository)
     except FileExistsError:
         raise BadRequestError(f"Repository '{repository}' already exists in {str(config.BASE_OUTPUT_DIR)}")
 
@@ -64,7 +78,7 @@ async def create_repository(repository: str):
 @router.delete('/{repository}', status_code=204, response_class=Response)
 async def delete_repository(repository: str, shallow: bool):
     """ Delete a repository from the output directory. """
-    rs.delete_repository(repository, False, shallow)
+    await run_in_threadpool(rs.delete_repository, repository, False, shallow)
 
     return Response(content=None, status_code=204)
 
@@ -72,7 +86,7 @@ async def delete_repository(repository: str, shallow: bool):
 @router.delete('/archived/{repository}', status_code=204, response_class=Response)
 async def delete_archived_repository(repository: str):
     """ Delete an archived repository from the output directory. """
-    rs.delete_repository(repository, True, False)
+    await run_in_threadpool(rs.delete_repository, repository, True, False)
 
     return Response(content=None, status_code=204)
 
@@ -81,7 +95,7 @@ async def delete_archived_repository(repository: str):
 async def unarchive_repository(repository: str):
     """ Unarchive an archived repository. """
     try:
-        rs.unarchive_repository(repository)
+        await run_in_threadpool(rs.unarchive_repository, repository)
     except FileExistsError:
         raise BadRequestError(f"Repository '{repository}' already exists in {str(config.BASE_OUTPUT_DIR)}")
 
@@ -17,7 +17,8 @@
  """
 
 from fastapi import APIRouter
-from simple_backend.controller import node_api, config_api, script_api, repository_api, dataflow_api
+from simple_backend.controller import node_api, config_api, script_api, repository_api, dataflow_api, \
+    venv_api, execution_api, wheelhouse_api
 from simple_backend.ws import execution_ws
 
 
@@ -42,6 +43,15 @@ def initialize_api_routes():
     # Dataflow API
     router.include_router(dataflow_api.router, prefix="/repositories/{repository}/dataflows", tags=['dataflow'])
 
+    # Execution API
+    router.include_router(execution_api.router, prefix='/executions', tags=['execution'])
+
+    # Virtual environments cache API
+    router.include_router(venv_api.router, prefix='/venvs', tags=['venv'])
+
+    # Wheelhouse API
+    router.include_router(wheelhouse_api.router, prefix='/wheelhouse', tags=['wheelhouse'])
+
     return router
 
 
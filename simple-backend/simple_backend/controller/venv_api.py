@@ -0,0 +1,46 @@
+"""
+ Copyright (C) 2023 Università degli Studi di Camerino and Sigma S.p.A.
+ Authors: Alessandro Antinori, Rosario Capparuccia, Riccardo Coltrinari, Flavio Corradini, Marco Piangerelli, Barbara Re, Marco Scarpetta
+
+ This program is free software: you can redistribute it and/or modify
+ it under the terms of the GNU Affero General Public License as
+ published by the Free Software Foundation, either version 3 of the
+ License, or (at your option) any later version.
+
+ This program is distributed in the hope that it will be useful,
+ but WITHOUT ANY WARRANTY; without even the implied warranty of
+ MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+ GNU Affero General Public License for more details.
+
+ You should have received a copy of the GNU Affero General Public License
+ along with this program.  If not, see <https://www.gnu.org/licenses/>.
+ """
+
+from fastapi import APIRouter, Response
+from simple_backend.errors import BadRequestError, VenvInUseError
+from simple_backend.schemas.venv import VenvCacheEntry
+from simple_backend.service import venv_service
+
+
+router = APIRouter()
+
+
+@router.get('', response_model=list[VenvCacheEntry])
+async def get_venvs():
+    """ Gets the cached virtual environments used for the executions, the most recently used first. """
+    return venv_service.list_entries()
+
+
+@router.delete('', status_code=204, response_class=Response)
+async def purge_venvs():
+    """ Deletes all the cached virtual environments that are not in use. """
+    venv_service.purge()
+    return Response(status_code=204)
+
+
+@router.delete('/{key}', status_code=204, response_class=Response,
+               responses={404: {"schema": BadRequestError}, 409: {"schema": VenvInUseError}})
+async def purge_venv(key: str):
+    """ Deletes the specified cached virtual environment. """
+    venv_service.purge(key)
+    return Response(status_code=204)
@@ -0,0 +1,46 @@
+"""
+ Copyright (C) 2023 Università degli Studi di Camerino and Sigma S.p.A.
+ Authors: Alessandro Antinori, Rosario Capparuccia, Riccardo Coltrinari, Flavio Corradini, Marco Piangerelli, Barbara Re, Marco Scarpetta
+
+ This program is free software: you can redistribute it and/or modify
+ it under the terms of the GNU Affero General Public License as
+ published by the Free Software Foundation, either version 3 of the
+ License, or (at your option) any later version.
+
+ This program is distributed in the hope that it will be useful,
+ but WITHOUT ANY WARRANTY; without even the implied warranty of
+ MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+ GNU Affero General Public License for more details.
+
+ You should have received a copy of the GNU Affero General Public License
+ along with this program.  If not, see <https://www.gnu.org/licenses/>.
+ """
+
+from fastapi import APIRouter, Body
+from starlette.concurrency import run_in_threadpool
+from simple_backend import config
+from simple_backend.errors import BadRequestError, VenvCreationError
+from simple_backend.schemas.wheelhouse import WheelhouseStatus, WheelhouseWarmResult
+from simple_backend.service import wheelhouse_service
+
+
+router = APIRouter()
+
+
+@router.get('', response_model=WheelhouseStatus)
+async def get_wheelhouse():
+    """ Gets the wheels available to install the requirements offline and the hit/miss statistics. """
+    stats = wheelhouse_service.get_stats()
+    return WheelhouseStatus(path=str(config.WHEELHOUSE_DIR), hits=stats["hits"], misses=stats["misses"],
+                            wheels=wheelhouse_service.get_wheels())
+
+
+@router.post('/warm', responses={200: {"model": WheelhouseWarmResult}, 404: {"schema": BadRequestError},
+                                 500: {"schema": VenvCreationError}})
+async def warm_wheelhouse(repositories: list[str] = Body(None)):
+    """
+    Builds the wheels of the requirements of the Dataflows in the given repositories, by default all of them.
+    """
+    requirements = await run_in_threadpool(wheelhouse_service.get_repositories_requirements, repositories)
+    added = await run_in_threadpool(wheelhouse_service.warm, requirements)
+    return WheelhouseWarmResult(requirements=requirements, added=added)
@@ -67,6 +67,16 @@ class HttpQueryError(RainfallHTTPException):
         super(HttpQueryError, self).__init__(msg, 400)
 
 
+class VenvCreationError(RainfallHTTPException):
+    def __init__(self, msg):
+        super(VenvCreationError, self).__init__(msg, 500)
+
+
+class VenvInUseError(RainfallHTTPException):
+    def __init__(self, msg):
+        super(VenvInUseError, self).__init__(msg, 409)
+
+
 def register_errors(app):
     builtin_exceptions = []
 
@@ -0,0 +1,37 @@
+"""
+ Copyright (C) 2023 Università degli Studi di Camerino and Sigma S.p.A.
+ Authors: Alessandro Antinori, Rosario Capparuccia, Riccardo Coltrinari, Flavio Corradini, Marco Piangerelli, Barbara Re, Marco Scarpetta
+
+ This program is free software: you can redistribute it and/or modify
+ it under the terms of the GNU Affero General Public License as
+ published by the Free Software Foundation, either version 3 of the
+ License, or (at your option) any later version.
+
+ This program is distributed in the hope that it will be useful,
+ but WITHOUT ANY WARRANTY; without even the implied warranty of
+ MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+ GNU Affero General Public License for more details.
+
+ You should have received a copy of the GNU Affero General Public License
+ along with this program.  If not, see <https://www.gnu.org/licenses/>.
+ """
+
+# Wrapper executed by the Python interpreter of a virtual environment to run a script with resource limits: it applies
+# the limits to itself and then replaces itself with the interpreter running the script, which keeps them.
+# The backend can't apply them between the fork and the exec of the execution process, since it has threads.
+# Only the standard library can be used, since the backend is not installed in the virtual environment.
+
+import argparse
+import json
+import os
+import sys
+from zygote import apply_limits
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Runs a script with resource limits")
+    parser.add_argument("limits", help="the limits as JSON, see simple_backend.service.resource_monitor.get_limits")
+    parser.add_argument("script", help="path of the script to run")
+    args = parser.parse_args()
+    apply_limits(json.loads(args.limits))
+    os.execv(sys.executable, [sys.executable, args.script])
@@ -0,0 +1,219 @@
+"""
+ Copyright (C) 2023 Università degli Studi di Camerino and Sigma S.p.A.
+ Authors: Alessandro Antinori, Rosario Capparuccia, Riccardo Coltrinari, Flavio Corradini, Marco Piangerelli, Barbara Re, Marco Scarpetta
+
+ This program is free software: you can redistribute it and/or modify
+ it under the terms of the GNU Affero General Public License as
+ published by the Free Software Foundation, either version 3 of the
+ License, or (at your option) any later version.
+
+ This program is distributed in the hope that it will be useful,
+ but WITHOUT ANY WARRANTY; without even the implied warranty of
+ MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+ GNU Affero General Public License for more details.
+
+ You should have received a copy of the GNU Affero General Public License
+ along with this program.  If not, see <https://www.gnu.org/licenses/>.
+ """
+
+# Warm runner executed by the Python interpreter of a virtual environment. It imports the common modules once and then
+# forks a child for each script to run, so that the executions don't pay the interpreter startup and the imports.
+#
+# The runner listens on a Unix socket: each connection sends a JSON line {"script": ..., "cwd": ...} and receives the
+# output of the script, preceded by a marker line with the pid of the child and followed by one with its resource usage
+# and one with its exit code. The optional "limits" of the request are applied to the child.
+# Only the standard library can be used, since the backend is not installed in the virtual environment.
+
+import argparse
+import importlib
+import json
+import os
+import runpy
+import select
+import signal
+import socket
+import sys
+import time
+import traceback
+
+MARKER = b"\x00rainfall-zygote:"
+
+
+def preload(modules):
+    for module in modules:
+        try:
+            importlib.import_module(module)
+        except Exception:
+            pass
+
+
+def get_max_rss_mb():
+    try:
+        import resource
+    except ImportError:
+        return 0
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return max_rss / (1024 * 1024) if sys.platform == "darwin" else max_rss / 1024
+
+
+def apply_limits(limits):
+    """
+    Applies the limits of simple_backend.service.resource_monitor.get_limits to the current process.
+    Once the CPU time is exceeded the process receives SIGXCPU, and SIGKILL one second later.
+    """
+    import resource
+    for name, limit, extra in (("memory", resource.RLIMIT_AS, 0), ("cpu", resource.RLIMIT_CPU, 1)):
+        if name in limits:
+            _, max_hard = resource.getrlimit(limit)
+            soft, hard = limits[name], limits[name] + extra
+            if max_hard != resource.RLIM_INFINITY:
+                soft, hard = min(soft, max_hard), min(hard, max_hard)
+            resource.setrlimit(limit, (soft, hard))
+
+
+def run_child(conn, request):
+    """
+    Runs the script in the forked child, with stdout and stderr redirected to the connection. Never returns.
+    """
+    os.setsid()
+    signal.set_wakeup_fd(-1)
+    signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+    os.dup2(conn.fileno(), 1)
+    os.dup2(conn.fileno(), 2)
+    conn.close()
+    sys.stdout = open(1, "w", buffering=1, closefd=False)
+    sys.stderr = open(2, "w", buffering=1, closefd=False)
+    os.write(1, MARKER + b"pid=%d\n" % os.getpid())
+
+    code = 0
+    try:
+        apply_limits(request.get("limits", {}))
+        os.chdir(request["cwd"])
+        sys.path.insert(0, request["cwd"])
+        sys.argv = [request["script"]]
+        runpy.run_path(request["script"], run_name="__main__")
+    except SystemExit as e:
+        if isinstance(e.code, int):
+            code = e.code
+        elif e.code is not None:
+            print(e.code, file=sys.stderr)
+            code = 1
+    except BaseException:
+        traceback.print_exc()
+        code = 1
+    finally:
+        sys.stdout.flush()
+        sys.stderr.flush()
+    os._exit(code)
+
+
+def read_request(conn):
+    data = b""
+    while not data.endswith(b"\n"):
+        chunk = conn.recv(4096)
+        if not chunk:
+            return None
+        data += chunk
+    return json.loads(data)
+
+
+def reap(children):
+    """
+    Sends the exit code of the terminated children to their connections
+    """
+    while children:
+        try:
+            pid, status, rusage = os.wait4(-1, os.WNOHANG)
+        except ChildProcessError:
+            return
+        if pid == 0:
+            return
+        conn = children.pop(pid, None)
+        if conn is not None:
+            usage = {"user_cpu": rusage.ru_utime, "system_cpu": rusage.ru_stime,
+                     "peak_rss": rusage.ru_maxrss * (1 if sys.platform == "darwin" else 1024),
+                     "read_bytes": rusage.ru_inblock * 512, "write_bytes": rusage.ru_oublock * 512}
+            try:
+                conn.sendall(MARKER + b"rusage=" + json.dumps(usage).encode() + b"\n")
+                conn.sendall(MARKER + b"exit=%d\n" % os.waitstatus_to_exitcode(status))
+            except OSError:
+                pass
+            conn.close()
+
+
+def close_server(server, socket_path):
+    server.close()
+    if os.path.exists(socket_path):
+        os.unlink(socket_path)
+
+
+def serve(socket_path, idle_timeout, max_memory):
+    if os.path.exists(socket_path):
+        os.unlink(socket_path)
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server.bind(socket_path)
+    server.listen()
+    # a terminated child wakes up the select through the pipe, so that its exit code is sent right away
+    wakeup_r, wakeup_w = os.pipe()
+    os.set_blocking(wakeup_r, False)
+    os.set_blocking(wakeup_w, False)
+    signal.set_wakeup_fd(wakeup_w)
+    signal.signal(signal.SIGCHLD, lambda signum, frame: None)
+    sys.stdout.flush()
+    os.write(1, MARKER + b"ready\n")
+    # the output of the runner isn't read after the readiness line, so it is discarded instead of filling the pipe
+    devnull = os.open(os.devnull, os.O_WRONLY)
+    os.dup2(devnull, 1)
+    os.close(devnull)
+
+    children = {}
+    last_activity = time.monotonic()
+    accepting = True
+    try:
+        while accepting or children:
+            reap(children)
+            if children:
+                last_activity = time.monotonic()
+            elif not accepting or time.monotonic() - last_activity > idle_timeout:
+                break
+            ready = select.select([wakeup_r] + ([server] if accepting else []), [], [], 1)[0]
+            if wakeup_r in ready:
+                while True:
+                    try:
+                        if not os.read(wakeup_r, 512):
+                            break
+                    except BlockingIOError:
+                        break
+            if server not in ready:
+                continue
+
+            conn, _ = server.accept()
+            request = read_request(conn)
+            if request is None:
+                conn.close()
+                continue
+            pid = os.fork()
+            if pid == 0:
+                server.close()
+                os.close(wakeup_r)
+                os.close(wakeup_w)
+                run_child(conn, request)
+            children[pid] = conn
+            last_activity = time.monotonic()
+            # the children share the memory of the runner: once it grows too much, a fresh runner takes its place
+            accepting = not max_memory or get_max_rss_mb() < max_memory
+            if not accepting:
+                close_server(server, socket_path)
+    finally:
+        close_server(server, socket_path)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Warm runner of the Dataflow scripts")
+    parser.add_argument("socket", help="path of the Unix socket to listen on")
+    parser.add_argument("--preload", default="", help="comma-separated modules to import at startup")
+    parser.add_argument("--idle-timeout", type=float, default=600, help="seconds without executions before exiting")
+    parser.add_argument("--max-memory", type=float, default=0, help="MB of memory after which no script is accepted")
+    args = parser.parse_args()
+    preload([m.strip() for m in args.preload.split(",") if m.strip()])
+    serve(args.socket, args.idle_timeout, args.max_memory)
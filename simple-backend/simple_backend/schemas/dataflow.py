@@ -26,3 +26,18 @@ class DataFlow(BaseModel):
     metadata: str = None
     requirements: str = None
     ui: str = None
+
+
+class DataFlowSummary(BaseModel):
+    id: str
+    size: int
+    created: float
+    modified: float
+    nodes: int = None
+
+
+class DataFlowPage(BaseModel):
+    total: int
+    offset: int
+    limit: int
+    dataflows: list[DataFlowSummary]
@@ -0,0 +1,72 @@
+"""
+ Copyright (C) 2023 Università degli Studi di Camerino and Sigma S.p.A.
+ Authors: Alessandro Antinori, Rosario Capparuccia, Riccardo Coltrinari, Flavio Corradini, Marco Piangerelli, Barbara Re, Marco Scarpetta
+
+ This program is free software: you can redistribute it and/or modify
+ it under the terms of the GNU Affero General Public License as
+ published by the Free Software Foundation, either version 3 of the
+ License, or (at your option) any later version.
+
+ This program is distributed in the hope that it will be useful,
+ but WITHOUT ANY WARRANTY; without even the implied warranty of
+ MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+ GNU Affero General Public License for more details.
+
+ You should have received a copy of the GNU Affero General Public License
+ along with this program.  If not, see <https://www.gnu.org/licenses/>.
+ """
+
+from pydantic import BaseModel
+
+
+class ExecutionMetrics(BaseModel):
+    stages: dict[str, float] = {}
+    user_cpu: float = 0
+    system_cpu: float = 0
+    peak_rss: int = 0
+    read_bytes: int = 0
+    write_bytes: int = 0
+    processes: int = 0
+
+
+class NodeProfile(BaseModel):
+    node_id: str
+    started_at: float = None
+    finished_at: float = None
+    duration: float = None
+    rss: int = None
+    peak_rss: int = None
+    failed: bool = None
+
+
+class ExecutionMetricsMessage(BaseModel):
+    type: str = "metrics"
+    id: str
+    final: bool
+    metrics: ExecutionMetrics
+    profile: dict[str, NodeProfile] = {}
+    checkpoints: dict[str, bool] = {}
+
+
+class ExecutionJobStatus(BaseModel):
+    id: str
+    status: str
+    priority: int
+    position: int = None
+    submitted_at: float
+    started_at: float = None
+    finished_at: float = None
+    elapsed: float = None
+    return_code: int = None
+    error: str = None
+    metrics: ExecutionMetrics = None
+    profile: dict[str, NodeProfile] = None
+    checkpoints: dict[str, bool] = None
+
+
+class ExecutionLogPage(BaseModel):
+    id: str
+    offset: int
+    next_offset: int
+    line_count: int
+    lines: list[str]
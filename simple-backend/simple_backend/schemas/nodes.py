@@ -120,6 +120,23 @@ class NodeStructure(BaseModel):
     tags: NodeTags
 
 
+class NodeSearchResult(BaseModel):
+    total: int
+    offset: int
+    limit: int
+    nodes: list[NodeStructure]
+    # number of matching nodes by tags.library and by tags.type
+    facets: dict[str, dict[str, int]]
+
+
+class CustomNodeCacheStats(BaseModel):
+    size: int
+    max_size: int
+    hits: int
+    misses: int
+    hit_rate: float
+
+
 class CustomNodeStructure(NodeStructure):
     function_name: str
     code: str
@@ -150,3 +167,11 @@ class ConfigurationSchema(BaseModel):
     repository: str = None
     # path is used only for execution
     path: str = None
+    # warm is used only for execution: runs the script in a warm runner with the common modules already imported
+    warm: bool = False
+    # profile is used only for execution: collects the duration and the memory of each node
+    profile: bool = False
+    # checkpoint is used only for execution: loads the outputs of the unchanged nodes saved by the previous executions
+    checkpoint: bool = False
+    # workers is used only for execution: if greater than 0, the independent nodes run concurrently in as many processes
+    workers: int = 0
@@ -29,3 +29,19 @@ class RepositoryPost(BaseModel):
     repository: str
     path: str
     uri: str
+
+
+class RepositorySummary(BaseModel):
+    name: str
+    archived: bool
+    created: float
+    modified: float
+    dataflows: int
+    size: int
+
+
+class RepositoryPage(BaseModel):
+    total: int
+    offset: int
+    limit: int
+    repositories: list[RepositorySummary]
@@ -0,0 +1,112 @@
+"""
+ Copyright (C) 2023 Università degli Studi di Camerino and Sigma S.p.A.
+ Authors: Alessandro Antinori, Rosario Capparuccia, Riccardo Coltrinari, Flavio Corradini, Marco Piangerelli, Barbara Re, Marco Scarpetta
+
+ This program is free software: you can redistribute it and/or modify
+ it under the terms of the GNU Affero General Public License as
+ published by the Free Software Foundation, either version 3 of the
+ License, or (at your option) any later version.
+
+ This program is distributed in the hope that it will be useful,
+ but WITHOUT ANY WARRANTY; without even the implied warranty of
+ MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+ GNU Affero General Public License for more details.
+
+ You should have received a copy of the GNU Affero General Public License
+ along with this program.  If not, see <https://www.gnu.org/licenses/>.
+ """
+
+import gzip
+import hashlib
+from dataclasses import dataclass
+from typing import Optional
+from starlette.datastructures import Headers
+from starlette.responses import Response
+from simple_backend import config
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+@dataclass(frozen=True)
+class Representation:
+    body: bytes
+    etag: str
+    encoding: Optional[str] = None
+
+
+class CachedResponse:
+    """
+    A JSON body encoded once, together with its compressed variants, each with a strong ETag.
+    The variants are chosen according to Accept-Encoding and a matching If-None-Match is answered with 304.
+    """
+
+    def __init__(self, body: bytes):
+        digest = hashlib.sha256(body).hexdigest()
+        self._representations = {None: Representation(body, f'"{digest}"')}
+        if len(body) >= config.NODES_MIN_COMPRESSED_SIZE:
+            self._representations["gzip"] = Representation(gzip.compress(body, 9, mtime=0), f'"{digest}-gzip"', "gzip")
+            if brotli is not None:
+                self._representations["br"] = Representation(brotli.compress(body), f'"{digest}-br"', "br")
+
+    def select(self, accept_encoding: str) -> Representation:
+        """
+        Returns the smallest representation accepted by the client
+        """
+        accepted = get_accepted_encodings(accept_encoding)
+        for encoding in ("br", "gzip"):
+            if encoding in self._representations and is_accepted(accepted, encoding):
+                return self._representations[encoding]
+        return self._representations[None]
+
+    def get_response(self, headers: Headers) -> Response:
+        representation = self.select(headers.get("accept-encoding", ""))
+        response_headers = {
+            "ETag": representation.etag,
+            "Cache-Control": f"public, max-age={config.NODES_MAX_AGE}, must-revalidate",
+            "Vary": "Accept-Encoding",
+        }
+        if etag_matches(headers.get("if-none-match"), representation.etag):
+            return Response(status_code=304, headers=response_headers)
+        if representation.encoding:
+            response_headers["Content-Encoding"] = representation.encoding
+        return Response(content=representation.body, media_type="application/json", headers=response_headers)
+
+
+def get_accepted_encodings(accept_encoding: str) -> dict:
+    """
+    Returns the quality of each coding listed in Accept-Encoding, "*" included
+    """
+    accepted = {}
+    for item in accept_encoding.split(","):
+        coding, *params = item.split(";")
+        quality = 1.0
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0
+        accepted[coding.strip().lower()] = quality
+    return accepted
+
+
+def is_accepted(accepted: dict, coding: str) -> bool:
+    """
+    Checks if the coding is accepted, either listed with a quality above 0 or, if not listed, matched by "*"
+    """
+    return accepted.get(coding, accepted.get("*", 0)) > 0
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """
+    Checks If-None-Match against the ETag with the weak comparison required by RFC 9110
+    """
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return any(tag.strip().removeprefix("W/") == etag for tag in if_none_match.split(","))
@@ -0,0 +1,195 @@
+"""
+ Copyright (C) 2023 Università degli Studi di Camerino and Sigma S.p.A.
+ Authors: Alessandro Antinori, Rosario Capparuccia, Riccardo Coltrinari, Flavio Corradini, Marco Piangerelli, Barbara Re, Marco Scarpetta
+
+ This program is free software: you can redistribute it and/or modify
+ it under the terms of the GNU Affero General Public License as
+ published by the Free Software Foundation, either version 3 of the
+ License, or (at your option) any later version.
+
+ This program is distributed in the hope that it will be useful,
+ but WITHOUT ANY WARRANTY; without even the implied warranty of
+ MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+ GNU Affero General Public License for more details.
+
+ You should have received a copy of the GNU Affero General Public License
+ along with this program.  If not, see <https://www.gnu.org/licenses/>.
+ """
+
+import hashlib
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Optional, Tuple
+from urllib.parse import urlparse
+from urllib.request import url2pathname
+import requests
+from filelock import FileLock
+from simple_backend import config
+from simple_backend.errors import NodesRetrievalError
+from simple_backend.service.node_catalogue import NodeCatalogue
+
+
+STRUCTURE_FILE = "rain_structure.json"
+META_FILE = "rain_structure.meta.json"
+
+
+def _get_local_path(source: str) -> Optional[Path]:
+    """
+    Returns the path of the source if it is a local file, given as a path or as a file:// URL
+    """
+    url = urlparse(source)
+    if url.scheme == "file":
+        return Path(url2pathname(url.path))
+    if url.scheme in ("http", "https"):
+        return None
+    return Path(source)
+
+
+def _get_lock() -> FileLock:
+    config.CATALOGUE_DIR.mkdir(parents=True, exist_ok=True)
+    return FileLock(str(config.CATALOGUE_DIR / ".lock"))
+
+
+def read_meta() -> dict:
+    try:
+        with open(config.CATALOGUE_DIR / META_FILE) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _write_file(path: Path, data: bytes) -> None:
+    tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def load_cached() -> Optional[NodeCatalogue]:
+    """
+    Returns the catalogue saved in config.CATALOGUE_DIR, if any
+    """
+    meta = read_meta()
+    try:
+        with open(config.CATALOGUE_DIR / STRUCTURE_FILE, "rb") as f:
+            data = f.read()
+    except OSError:
+        return None
+    version = hashlib.sha256(data).hexdigest()
+    if meta.get("version") != version:
+        return None
+    return NodeCatalogue(json.loads(data), version)
+
+
+def fetch(meta: dict) -> Tuple[Optional[bytes], dict]:
+    """
+    Fetches the structure from config.RAIN_STRUCTURE_URL, returning None if it didn't change since the version
+    described by meta, together with the new meta.
+    Remote sources are requested with the ETag and the Last-Modified date of the saved version.
+    """
+    source = config.RAIN_STRUCTURE_URL
+    new_meta = {"source": source, "checked_at": time.time()}
+    local_path = _get_local_path(source)
+    if local_path is not None:
+        data = local_path.read_bytes()
+    else:
+        headers = {}
+        if meta.get("source") == source:
+            if meta.get("etag"):
+                headers["If-None-Match"] = meta["etag"]
+            if meta.get("last_modified"):
+                headers["If-Modified-Since"] = meta["last_modified"]
+        response = requests.get(source, headers=headers, timeout=config.CATALOGUE_REQUEST_TIMEOUT)
+        if response.status_code == 304:
+            return None, {**meta, **new_meta}
+        if response.status_code != 200:
+            raise NodesRetrievalError(f"Nodes request failed: {response.reason}")
+        data = response.content
+        new_meta.update(etag=response.headers.get("ETag"), last_modified=response.headers.get("Last-Modified"))
+
+    new_meta["version"] = hashlib.sha256(data).hexdigest()
+    if meta.get("version") == new_meta["version"] and meta.get("source") == source:
+        return None, {**meta, **new_meta}
+    return data, new_meta
+
+
+def refresh(current_version: Optional[str] = None) -> Optional[NodeCatalogue]:
+    """
+    Fetches the structure and saves it in config.CATALOGUE_DIR, returning the saved catalogue if its version differs
+    from the current one. The workers share the saved structure, so the source is fetched again only after
+    config.CATALOGUE_REFRESH_INTERVAL seconds, while a version saved by another worker in the meanwhile is returned.
+    """
+    with _get_lock():
+        meta = read_meta()
+        if time.time() - meta.get("checked_at", 0) >= config.CATALOGUE_REFRESH_INTERVAL or \
+                meta.get("source") != config.RAIN_STRUCTURE_URL:
+            data, meta = fetch(meta)
+            if data is not None:
+                json.loads(data)
+                _write_file(config.CATALOGUE_DIR / STRUCTURE_FILE, data)
+            _write_file(config.CATALOGUE_DIR / META_FILE, json.dumps(meta).encode())
+    if meta.get("version") == current_version:
+        return None
+    return load_cached()
+
+
+def _load_saved() -> Optional[NodeCatalogue]:
+    if read_meta().get("source") != config.RAIN_STRUCTURE_URL:
+        return None
+    return load_cached()
+
+
+def load() -> NodeCatalogue:
+    """
+    Returns the saved catalogue if its source is config.RAIN_STRUCTURE_URL, fetching it only when missing. The workers
+    start together, so the saved catalogue is checked again once the lock is held and only the first one fetches it.
+    """
+    if (catalogue := _load_saved()) is not None:
+        return catalogue
+    with _get_lock():
+        if (catalogue := _load_saved()) is not None:
+            return catalogue
+        data, meta = fetch({})
+        _write_file(config.CATALOGUE_DIR / STRUCTURE_FILE, data)
+        _write_file(config.CATALOGUE_DIR / META_FILE, json.dumps(meta).encode())
+    return NodeCatalogue(json.loads(data), meta["version"])
+
+
+class CatalogueRefresher:
+    """
+    Refreshes the catalogue in the background every config.CATALOGUE_REFRESH_INTERVAL seconds, passing the new
+    versions to the callback
+    """
+
+    def __init__(self):
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    def start(self, version: str, callback: Callable[[NodeCatalogue], None]) -> None:
+        """
+        Starts refreshing the catalogue with the given version
+        """
+        if self._thread is None and config.CATALOGUE_REFRESH_INTERVAL > 0:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, args=(version, callback), name="catalogue", daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread = None
+
+    def _run(self, version: str, callback: Callable[[NodeCatalogue], None]) -> None:
+        while not self._stop.is_set():
+            try:
+                if (catalogue := refresh(version)) is not None:
+                    version = catalogue.version
+                    callback(catalogue)
+            except Exception as e:
+                print(f'Refresh of rain_structure.json failed: {e}')
+            self._stop.wait(config.CATALOGUE_REFRESH_INTERVAL)
+
+
+manager = CatalogueRefresher()
@@ -0,0 +1,115 @@
+"""
+ Copyright (C) 2023 Università degli Studi di Camerino and Sigma S.p.A.
+ Authors: Alessandro Antinori, Rosario Capparuccia, Riccardo Coltrinari, Flavio Corradini, Marco Piangerelli, Barbara Re, Marco Scarpetta
+
+ This program is free software: you can redistribute it and/or modify
+ it under the terms of the GNU Affero General Public License as
+ published by the Free Software Foundation, either version 3 of the
+ License, or (at your option) any later version.
+
+ This program is distributed in the hope that it will be useful,
+ but WITHOUT ANY WARRANTY; without even the implied warranty of
+ MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+ GNU Affero General Public License for more details.
+
+ You should have received a copy of the GNU Affero General Public License
+ along with this program.  If not, see <https://www.gnu.org/licenses/>.
+ """
+
+import hashlib
+import json
+import os
+from collections import defaultdict
+from typing import Dict, List
+from filelock import FileLock
+from simple_backend import config
+from simple_backend.schemas.nodes import Node
+from simple_backend.service.dag_generator import Edge
+
+
+CHECKPOINT_SUFFIX = ".pkl"
+
+
+def get_checkpoint_keys(ordered_nodes: List[Node], edges: List[Edge]) -> Dict[str, str]:
+    """
+    Returns the checkpoint key of each node, derived from its class, parameters and custom code, from the outputs
+    used by the edges, which are the only ones saved, and from the keys of the upstream nodes, so that changing a node
+    invalidates the checkpoints of the nodes depending on it.
+    The nodes without outputs used by the edges, e.g. the writers, get no key: they are executed every time for their
+    side effects, since their checkpoint would save nothing.
+    The nodes must be in topological order, as returned by DagCreator.
+    """
+    incoming = defaultdict(list)
+    outputs = defaultdict(set)
+    for edge in edges:
+        incoming[edge.destination].append(edge)
+        outputs[edge.source].add(edge.source_var)
+
+    keys = {}
+    for node in ordered_nodes:
+        upstream = sorted((e.destination_var, e.source_var, keys[e.source]) for e in incoming[node.node_id])
+        description = {"node": node.node, "parameters": node.parameters,
+                       "function": getattr(node, "function_name", None), "code": getattr(node, "code", None),
+                       "outputs": sorted(outputs[node.node_id]), "upstream": upstream}
+        keys[node.node_id] = hashlib.sha256(json.dumps(description, sort_keys=True, default=str).encode()).hexdigest()
+    return {node_id: key for node_id, key in keys.items() if outputs[node_id]}
+
+
+def _get_lock() -> FileLock:
+    config.CHECKPOINT_DIR.mkdir(parents=True, exist_ok=True)
+    return FileLock(str(config.CHECKPOINT_DIR / ".lock"))
+
+
+def list_checkpoints() -> List[dict]:
+    """
+    Returns the checkpoints from the most to the least recently used
+    """
+    checkpoints = []
+    if not config.CHECKPOINT_DIR.is_dir():
+        return checkpoints
+    for entry in os.scandir(config.CHECKPOINT_DIR):
+        if entry.name.endswith(CHECKPOINT_SUFFIX):
+            try:
+                stat = entry.stat()
+            except OSError:
+                continue
+            checkpoints.append({"key": entry.name[:-len(CHECKPOINT_SUFFIX)], "size": stat.st_size,
+                                "last_used": stat.st_mtime})
+    return sorted(checkpoints, key=lambda c: c["last_used"], reverse=True)
+
+
+def _remove(key: str) -> None:
+    try:
+        os.remove(config.CHECKPOINT_DIR / f"{key}{CHECKPOINT_SUFFIX}")
+    except OSError:
+        pass
+
+
+def evict() -> List[str]:
+    """
+    Removes the least recently used checkpoints until config.CHECKPOINT_MAX_ENTRIES and config.CHECKPOINT_MAX_SIZE_MB
+    are respected. A script loading a removed checkpoint executes the node again.
+    """
+    evicted = []
+    with _get_lock():
+        checkpoints = list_checkpoints()
+        max_size = config.CHECKPOINT_MAX_SIZE_MB * 1024 * 1024
+        total_size = sum(c["size"] for c in checkpoints)
+        for checkpoint in reversed(checkpoints):
+            if len(checkpoints) - len(evicted) <= config.CHECKPOINT_MAX_ENTRIES and total_size <= max_size:
+                break
+            _remove(checkpoint["key"])
+            evicted.append(checkpoint["key"])
+            total_size -= checkpoint["size"]
+    return evicted
+
+
+def purge() -> List[str]:
+    """
+    Removes all the checkpoints
+    """
+    with _get_lock():
+        checkpoints = [c["key"] for c in list_checkpoints()]
+        for key in checkpoints:
+            _remove(key)
+    return checkpoints
@@ -18,35 +18,48 @@
 
 import time
 import io
+import json
+import os
+import secrets
+import tempfile
+import threading
 import zipfile
 import yaml
 from datetime import datetime
 from pathlib import Path
-from typing import Union
+from typing import Iterable, Iterator, Union
+from pydantic.json import pydantic_encoder
 from simple_backend.errors import DagCycleError, FileWriteError
 from simple_backend.schemas.nodes import UI, CustomNode, Node, UINode, CustomNodeStructure, NodeStructure
-from simple_backend.service import node_service
+from simple_backend.service import checkpoint_service, node_service, repository_index, repository_service
 from simple_backend.service.dag_generator import DagCreator
-from simple_backend.service.node_service import parse_custom_node_requirements, get_nodes_requirements
+from simple_backend.service.node_service import get_custom_node_analysis
 from simple_backend.service.script_generator import ScriptGenerator
 from simple_backend import config
 
 
+RANDOM_BITS = 64
+_id_lock = threading.Lock()
+_last_id = (0, 0)
+
+
 def check_dag(nodes):
     """
     Method that creates and checks the dag of nodes
     """
     dag = DagCreator()
     dag.create_dag(nodes)
-    if dag.has_cycles():
-        raise DagCycleError("The Dataflow contains cycles!", 400)
+    if cycle := dag.get_cycle():
+        raise DagCycleError(f"The Dataflow contains cycles: {' -> '.join(cycle)}", 400)
 
     return dag
 
 
-def generate_script(nodes: list[Union[CustomNode, Node]]):
+def generate_script(nodes: list[Union[CustomNode, Node]], profile: bool = False, checkpoint: bool = False,
+                    workers: int = 0):
     """
-    Method that generates the final python script
+    Method that generates the final python script, optionally printing the per-node profiling events,
+    checkpointing the outputs of the nodes and executing the independent nodes in a pool of workers processes
     """
     dag = check_dag(nodes)
 
@@ -56,7 +69,9 @@ def generate_script(nodes: list[Union[CustomNode, Node]]):
     if custom_nodes := list(filter(lambda node: isinstance(node, CustomNode), ordered_nodes)):
         node_service.check_custom_node_code(custom_nodes)
 
-    script_generator = ScriptGenerator(ordered_nodes, ordered_edges)
+    checkpoints = checkpoint_service.get_checkpoint_keys(ordered_nodes, ordered_edges) if checkpoint else None
+    script_generator = ScriptGenerator(ordered_nodes, ordered_edges, profile, checkpoints, config.CHECKPOINT_DIR,
+                                       workers, dag.get_levels() if workers else None)
     script = script_generator.generate_script()
 
     return script
@@ -67,22 +82,23 @@ def get_requirements(ui_nodes: list[UINode],
     """
     Method that returns the Python dependencies, useful to re-create the environment of a given Dataflow
     """
-    requirements = ["git+https://github.com/SIMPLE-DVS/rain@master#egg=rain"]
-
-    all_modules_requirements = get_nodes_requirements()
+    requirements = [config.RAIN_REQUIREMENT]
+    added = set(requirements)
 
+    libraries = {}
     for node in ui_nodes:
         if not node.package.startswith('rain.nodes.custom.custom.CustomNode'):
-            library = ui_structures.get(node.package).tags.library.lower()
-            if library in all_modules_requirements:
-                node_requirements = all_modules_requirements.get(library)
-                for node_requirement in node_requirements:
-                    if not node_requirement in requirements:
-                        requirements.append(node_requirement)
+            libraries.setdefault(ui_structures.get(node.package).tags.library, None)
+    for library in libraries:
+        for node_requirement in node_service.catalogue.get_library_dependencies(library):
+            if node_requirement not in added:
+                added.add(node_requirement)
+                requirements.append(node_requirement)
 
     for node in ui_nodes:
         if node.package.startswith('rain.nodes.custom.custom.CustomNode'):
-            custom_requirements = parse_custom_node_requirements(ui_structures[node.package].code)
+            structure = ui_structures[node.package]
+            custom_requirements = get_custom_node_analysis(structure.code, structure.function_name).requirements
             for custom_requirement in custom_requirements:
                 if not any(r for r in requirements if r.startswith(custom_requirement)):
                     requirements.append(custom_requirement)
@@ -96,29 +112,98 @@ def get_repository_path(repository: str) -> Path:
     return repository_path
 
 
+def new_dataflow_id() -> tuple[int, str]:
+    """
+    Returns the time in milliseconds and the id of a new Dataflow, made of the time and of random bits so that the
+    ids generated by different workers don't collide. The ids generated by a worker are always increasing
+    """
+    global _last_id
+    with _id_lock:
+        timestamp = int(time.time() * 1000)
+        last_timestamp, last_random = _last_id
+        if timestamp > last_timestamp:
+            _last_id = (timestamp, secrets.randbits(RANDOM_BITS))
+        elif last_random + 1 < 2 ** RANDOM_BITS:
+            _last_id = (last_timestamp, last_random + 1)
+        else:
+            _last_id = (last_timestamp + 1, secrets.randbits(RANDOM_BITS))
+        timestamp, bits = _last_id
+    return timestamp, f"dataflow{timestamp:013d}-{bits:0{RANDOM_BITS // 4}x}"
+
+
 def generate_artifacts(repository: str, script: str, ui: UI) -> Path:
     """
-    Method that stores the artifacts (script, requirements, GUI configuration, other metadata)
+    Method that stores the artifacts (script, requirements, GUI configuration, other metadata).
+    The zip is written to a temporary file in the repository, which is renamed once it is complete and synced,
+    so that a failure never leaves a partial zip in the repository. The repository is locked meanwhile
     """
-    timestamp = int(time.time() * 1000)
     requirements = get_requirements(ui.nodes.values(), ui.structures)
-    zip_buffer = io.BytesIO()
-    try:
-        with zipfile.ZipFile(zip_buffer, "a", zipfile.ZIP_DEFLATED, False) as zip_file:
-            zip_file.writestr("script.py", script)
-            zip_file.writestr("requirements.txt", "\n".join(requirements))
-            zip_file.writestr("metadata.yml", yaml.dump(
-                {"created_at": datetime.fromtimestamp(timestamp / 1000), "generated_by": "MarcoScarp94",
-                 "company": "Sigma Spa"}, default_flow_style=False))
-            zip_file.writestr("ui.json", ui.json())
-        zip_buffer.seek(0)
-
+    with repository_service.get_lock(repository):
         repo_path = get_repository_path(repository)
-        dataflow_path = repo_path / f"dataflow{timestamp}.zip"
+        timestamp, dataflow_id = new_dataflow_id()
+        while (repo_path / f"{dataflow_id}.zip").exists():
+            timestamp, dataflow_id = new_dataflow_id()
+        dataflow_path = repo_path / f"{dataflow_id}.zip"
+        temp_file = tempfile.NamedTemporaryFile(dir=repo_path, prefix=f".{dataflow_id}", suffix=".tmp", delete=False)
+        try:
+            with temp_file:
+                with zipfile.ZipFile(temp_file, "w", zipfile.ZIP_DEFLATED,
+                                     compresslevel=config.ARTIFACTS_COMPRESSION_LEVEL) as zip_file:
+                    _write_member(zip_file, "script.py", [script])
+                    _write_member(zip_file, "requirements.txt", ["\n".join(requirements)])
+                    _write_member(zip_file, "metadata.yml", [yaml.dump(
+                        {"created_at": datetime.fromtimestamp(timestamp / 1000), "generated_by": "MarcoScarp94",
+                         "company": "Sigma Spa"}, default_flow_style=False)])
+                    _write_member(zip_file, "ui.json", _encode_ui(ui))
+                temp_file.flush()
+                os.fsync(temp_file.fileno())
+            os.replace(temp_file.name, dataflow_path)
+            _sync_directory(repo_path)
+        except Exception as e:
+            Path(temp_file.name).unlink(missing_ok=True)
+            raise FileWriteError(f"Error during artifacts zip writing: {e.__str__()}")
+
+        repository_index.add_dataflow(repository, dataflow_path, len(ui.nodes))
+    return dataflow_path
 
-        with dataflow_path.open('wb') as zipObj:
-            zipObj.write(zip_buffer.getvalue())
-    except (OSError, Exception) as e:
-        raise FileWriteError(f"Error during artifacts zip writing: {e.__str__()}")
 
-    return dataflow_path
+def _write_member(zip_file: zipfile.ZipFile, name: str, chunks: Iterable[str]) -> None:
+    """
+    Compresses the chunks into a member of the zip, with the compression of the zip, while they are produced
+    """
+    with zip_file.open(name, "w") as member, io.TextIOWrapper(member, "utf-8") as writer:
+        for chunk in chunks:
+            writer.write(chunk)
+
+
+def _encode_ui(ui: UI) -> Iterator[str]:
+    """
+    Encodes the UI as ui.json() does, one item of its dictionaries at a time, so that the whole document is never
+    held in memory
+    """
+    yield "{"
+    for index, (field, value) in enumerate(ui):
+        yield (", " if index else "") + json.dumps(field) + ": "
+        if isinstance(value, dict):
+            yield "{"
+            for item_index, (key, item) in enumerate(value.items()):
+                yield (", " if item_index else "") + json.dumps(key) + ": " + \
+                    json.dumps(item, default=pydantic_encoder)
+            yield "}"
+        else:
+            yield json.dumps(value, default=pydantic_encoder)
+    yield "}"
+
+
+def _sync_directory(path: Path) -> None:
+    """
+    Persists the rename of a file in the directory, where directories can be opened (POSIX)
+    """
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
@@ -17,9 +17,7 @@
  """
 
 from dataclasses import dataclass
-from typing import List
-
-import networkx as nx
+from typing import Dict, List, Optional
 
 from simple_backend.schemas.nodes import Node
 
@@ -45,37 +43,109 @@ def get_edges(node_list: list[Node]):
 class DagCreator:
     """
     Takes a list of Node and parse it to a DAG.
+    The graph is kept as adjacency lists and sorted with a single pass of Kahn's algorithm, which also detects the
+    cycles and groups the nodes in topological levels. Isolated nodes are part of the graph too.
     """
 
     def __init__(self):
-        self._graph = nx.DiGraph()
         self._is_loaded = False
         self._nodes = {}
-        self._sorted_nodes = None
+        self._successors: Dict[str, List[str]] = {}
         self._edges = None
+        self._sorted_nodes = None
+        self._levels = None
+        self._cycle = None
 
     def create_dag(self, nodes: list):
         self._edges = get_edges(nodes)
-        self._graph.add_edges_from([(edge.source, edge.destination) for edge in self._edges.values()])
         self._nodes.update({node.node_id: node for node in nodes})
+        successors = self._successors
+        for node_id in self._nodes:
+            successors.setdefault(node_id, [])
+        for edge in self._edges.values():
+            destinations = successors.setdefault(edge.source, [])
+            successors.setdefault(edge.destination, [])
+            if edge.destination not in destinations:
+                destinations.append(edge.destination)
+        self._sorted_nodes = None
         self._is_loaded = True
 
+    def _sort(self) -> None:
+        """
+        Sorts the graph with Kahn's algorithm, visiting a level at a time. The nodes left out are part of a cycle or
+        depend on one.
+        """
+        if self._sorted_nodes is not None:
+            return
+        in_degree = dict.fromkeys(self._successors, 0)
+        for destinations in self._successors.values():
+            for destination in destinations:
+                in_degree[destination] += 1
+        level = [node_id for node_id, degree in in_degree.items() if degree == 0]
+        self._sorted_nodes, self._levels = [], []
+        while level:
+            self._levels.append(level)
+            self._sorted_nodes.extend(level)
+            next_level = []
+            for node_id in level:
+                for successor in self._successors[node_id]:
+                    in_degree[successor] -= 1
+                    if in_degree[successor] == 0:
+                        next_level.append(successor)
+            level = next_level
+        self._cycle = self._find_cycle(in_degree) if len(self._sorted_nodes) < len(in_degree) else None
+
+    def _find_cycle(self, in_degree: Dict[str, int]) -> List[str]:
+        """
+        Returns a cycle among the nodes left out by the sort: each of them still has a predecessor left out, so
+        walking back the predecessors eventually visits a node twice
+        """
+        # the nodes are visited in insertion order, so the same cycle is reported for the same data flow
+        remaining = [node_id for node_id, degree in in_degree.items() if degree > 0]
+        predecessors = {}
+        for node_id in remaining:
+            for destination in self._successors[node_id]:
+                predecessors.setdefault(destination, node_id)
+        path, positions = [], {}
+        node_id = remaining[0]
+        while node_id not in positions:
+            positions[node_id] = len(path)
+            path.append(node_id)
+            node_id = predecessors[node_id]
+        cycle = path[positions[node_id]:][::-1]
+        return cycle + [cycle[0]]
+
     def get_ordered_nodes(self) -> List[Node]:
         if self._is_loaded:
             sorted_id_list = self.get_ordered_node_ids()
-            sorted_node_list = [self._nodes.get(node_id) for node_id in sorted_id_list]
+            sorted_node_list = [self._nodes.get(node_id) for node_id in sorted_id_list if node_id in self._nodes]
 
             return sorted_node_list
 
-    def get_ordered_edges(self) -> List[Node]:
+    def get_ordered_edges(self) -> List[Edge]:
         if self._is_loaded:
             return list(self._edges.values())
 
     def get_ordered_node_ids(self) -> List[str]:
         if self._is_loaded:
-            topologically_ordered_list = list(nx.topological_sort(self._graph))
+            self._sort()
+            return list(self._sorted_nodes)
+
+    def get_levels(self) -> List[List[str]]:
+        """
+        Returns the ids of the nodes grouped in topological levels: the nodes of a level depend only on the nodes of
+        the previous levels, so they can be executed concurrently
+        """
+        if self._is_loaded:
+            self._sort()
+            return [list(level) for level in self._levels]
 
-            return topologically_ordered_list
+    def get_cycle(self) -> Optional[List[str]]:
+        """
+        Returns the ids of the nodes of a cycle, starting and ending with the same node, or None if the graph is a DAG
+        """
+        self._sort()
+        return self._cycle
 
     def has_cycles(self):
-        return not nx.is_directed_acyclic_graph(self._graph)
+        return self.get_cycle() is not None
@@ -0,0 +1,176 @@
+"""
+ Copyright (C) 2023 Università degli Studi di Camerino and Sigma S.p.A.
+ Authors: Alessandro Antinori, Rosario Capparuccia, Riccardo Coltrinari, Flavio Corradini, Marco Piangerelli, Barbara Re, Marco Scarpetta
+
+ This program is free software: you can redistribute it and/or modify
+ it under the terms of the GNU Affero General Public License as
+ published by the Free Software Foundation, either version 3 of the
+ License, or (at your option) any later version.
+
+ This program is distributed in the hope that it will be useful,
+ but WITHOUT ANY WARRANTY; without even the implied warranty of
+ MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+ GNU Affero General Public License for more details.
+
+ You should have received a copy of the GNU Affero General Public License
+ along with this program.  If not, see <https://www.gnu.org/licenses/>.
+ """
+
+from typing import Dict, Iterable, List, Tuple
+
+
+LAYER_SPACING = 300
+NODE_SPACING = 150
+MARGIN = 50
+ORDER_SWEEPS = 8
+COORDINATE_SWEEPS = 4
+
+
+def _get_layers(node_ids: List[str], successors: Dict[str, List[str]]) -> Dict[str, int]:
+    """
+    Assigns each node to the layer after the deepest of its predecessors (longest path layering). When only cycles
+    are left, the first remaining node is taken as if its edges from the remaining nodes were reversed. Then, in
+    reverse order, each node is moved to the layer before its nearest successor, which shortens the edges leaving the
+    nodes placed too early, like the sources, and so the dummy nodes needed.
+    """
+    in_degree = dict.fromkeys(node_ids, 0)
+    for destinations in successors.values():
+        for destination in destinations:
+            in_degree[destination] += 1
+    layers = dict.fromkeys(node_ids, 0)
+    ready = [node_id for node_id in node_ids if in_degree[node_id] == 0]
+    done = set()
+    remaining = iter(node_ids)
+    order = []
+    while len(done) < len(node_ids):
+        if not ready:
+            ready.append(next(node_id for node_id in remaining if node_id not in done))
+        next_ready = []
+        for node_id in ready:
+            if node_id in done:
+                continue
+            done.add(node_id)
+            order.append(node_id)
+            for successor in successors[node_id]:
+                if successor not in done:
+                    layers[successor] = max(layers[successor], layers[node_id] + 1)
+                    in_degree[successor] -= 1
+                    if in_degree[successor] == 0:
+                        next_ready.append(successor)
+        ready = next_ready
+    for node_id in reversed(order):
+        following = [layers[s] for s in successors[node_id] if layers[s] > layers[node_id]]
+        if following:
+            layers[node_id] = min(following) - 1
+    return layers
+
+
+def _barycenter(neighbors: Iterable[int]) -> float:
+    total = count = 0
+    for position in neighbors:
+        total += position
+        count += 1
+    return total / count if count else -1.0
+
+
+def _order_layers(layers: List[List[int]], upper: List[List[int]], lower: List[List[int]]) -> None:
+    """
+    Reduces the crossings by sorting the nodes of each layer by the barycenter of their neighbors in the previous
+    layer, sweeping down, and in the next layer, sweeping up. A node without neighbors keeps its position.
+    """
+    position = {}
+    for layer in layers:
+        position.update((v, i) for i, v in enumerate(layer))
+    for sweep in range(ORDER_SWEEPS):
+        down = sweep % 2 == 0
+        indexes = range(1, len(layers)) if down else range(len(layers) - 2, -1, -1)
+        neighbors = upper if down else lower
+        for index in indexes:
+            layer = layers[index]
+            keys = {}
+            for v in layer:
+                barycenter = _barycenter(position[u] for u in neighbors[v])
+                keys[v] = (barycenter if barycenter >= 0 else position[v], position[v])
+            layer.sort(key=keys.__getitem__)
+            position.update((v, i) for i, v in enumerate(layer))
+
+
+def _place(wanted: List[float]) -> List[float]:
+    """
+    Returns the coordinates closest to the wanted ones, in the same order, at least NODE_SPACING apart: each node is
+    pushed down by the previous one, then the nodes are shifted so that their average is the wanted one
+    """
+    placed = []
+    for y in wanted:
+        placed.append(max(y, placed[-1] + NODE_SPACING) if placed else y)
+    shift = (sum(wanted) - sum(placed)) / len(placed) if placed else 0
+    return [y + shift for y in placed]
+
+
+def _assign_coordinates(layers: List[List[int]], upper: List[List[int]], lower: List[List[int]]) -> List[float]:
+    """
+    Places the nodes of each layer at the average coordinate of their neighbors, keeping their order
+    """
+    y = [0.0] * len(upper)
+    for layer in layers:
+        for i, v in enumerate(layer):
+            y[v] = (i - (len(layer) - 1) / 2) * NODE_SPACING
+    for sweep in range(COORDINATE_SWEEPS):
+        down = sweep % 2 == 0
+        neighbors = upper if down else lower
+        for layer in (layers[1:] if down else reversed(layers[:-1])):
+            wanted = []
+            for v in layer:
+                adjacent = neighbors[v]
+                wanted.append(sum(y[u] for u in adjacent) / len(adjacent) if adjacent else y[v])
+            for v, coordinate in zip(layer, _place(wanted)):
+                y[v] = coordinate
+    return y
+
+
+def layered_layout(node_ids: List[str], edges: Iterable[Tuple[str, str]]) -> Dict[str, List[float]]:
+    """
+    Returns the position of each node in a left to right layered (Sugiyama) drawing: the nodes are assigned to layers
+    by longest path, the edges spanning more than one layer are split by dummy nodes, the crossings are reduced by
+    barycentric ordering and the nodes are placed near their neighbors. The result depends only on the order of the
+    nodes and of the edges. A repeated node id, e.g. of two nodes assigned to the same name, is placed once.
+    """
+    node_ids = list(dict.fromkeys(node_ids))
+    successors: Dict[str, List[str]] = {node_id: [] for node_id in node_ids}
+    seen = set()
+    for source, destination in edges:
+        if source in successors and destination in successors and source != destination and \
+                (source, destination) not in seen:
+            seen.add((source, destination))
+            successors[source].append(destination)
+    node_layers = _get_layers(node_ids, successors)
+
+    # the nodes are numbered, node_ids first and then the dummy nodes, each with its neighbors in the adjacent layers
+    index = {node_id: i for i, node_id in enumerate(node_ids)}
+    layer_of = [node_layers[node_id] for node_id in node_ids]
+    upper: List[List[int]] = [[] for _ in node_ids]
+    lower: List[List[int]] = [[] for _ in node_ids]
+    for source in node_ids:
+        for destination in successors[source]:
+            u, v = index[source], index[destination]
+            if layer_of[u] > layer_of[v]:
+                u, v = v, u
+            for layer in range(layer_of[u] + 1, layer_of[v]):
+                dummy = len(layer_of)
+                layer_of.append(layer)
+                upper.append([u])
+                lower.append([])
+                lower[u].append(dummy)
+                u = dummy
+            if layer_of[u] < layer_of[v]:
+                lower[u].append(v)
+                upper[v].append(u)
+
+    layers: List[List[int]] = [[] for _ in range(max(layer_of, default=-1) + 1)]
+    for v, layer in enumerate(layer_of):
+        layers[layer].append(v)
+    _order_layers(layers, upper, lower)
+    y = _assign_coordinates(layers, upper, lower)
+
+    top = min(y, default=0)
+    return {node_id: [MARGIN + layer_of[i] * LAYER_SPACING, MARGIN + y[i] - top] for i, node_id in enumerate(node_ids)}
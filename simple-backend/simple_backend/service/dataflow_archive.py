@@ -0,0 +1,170 @@
+"""
+ Copyright (C) 2023 Università degli Studi di Camerino and Sigma S.p.A.
+ Authors: Alessandro Antinori, Rosario Capparuccia, Riccardo Coltrinari, Flavio Corradini, Marco Piangerelli, Barbara Re, Marco Scarpetta
+
+ This program is free software: you can redistribute it and/or modify
+ it under the terms of the GNU Affero General Public License as
+ published by the Free Software Foundation, either version 3 of the
+ License, or (at your option) any later version.
+
+ This program is distributed in the hope that it will be useful,
+ but WITHOUT ANY WARRANTY; without even the implied warranty of
+ MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+ GNU Affero General Public License for more details.
+
+ You should have received a copy of the GNU Affero General Public License
+ along with this program.  If not, see <https://www.gnu.org/licenses/>.
+ """
+
+import os
+import struct
+import zipfile
+from pathlib import Path
+from typing import BinaryIO, Iterator, Optional, Tuple
+from starlette.datastructures import Headers
+from starlette.responses import Response, StreamingResponse
+from simple_backend.service.cached_response import etag_matches, get_accepted_encodings, is_accepted
+
+
+CHUNK_SIZE = 64 * 1024
+MEMBER_MEDIA_TYPES = {
+    "script.py": "text/x-python; charset=utf-8",
+    "metadata.yml": "application/yaml; charset=utf-8",
+    "requirements.txt": "text/plain; charset=utf-8",
+    "ui.json": "application/json",
+}
+# gzip header with no name, no mtime and unknown OS, see RFC 1952
+GZIP_HEADER = b"\x1f\x8b\x08\x00\x00\x00\x00\x00\x00\xff"
+
+
+def get_etag(stat: os.stat_result) -> str:
+    """
+    Returns a strong ETag of an archive, which is never modified once written but may be replaced by another one
+    """
+    return f'"{stat.st_ino:x}-{stat.st_size:x}-{stat.st_mtime_ns:x}"'
+
+
+def get_archive_response(path: Path, headers: Headers) -> Response:
+    """
+    Streams the archive from the disk, answering a single byte range with 206 and a matching If-None-Match with 304.
+    Multiple ranges and a Range whose If-Range doesn't match the ETag are answered with the whole archive.
+    """
+    file = open(path, "rb")
+    stat = os.fstat(file.fileno())
+    etag = get_etag(stat)
+    response_headers = {
+        "ETag": etag,
+        "Accept-Ranges": "bytes",
+        "Content-Disposition": f'attachment; filename="{path.name}"',
+    }
+    if etag_matches(headers.get("if-none-match"), etag):
+        file.close()
+        return Response(status_code=304, headers=response_headers)
+
+    start, end = 0, stat.st_size
+    status_code = 200
+    if "range" in headers and headers.get("if-range", etag) == etag:
+        byte_range = _parse_range(headers["range"], stat.st_size)
+        if byte_range == ():
+            file.close()
+            response_headers["Content-Range"] = f"bytes */{stat.st_size}"
+            return Response(status_code=416, headers=response_headers)
+        if byte_range is not None:
+            start, end = byte_range
+            status_code = 206
+            response_headers["Content-Range"] = f"bytes {start}-{end - 1}/{stat.st_size}"
+    response_headers["Content-Length"] = str(end - start)
+    return StreamingResponse(_iter_file(file, start, end), status_code, response_headers, "application/zip")
+
+
+def get_member_response(path: Path, member: str, headers: Headers) -> Optional[Response]:
+    """
+    Streams a member of the archive, or returns None if the archive doesn't contain it.
+    A deflated member is sent as it is stored, wrapped in a gzip header and trailer, to the clients accepting gzip,
+    otherwise it is decompressed while it is sent.
+    """
+    file = open(path, "rb")
+    try:
+        with zipfile.ZipFile(file) as archive:
+            info = archive.getinfo(member)
+    except (KeyError, zipfile.BadZipFile):
+        file.close()
+        return None
+
+    stat = os.fstat(file.fileno())
+    etag = get_etag(stat)[:-1] + f'-{info.CRC:08x}"'
+    accepted = get_accepted_encodings(headers.get("accept-encoding", ""))
+    start = None
+    if info.compress_type == zipfile.ZIP_DEFLATED and not info.flag_bits & 0x1 and is_accepted(accepted, "gzip"):
+        start = _get_data_offset(file, info)
+    if start is not None:
+        etag = etag[:-1] + '-gzip"'
+    response_headers = {"ETag": etag, "Vary": "Accept-Encoding"}
+    media_type = MEMBER_MEDIA_TYPES.get(member, "application/octet-stream")
+    if etag_matches(headers.get("if-none-match"), etag):
+        file.close()
+        return Response(status_code=304, headers=response_headers)
+
+    if start is not None:
+        response_headers["Content-Encoding"] = "gzip"
+        response_headers["Content-Length"] = str(len(GZIP_HEADER) + info.compress_size + 8)
+        return StreamingResponse(_iter_gzip_member(file, info, start), headers=response_headers,
+                                 media_type=media_type)
+    response_headers["Content-Length"] = str(info.file_size)
+    return StreamingResponse(_iter_member(file, info), headers=response_headers, media_type=media_type)
+
+
+def _parse_range(value: str, size: int) -> Optional[Tuple[int, ...]]:
+    """
+    Returns the (start, end) of a single byte range, () if it is not satisfiable, or None if it must be ignored
+    """
+    unit, _, ranges = value.partition("=")
+    if unit.strip().lower() != "bytes" or "," in ranges:
+        return None
+    first, separator, last = ranges.strip().partition("-")
+    if not separator or not (first + last).isdigit():
+        return None
+    if not first:
+        length = int(last)
+        return (max(size - length, 0), size) if length and size else ()
+    start = int(first)
+    if start >= size:
+        return ()
+    end = min(int(last) + 1, size) if last else size
+    return (start, end) if start < end else None
+
+
+def _iter_file(file: BinaryIO, start: int, end: int) -> Iterator[bytes]:
+    with file:
+        file.seek(start)
+        remaining = end - start
+        while remaining > 0:
+            chunk = file.read(min(CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+def _iter_member(file: BinaryIO, info: zipfile.ZipInfo) -> Iterator[bytes]:
+    with file, zipfile.ZipFile(file) as archive, archive.open(info) as member:
+        while chunk := member.read(CHUNK_SIZE):
+            yield chunk
+
+
+def _get_data_offset(file: BinaryIO, info: zipfile.ZipInfo) -> Optional[int]:
+    """
+    Returns the offset of the compressed data of the member, after its local header, or None if the header is invalid
+    """
+    file.seek(info.header_offset)
+    header = file.read(zipfile.sizeFileHeader)
+    if len(header) != zipfile.sizeFileHeader or header[:4] != zipfile.stringFileHeader:
+        return None
+    name_length, extra_length = struct.unpack("<2H", header[-4:])
+    return info.header_offset + len(header) + name_length + extra_length
+
+
+def _iter_gzip_member(file: BinaryIO, info: zipfile.ZipInfo, start: int) -> Iterator[bytes]:
+    yield GZIP_HEADER
+    yield from _iter_file(file, start, start + info.compress_size)
+    yield struct.pack("<LL", info.CRC, info.file_size & 0xFFFFFFFF)
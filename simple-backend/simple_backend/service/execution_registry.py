@@ -0,0 +1,214 @@
+"""
+ Copyright (C) 2023 Università degli Studi di Camerino and Sigma S.p.A.
+ Authors: Alessandro Antinori, Rosario Capparuccia, Riccardo Coltrinari, Flavio Corradini, Marco Piangerelli, Barbara Re, Marco Scarpetta
+
+ This program is free software: you can redistribute it and/or modify
+ it under the terms of the GNU Affero General Public License as
+ published by the Free Software Foundation, either version 3 of the
+ License, or (at your option) any later version.
+
+ This program is distributed in the hope that it will be useful,
+ but WITHOUT ANY WARRANTY; without even the implied warranty of
+ MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+ GNU Affero General Public License for more details.
+
+ You should have received a copy of the GNU Affero General Public License
+ along with this program.  If not, see <https://www.gnu.org/licenses/>.
+ """
+
+import json
+import os
+import shutil
+import sqlite3
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+from simple_backend import config
+
+
+# a worker that hasn't updated its heartbeat for this many seconds is considered stopped and its executions failed
+WORKER_TIMEOUT = 30
+ACTIVE_STATUSES = ("queued", "running")
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS executions (
+    sequence INTEGER PRIMARY KEY AUTOINCREMENT,
+    id TEXT NOT NULL UNIQUE,
+    owner TEXT NOT NULL,
+    directory TEXT NOT NULL,
+    priority INTEGER NOT NULL,
+    status TEXT NOT NULL,
+    submitted_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL,
+    return_code INTEGER,
+    error TEXT,
+    state TEXT,
+    cancel_requested INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS executions_status ON executions (status, priority, sequence);
+CREATE TABLE IF NOT EXISTS workers (
+    owner TEXT PRIMARY KEY,
+    heartbeat REAL NOT NULL
+);
+"""
+COLUMNS = ("id", "owner", "directory", "priority", "status", "submitted_at", "started_at", "finished_at",
+           "return_code", "error", "state", "sequence")
+ORPHAN_ERROR = "The worker running the execution stopped"
+
+_initialized = set()
+
+
+@contextmanager
+def _transaction(write: bool = False) -> Iterator[sqlite3.Connection]:
+    """
+    Yields a connection to the registry in a transaction, committed if no exception is raised. Write transactions
+    wait for the ones of the other workers, while read transactions don't block each other.
+    """
+    path = str(config.EXECUTION_REGISTRY_PATH)
+    initialized = path in _initialized and os.path.exists(path)
+    connection = sqlite3.connect(path, timeout=30, isolation_level=None)
+    try:
+        if not initialized:
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.executescript(SCHEMA)
+            _initialized.add(path)
+        connection.execute("BEGIN IMMEDIATE" if write else "BEGIN")
+        try:
+            yield connection
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        connection.execute("COMMIT")
+    finally:
+        connection.close()
+
+
+def _to_record(row: tuple, live_owners: set) -> dict:
+    record = dict(zip(COLUMNS, row))
+    record.update(json.loads(record.pop("state") or "{}"))
+    if record["status"] in ACTIVE_STATUSES and record["owner"] not in live_owners:
+        record.update(status="failed", error=ORPHAN_ERROR, finished_at=record["finished_at"] or time.time())
+    started_at = record["started_at"]
+    record["elapsed"] = None if started_at is None else (record["finished_at"] or time.time()) - started_at
+    return record
+
+
+def _get_live_owners(connection: sqlite3.Connection, now: float) -> set:
+    rows = connection.execute("SELECT owner FROM workers WHERE heartbeat > ?", (now - WORKER_TIMEOUT,))
+    return {row[0] for row in rows}
+
+
+def _get_position(connection: sqlite3.Connection, record: dict) -> Optional[int]:
+    if record["status"] != "queued":
+        return None
+    return connection.execute("SELECT COUNT(*) FROM executions WHERE status = 'queued' AND cancel_requested = 0 AND "
+                              "(priority > ? OR (priority = ? AND sequence < ?))",
+                              (record["priority"], record["priority"], record["sequence"])).fetchone()[0] + 1
+
+
+def add(job_id: str, owner: str, directory: str, priority: int, submitted_at: float) -> None:
+    with _transaction(True) as connection:
+        connection.execute("INSERT OR REPLACE INTO workers VALUES (?, ?)", (owner, time.time()))
+        connection.execute("INSERT INTO executions (id, owner, directory, priority, status, submitted_at) "
+                           "VALUES (?, ?, ?, ?, 'queued', ?)", (job_id, owner, directory, priority, submitted_at))
+
+
+def update(job_id: str, status: str, started_at: Optional[float], finished_at: Optional[float],
+           return_code: Optional[int], error: Optional[str], state: dict) -> None:
+    with _transaction(True) as connection:
+        connection.execute("UPDATE executions SET status = ?, started_at = ?, finished_at = ?, return_code = ?, "
+                           "error = ?, state = ? WHERE id = ?",
+                           (status, started_at, finished_at, return_code, error, json.dumps(state), job_id))
+
+
+def dispatch(owner: str, max_running: int, states: Dict[str, dict]) -> Tuple[List[str], List[str]]:
+    """
+    Updates the heartbeat of the worker and the state of its running executions, fails the executions of the
+    stopped workers and marks as running the queued executions of the worker among the first ones of the queue of
+    all the workers that fit in max_running.
+    Returns the ids of the executions to start and of the ones whose cancellation was requested by another worker.
+    """
+    now = time.time()
+    with _transaction(True) as connection:
+        connection.execute("INSERT OR REPLACE INTO workers VALUES (?, ?)", (owner, now))
+        connection.executemany("UPDATE executions SET state = ? WHERE id = ?",
+                               [(json.dumps(state), job_id) for job_id, state in states.items()])
+        connection.execute("UPDATE executions SET status = 'failed', error = ?, finished_at = ? "
+                           "WHERE status IN ('queued', 'running') AND owner NOT IN "
+                           "(SELECT owner FROM workers WHERE heartbeat > ?)", (ORPHAN_ERROR, now, now - WORKER_TIMEOUT))
+        running = connection.execute("SELECT COUNT(*) FROM executions WHERE status = 'running'").fetchone()[0]
+        queued = connection.execute("SELECT id, owner FROM executions WHERE status = 'queued' AND cancel_requested = 0 "
+                                    "ORDER BY priority DESC, sequence LIMIT ?", (max(max_running - running, 0),))
+        started = [job_id for job_id, job_owner in queued.fetchall() if job_owner == owner]
+        connection.executemany("UPDATE executions SET status = 'running', started_at = ? WHERE id = ?",
+                               [(now, job_id) for job_id in started])
+        cancelled = connection.execute("SELECT id FROM executions WHERE owner = ? AND cancel_requested = 1 AND "
+                                       "status IN ('queued', 'running')", (owner,)).fetchall()
+    return started, [row[0] for row in cancelled]
+
+
+def get(job_id: str) -> Optional[dict]:
+    """
+    Returns the execution with its position in the queue, or None if it isn't registered
+    """
+    with _transaction() as connection:
+        row = connection.execute(f"SELECT {', '.join(COLUMNS)} FROM executions WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        record = _to_record(row, _get_live_owners(connection, time.time()))
+        record["position"] = _get_position(connection, record)
+    return record
+
+
+def get_all(history_size: int) -> List[dict]:
+    """
+    Returns the queued and running executions of all the workers and the history_size most recently finished ones
+    """
+    with _transaction() as connection:
+        live_owners = _get_live_owners(connection, time.time())
+        rows = connection.execute(f"SELECT {', '.join(COLUMNS)} FROM executions WHERE status IN ('queued', 'running') "
+                                  f"UNION ALL SELECT * FROM (SELECT {', '.join(COLUMNS)} FROM executions "
+                                  f"WHERE status NOT IN ('queued', 'running') ORDER BY finished_at DESC LIMIT ?) "
+                                  f"ORDER BY 12", (history_size,)).fetchall()
+        records = [_to_record(row, live_owners) for row in rows]
+        for record in records:
+            record["position"] = _get_position(connection, record)
+    return records
+
+
+def request_cancel(job_id: str) -> bool:
+    """
+    Asks the worker running the execution to cancel it. Returns False if the execution isn't registered
+    """
+    with _transaction(True) as connection:
+        cursor = connection.execute("UPDATE executions SET cancel_requested = 1 WHERE id = ?", (job_id,))
+        return cursor.rowcount > 0
+
+
+def remove_worker(owner: str, job_ids: Iterable[str]) -> None:
+    """
+    Removes the heartbeat of a stopping worker, cancelling the given executions it didn't finish
+    """
+    now = time.time()
+    with _transaction(True) as connection:
+        connection.executemany("UPDATE executions SET status = 'cancelled', finished_at = ? WHERE id = ? AND "
+                               "status IN ('queued', 'running')", [(now, job_id) for job_id in job_ids])
+        connection.execute("DELETE FROM workers WHERE owner = ?", (owner,))
+
+
+def forget(history_size: int) -> None:
+    """
+    Removes the finished executions, with their directories, except the history_size most recently finished ones
+    """
+    with _transaction() as connection:
+        rows = connection.execute("SELECT id, directory FROM executions WHERE status NOT IN ('queued', 'running') "
+                                  "ORDER BY finished_at DESC LIMIT -1 OFFSET ?", (history_size,)).fetchall()
+    if not rows:
+        return
+    with _transaction(True) as connection:
+        connection.executemany("DELETE FROM executions WHERE id = ?", [(job_id,) for job_id, _ in rows])
+    for job_id, directory in rows:
+        # the directory of an execution is logs/{id} in the path of its Dataflow, nothing else is removed
+        if Path(directory).name == job_id:
+            shutil.rmtree(directory, ignore_errors=True)
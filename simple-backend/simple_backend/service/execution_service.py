@@ -0,0 +1,529 @@
+"""
+ Copyright (C) 2023 Università degli Studi di Camerino and Sigma S.p.A.
+ Authors: Alessandro Antinori, Rosario Capparuccia, Riccardo Coltrinari, Flavio Corradini, Marco Piangerelli, Barbara Re, Marco Scarpetta
+
+ This program is free software: you can redistribute it and/or modify
+ it under the terms of the GNU Affero General Public License as
+ published by the Free Software Foundation, either version 3 of the
+ License, or (at your option) any later version.
+
+ This program is distributed in the hope that it will be useful,
+ but WITHOUT ANY WARRANTY; without even the implied warranty of
+ MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+ GNU Affero General Public License for more details.
+
+ You should have received a copy of the GNU Affero General Public License
+ along with this program.  If not, see <https://www.gnu.org/licenses/>.
+ """
+
+import asyncio
+import json
+import os
+import re
+import signal
+import sqlite3
+import time
+import uuid
+from enum import Enum
+from pathlib import Path
+from typing import AsyncIterator, Dict, List, Optional, Set
+from starlette.concurrency import run_in_threadpool
+from simple_backend import config
+from simple_backend.errors import BadRequestError, HttpQueryError
+from simple_backend.schemas.execution import ExecutionMetrics, NodeProfile
+from simple_backend.schemas.nodes import ConfigurationSchema
+from simple_backend.service import checkpoint_service, config_service, execution_registry, resource_monitor, \
+    venv_service, zygote_service
+from simple_backend.service.log_store import ExecutionLog
+from simple_backend.service.output_channel import OutputChannel, OverflowPolicy
+from simple_backend.service.script_generator import EVENT_MARKER
+
+
+class JobStatus(str, Enum):
+    QUEUED = "queued"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+    CANCELLED = "cancelled"
+
+
+FINAL_STATUSES = {JobStatus.DONE, JobStatus.FAILED, JobStatus.CANCELLED}
+
+
+class ExecutionJob:
+    """
+    An execution of a Dataflow: the job owns the process and publishes its output to the subscribers.
+    """
+
+    def __init__(self, configuration: ConfigurationSchema, priority: int):
+        self.id = uuid.uuid4().hex
+        self.config = configuration
+        self.priority = priority
+        self.status = JobStatus.QUEUED
+        self.submitted_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.return_code = None
+        self.error = None
+        self.metrics = ExecutionMetrics()
+        self.profile: Dict[str, NodeProfile] = {}
+        self.checkpoints: Dict[str, bool] = {}
+        self.directory = Path(configuration.path) / "logs" / self.id
+        self.log = ExecutionLog(self.directory, config.EXECUTION_LOG_SEGMENT_SIZE, config.EXECUTION_REPLAY_LINES)
+        self._subscribers: Set[OutputChannel] = set()
+        self._process: Optional[asyncio.subprocess.Process] = None
+        self._pid: Optional[int] = None
+        self._task: Optional[asyncio.Task] = None
+        self._monitor: Optional[resource_monitor.ProcessTreeMonitor] = None
+        self._monitor_task: Optional[asyncio.Task] = None
+
+    @property
+    def elapsed(self) -> Optional[float]:
+        if self.started_at is None:
+            return None
+        return (self.finished_at or time.time()) - self.started_at
+
+    def get_state(self) -> dict:
+        """
+        Returns the resources used by the execution, the profile of its nodes and the checkpoints, as saved in the
+        registry
+        """
+        return {"metrics": self.metrics.dict(), "profile": {node_id: p.dict() for node_id, p in self.profile.items()},
+                "checkpoints": self.checkpoints}
+
+    def to_record(self) -> dict:
+        return {"id": self.id, "status": self.status.value, "priority": self.priority,
+                "submitted_at": self.submitted_at, "started_at": self.started_at, "finished_at": self.finished_at,
+                "elapsed": self.elapsed, "return_code": self.return_code, "error": self.error, **self.get_state()}
+
+    async def publish(self, message: str) -> None:
+        for line in message.splitlines(keepends=True):
+            if not line.endswith('\n'):
+                line += '\n'
+            self.log.append(line)
+            for subscriber in list(self._subscribers):
+                await subscriber.put(line)
+
+    def subscribe(self, policy: OverflowPolicy) -> OutputChannel:
+        """
+        Returns a channel receiving the lines of output starting from self.log.line_count, closed when the job is over
+        """
+        subscriber = OutputChannel(config.EXECUTION_QUEUE_SIZE, policy)
+        if self.status in FINAL_STATUSES:
+            subscriber.close()
+        else:
+            self._subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber: OutputChannel) -> None:
+        subscriber.close()
+        self._subscribers.discard(subscriber)
+
+    def finish(self, status: JobStatus) -> None:
+        self.status = status
+        self.finished_at = time.time()
+        self.log.close()
+        for subscriber in self._subscribers:
+            subscriber.close()
+        self._subscribers.clear()
+
+    def save_metrics(self, status: JobStatus) -> None:
+        """
+        Writes the summary of the resources used by the execution next to its log, before it finishes with the given
+        status
+        """
+        self.directory.mkdir(parents=True, exist_ok=True)
+        summary = {"id": self.id, "status": status.value, "return_code": self.return_code,
+                   "elapsed": self.elapsed, **self.metrics.dict(), "checkpoints": self.checkpoints}
+        with open(self.directory / "metrics.json", "w") as f:
+            json.dump(summary, f, indent=2)
+        if self.profile:
+            with open(self.directory / "profile.json", "w") as f:
+                json.dump({node_id: p.dict() for node_id, p in self.profile.items()}, f, indent=2)
+
+    def _record_event(self, event: dict) -> None:
+        """
+        Updates the profile or the checkpoints of the node with an event printed by the script, see ScriptGenerator
+        """
+        if event["event"] == "checkpoint":
+            self.checkpoints[event["node_id"]] = event["hit"]
+            return
+        node = self.profile.setdefault(event["node_id"], NodeProfile(node_id=event["node_id"]))
+        if event["event"] == "start":
+            node.started_at = event["time"]
+        else:
+            node.finished_at = event["time"]
+            node.duration = event.get("duration")
+            node.failed = event.get("failed")
+        node.rss = event.get("rss")
+        node.peak_rss = event.get("peak_rss")
+
+    def _start_monitor(self, pid: int) -> None:
+        self._monitor = resource_monitor.ProcessTreeMonitor(pid)
+
+        async def sample():
+            while True:
+                await run_in_threadpool(self._monitor.sample)
+                self._monitor.update(self.metrics)
+                await asyncio.sleep(config.EXECUTION_METRICS_INTERVAL)
+        self._monitor_task = asyncio.ensure_future(sample())
+
+    async def _stop_monitor(self) -> None:
+        """
+        Stops the periodic sampling, taking a last sample of the processes still alive
+        """
+        if self._monitor_task is None:
+            return
+        self._monitor_task.cancel()
+        self._monitor_task = None
+        await run_in_threadpool(self._monitor.sample)
+        self._monitor.update(self.metrics)
+
+    def kill(self) -> None:
+        """
+        Kills the process of the job, together with the processes it started
+        """
+        if self._pid is None:
+            return
+        try:
+            if os.name == "posix":
+                os.killpg(self._pid, signal.SIGKILL)
+            else:
+                self._process.kill()
+        except ProcessLookupError:
+            pass
+        self._pid = None
+
+    async def run(self) -> None:
+        path = self.config.path
+        script = config_service.generate_script(self.config.nodes, self.config.profile, self.config.checkpoint,
+                                                self.config.workers)
+        await run_in_threadpool(write_execution_files, path, script, self.config)
+        await self.publish('Files written')
+
+        await self.publish('Preparing virtual environment')
+        start = time.monotonic()
+        venv = await acquire_venv(self.config.dependencies)
+        self.metrics.stages["venv"] = time.monotonic() - start - venv.install_time
+        self.metrics.stages["install"] = venv.install_time
+        start = time.monotonic()
+        try:
+            if venv.cached:
+                await self.publish('Reusing cached virtual environment')
+            else:
+                await self.publish('Created virtual environment')
+                await self.publish('Requirements installed')
+
+            if self.config.warm and zygote_service.is_supported():
+                await self._run_warm(path)
+            else:
+                await self._run_cold(venv, path)
+            if os.name == "posix" and self.return_code == -signal.SIGXCPU:
+                await self.publish('The CPU time limit of the execution was exceeded')
+            if self.checkpoints:
+                hits = sum(self.checkpoints.values())
+                await self.publish(f'Checkpoints: {hits} nodes loaded, {len(self.checkpoints) - hits} computed')
+        finally:
+            self.metrics.stages["run"] = time.monotonic() - start
+            await self._stop_monitor()
+            self.kill()
+            await run_in_threadpool(venv_service.release_venv, venv)
+            if self.config.checkpoint:
+                await run_in_threadpool(checkpoint_service.evict)
+
+    async def _publish_output(self, output: bytes) -> None:
+        line = re.sub(u'\u001b\\[.*?[@-~]', '', output.decode(errors='replace'))
+        if line.startswith(EVENT_MARKER):
+            try:
+                self._record_event(json.loads(line[len(EVENT_MARKER):]))
+                return
+            except (ValueError, KeyError):
+                pass
+        await self.publish(line)
+
+    async def _run_cold(self, venv: venv_service.VenvLease, path: str) -> None:
+        """
+        Runs the script in a new interpreter of the virtual environment
+        """
+        command = resource_monitor.get_command(venv_service.get_venv_executable(venv.path, "python"), "script.py",
+                                               resource_monitor.get_limits())
+        self._process = await asyncio.create_subprocess_exec(
+            *command, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.STDOUT, cwd=path,
+            start_new_session=os.name == "posix")
+        self._pid = self._process.pid
+        self._start_monitor(self._pid)
+        await self.publish('Started process')
+        async for output in read_lines(self._process.stdout, config.EXECUTION_FRAME_SIZE):
+            await self._publish_output(output)
+        await self._stop_monitor()
+        self.return_code = await self._process.wait()
+        self._pid = None
+
+    async def _run_warm(self, path: str) -> None:
+        """
+        Runs the script in a child of the warm runner of the virtual environment
+        """
+        reader, writer = await zygote_service.manager.run(self.config.dependencies, os.path.join(path, "script.py"),
+                                                          path, resource_monitor.get_limits())
+        try:
+            async for output in read_lines(reader, config.EXECUTION_FRAME_SIZE):
+                if not output.startswith(zygote_service.MARKER):
+                    await self._publish_output(output)
+                    continue
+                key, value = output[len(zygote_service.MARKER):].decode().strip().split("=", 1)
+                if key == "pid":
+                    self._pid = int(value)
+                    self._start_monitor(self._pid)
+                    await self.publish('Started process in warm runner')
+                elif key == "rusage":
+                    # the usage reported by the runner once the child is reaped is exact
+                    await self._stop_monitor()
+                    for name, amount in json.loads(value).items():
+                        setattr(self.metrics, name, max(getattr(self.metrics, name), amount))
+                elif key == "exit":
+                    self.return_code = int(value)
+                    self._pid = None
+        finally:
+            writer.close()
+        if self.return_code is None:
+            raise RuntimeError("The warm runner terminated unexpectedly")
+
+
+async def read_lines(stream: asyncio.StreamReader, max_size: int) -> AsyncIterator[bytes]:
+    """
+    Yields the lines of the stream, splitting the ones longer than max_size
+    """
+    pending = b''
+    while chunk := await stream.read(max_size):
+        pending += chunk
+        *lines, pending = pending.split(b'\n')
+        for line in lines:
+            yield line + b'\n'
+        while len(pending) >= max_size:
+            yield pending[:max_size]
+            pending = pending[max_size:]
+    if pending:
+        yield pending
+
+
+async def acquire_venv(dependencies: Optional[List[str]]) -> venv_service.VenvLease:
+    """
+    Leases the virtual environment in the thread pool, releasing it if the job gets cancelled in the meanwhile
+    """
+    lease = asyncio.ensure_future(run_in_threadpool(venv_service.acquire_venv, dependencies))
+    try:
+        return await asyncio.shield(lease)
+    except asyncio.CancelledError:
+        def release(future: asyncio.Future):
+            if not future.cancelled() and future.exception() is None:
+                asyncio.ensure_future(run_in_threadpool(venv_service.release_venv, future.result()))
+        lease.add_done_callback(release)
+        raise
+
+
+def write_execution_files(path: str, script: str, configuration: ConfigurationSchema) -> None:
+    """
+    Writes the script, the requirements and the UI configuration in the execution directory
+    """
+    if not os.path.isdir(path):
+        os.mkdir(path)
+    with open(os.path.join(path, "script.py"), "w+") as sp:
+        sp.write(script)
+    with open(os.path.join(path, "requirements.txt"), "w+") as req:
+        req.write("\n".join(configuration.dependencies or []))
+    with open(os.path.join(path, "ui.json"), "w+") as ui:
+        ui.write(configuration.ui.json(separators=(',', ':')))
+
+
+class ExecutionScheduler:
+    """
+    Runs the submitted jobs, at most config.MAX_CONCURRENT_EXECUTIONS at a time among all the workers, in order of
+    priority and then of submission. Each job is run by the worker it was submitted to and recorded in
+    execution_registry, so that any worker can return its status and output and cancel it.
+    While it has jobs to run, the worker polls the registry every config.EXECUTION_POLL_INTERVAL seconds to start
+    them when a slot is free, to save their state and to receive the cancellations.
+    """
+
+    def __init__(self):
+        self._jobs: Dict[str, ExecutionJob] = {}
+        self._running: Set[str] = set()
+        self._pid: Optional[int] = None
+        self._owner: Optional[str] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._poller: Optional[asyncio.Task] = None
+
+    @property
+    def owner(self) -> str:
+        """
+        The id of the worker in the registry, which changes in a forked process
+        """
+        if self._pid != os.getpid():
+            self._pid, self._owner = os.getpid(), uuid.uuid4().hex
+        return self._owner
+
+    async def submit(self, configuration: ConfigurationSchema, priority: int = 0) -> ExecutionJob:
+        if not configuration.path:
+            raise HttpQueryError("The path of the execution is required!")
+        job = ExecutionJob(configuration, priority)
+        await run_in_threadpool(execution_registry.add, job.id, self.owner, str(job.directory), priority,
+                                job.submitted_at)
+        self._wake()
+        self._jobs[job.id] = job
+        return job
+
+    def get_local(self, job_id: str) -> Optional[ExecutionJob]:
+        """
+        Returns the job if it was submitted to this worker and it is still in memory
+        """
+        return self._jobs.get(job_id)
+
+    async def get_record(self, job_id: str) -> dict:
+        """
+        Returns the status of the job, taken from memory if it was submitted to this worker, with its position in
+        the queue of all the workers
+        """
+        record = await run_in_threadpool(execution_registry.get, job_id)
+        if job_id in self._jobs:
+            position = record and record["position"]
+            record = self._jobs[job_id].to_record()
+            record["position"] = position if record["status"] == JobStatus.QUEUED.value else None
+        if record is None:
+            raise BadRequestError(f"Execution {job_id} does not exists!")
+        return record
+
+    async def get_all(self) -> List[dict]:
+        records = await run_in_threadpool(execution_registry.get_all, config.EXECUTION_HISTORY_SIZE)
+        for record in records:
+            if record["id"] in self._jobs:
+                position = record["position"]
+                record.update(self._jobs[record["id"]].to_record(), position=position)
+        return records
+
+    async def get_log(self, job_id: str) -> ExecutionLog:
+        """
+        Returns the log of the job, read from its directory if the job was submitted to another worker, before a
+        restart or if it is no longer in memory
+        """
+        if job_id in self._jobs:
+            return self._jobs[job_id].log
+        record = await self.get_record(job_id)
+        return await run_in_threadpool(ExecutionLog.load, Path(record["directory"]))
+
+    async def cancel(self, job_id: str) -> dict:
+        job = self._jobs.get(job_id)
+        if job is None or job.status in FINAL_STATUSES:
+            if not await run_in_threadpool(execution_registry.request_cancel, job_id):
+                raise BadRequestError(f"Execution {job_id} does not exists!")
+        else:
+            await self._cancel(job)
+        return await self.get_record(job_id)
+
+    async def _cancel(self, job: ExecutionJob) -> None:
+        if job.status == JobStatus.QUEUED:
+            await job.publish('Execution cancelled')
+            job.finish(JobStatus.CANCELLED)
+            await self._save(job)
+            self._forget_old_jobs()
+        elif job.status == JobStatus.RUNNING:
+            job._task.cancel()
+
+    async def _save(self, job: ExecutionJob) -> None:
+        try:
+            await run_in_threadpool(execution_registry.update, job.id, job.status.value, job.started_at,
+                                    job.finished_at, job.return_code, job.error, job.get_state())
+        except sqlite3.Error as e:
+            print(f"Can't save the execution {job.id}: {e}")
+
+    def _wake(self) -> None:
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # the jobs of a stopped event loop will never finish
+            for job in self._jobs.values():
+                if job.status not in FINAL_STATUSES:
+                    job.kill()
+                    job.finish(JobStatus.CANCELLED)
+                    loop.create_task(self._save(job))
+            self._running.clear()
+            self._loop, self._wakeup, self._poller = loop, asyncio.Event(), None
+        if self._poller is None or self._poller.done():
+            self._poller = loop.create_task(self._poll())
+        self._wakeup.set()
+
+    async def _poll(self) -> None:
+        while active := [job for job in self._jobs.values() if job.status not in FINAL_STATUSES]:
+            self._wakeup.clear()
+            running = [job for job in active if job.status == JobStatus.RUNNING]
+            for job in running:
+                job.log.flush()
+            try:
+                started, cancelled = await run_in_threadpool(
+                    execution_registry.dispatch, self.owner, config.MAX_CONCURRENT_EXECUTIONS,
+                    {job.id: job.get_state() for job in running})
+            except sqlite3.Error as e:
+                print(f"Can't poll the executions: {e}")
+                started, cancelled = [], []
+            for job_id in started:
+                job = self._jobs[job_id]
+                if job.status == JobStatus.QUEUED:
+                    job.status = JobStatus.RUNNING
+                    job.started_at = time.time()
+                    self._running.add(job_id)
+                    job._task = asyncio.create_task(self._run(job))
+            for job_id in cancelled:
+                if job_id in self._jobs:
+                    await self._cancel(self._jobs[job_id])
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), config.EXECUTION_POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _run(self, job: ExecutionJob) -> None:
+        try:
+            await job.run()
+            status = JobStatus.DONE if job.return_code == 0 else JobStatus.FAILED
+            await job.publish(f'Execution finished with exit code {job.return_code}')
+        except asyncio.CancelledError:
+            status = JobStatus.CANCELLED
+            await job.publish('Execution cancelled')
+        except Exception as e:
+            status = JobStatus.FAILED
+            job.error = getattr(e, 'msg', None) or str(e)
+            await job.publish(f'Execution failed: {job.error}')
+        finally:
+            self._running.discard(job.id)
+        try:
+            await run_in_threadpool(job.save_metrics, status)
+        except OSError:
+            pass
+        job.finish(status)
+        await self._save(job)
+        self._forget_old_jobs()
+        try:
+            await run_in_threadpool(execution_registry.forget, config.EXECUTION_HISTORY_SIZE)
+        except sqlite3.Error as e:
+            print(f"Can't forget the old executions: {e}")
+        self._wake()
+
+    def _forget_old_jobs(self) -> None:
+        finished = sorted((j for j in self._jobs.values() if j.status in FINAL_STATUSES), key=lambda j: j.finished_at)
+        for job in finished[:max(len(finished) - config.EXECUTION_HISTORY_SIZE, 0)]:
+            del self._jobs[job.id]
+
+    def stop(self) -> None:
+        """
+        Kills the jobs of the worker that are still running, cancelling them in the registry
+        """
+        if self._pid != os.getpid():
+            return
+        unfinished = [job for job in self._jobs.values() if job.status not in FINAL_STATUSES]
+        for job in unfinished:
+            job.kill()
+        try:
+            execution_registry.remove_worker(self.owner, [job.id for job in unfinished])
+            execution_registry.forget(config.EXECUTION_HISTORY_SIZE)
+        except sqlite3.Error as e:
+            print(f"Can't remove the worker from the executions registry: {e}")
+
+
+scheduler = ExecutionScheduler()
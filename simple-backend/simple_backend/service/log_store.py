@@ -0,0 +1,127 @@
+"""
+ Copyright (C) 2023 Università degli Studi di Camerino and Sigma S.p.A.
+ Authors: Alessandro Antinori, Rosario Capparuccia, Riccardo Coltrinari, Flavio Corradini, Marco Piangerelli, Barbara Re, Marco Scarpetta
+
+ This program is free software: you can redistribute it and/or modify
+ it under the terms of the GNU Affero General Public License as
+ published by the Free Software Foundation, either version 3 of the
+ License, or (at your option) any later version.
+
+ This program is distributed in the hope that it will be useful,
+ but WITHOUT ANY WARRANTY; without even the implied warranty of
+ MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+ GNU Affero General Public License for more details.
+
+ You should have received a copy of the GNU Affero General Public License
+ along with this program.  If not, see <https://www.gnu.org/licenses/>.
+ """
+
+import bisect
+import itertools
+import threading
+from collections import deque
+from pathlib import Path
+from typing import BinaryIO, Deque, List, Optional
+
+
+class ExecutionLog:
+    """
+    Append-only log of the output of an execution, stored in segments of about segment_size bytes named after the
+    number of their first line. The latest tail_size lines are also kept in memory.
+    Lines are appended from the event loop while they can be read from any thread.
+    """
+
+    def __init__(self, directory: Path, segment_size: int, tail_size: int):
+        self._directory = directory
+        self._segment_size = segment_size
+        self._segments: List[int] = []
+        self._tail: Deque[str] = deque(maxlen=tail_size)
+        self._line_count = 0
+        self._file: Optional[BinaryIO] = None
+        self._file_size = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, directory: Path) -> "ExecutionLog":
+        """
+        Returns a read-only view of the lines written so far in the directory, possibly by another worker
+        """
+        log = cls(directory, 0, 0)
+        log._segments = sorted(int(path.stem[len("output-"):]) for path in directory.glob("output-*.log"))
+        if log._segments:
+            with log._get_segment_path(log._segments[-1]).open('rb') as segment:
+                log._line_count = log._segments[-1] + sum(1 for line in segment if line.endswith(b'\n'))
+        return log
+
+    @property
+    def line_count(self) -> int:
+        return self._line_count
+
+    @property
+    def tail_offset(self) -> int:
+        """
+        Returns the offset of the first line kept in memory
+        """
+        return self._line_count - len(self._tail)
+
+    def _get_segment_path(self, first_line: int) -> Path:
+        return self._directory / f"output-{first_line:012d}.log"
+
+    def append(self, line: str) -> None:
+        data = line.encode()
+        with self._lock:
+            if self._file is None or self._file_size >= self._segment_size:
+                self._close_segment()
+                self._directory.mkdir(parents=True, exist_ok=True)
+                self._file = self._get_segment_path(self._line_count).open('ab')
+                self._file_size = 0
+                self._segments.append(self._line_count)
+            self._file.write(data)
+            self._file_size += len(data)
+            self._tail.append(line)
+            self._line_count += 1
+
+    def _close_segment(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def flush(self) -> None:
+        """
+        Writes the appended lines to the disk, so that the other workers can read them
+        """
+        with self._lock:
+            if self._file is not None:
+                self._file.flush()
+
+    def close(self) -> None:
+        with self._lock:
+            self._close_segment()
+
+    def read(self, offset: int, limit: int) -> List[str]:
+        """
+        Returns at most limit lines starting from the given line offset, reading only the segments containing them
+        """
+        with self._lock:
+            line_count = self._line_count
+            tail_offset = line_count - len(self._tail)
+            if offset >= tail_offset:
+                return list(itertools.islice(self._tail, offset - tail_offset, offset - tail_offset + limit))
+            if self._file is not None:
+                self._file.flush()
+            segments = self._segments[max(bisect.bisect_right(self._segments, offset) - 1, 0):]
+
+        limit = min(limit, line_count - offset)
+        lines = []
+        for first_line in segments:
+            try:
+                segment = self._get_segment_path(first_line).open('rb')
+            except FileNotFoundError:
+                # the log of a forgotten execution was removed by another worker
+                return lines
+            with segment:
+                for line in itertools.islice(segment, max(offset - first_line, 0), None):
+                    lines.append(line.decode(errors='replace'))
+                    if len(lines) == limit:
+                        return lines
+        return lines
@@ -0,0 +1,80 @@
+"""
+ Copyright (C) 2023 Università degli Studi di Camerino and Sigma S.p.A.
+ Authors: Alessandro Antinori, Rosario Capparuccia, Riccardo Coltrinari, Flavio Corradini, Marco Piangerelli, Barbara Re, Marco Scarpetta
+
+ This program is free software: you can redistribute it and/or modify
+ it under the terms of the GNU Affero General Public License as
+ published by the Free Software Foundation, either version 3 of the
+ License, or (at your option) any later version.
+
+ This program is distributed in the hope that it will be useful,
+ but WITHOUT ANY WARRANTY; without even the implied warranty of
+ MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+ GNU Affero General Public License for more details.
+
+ You should have received a copy of the GNU Affero General Public License
+ along with this program.  If not, see <https://www.gnu.org/licenses/>.
+ """
+
+from typing import Dict, Iterable, List, Optional, Tuple
+from simple_backend.schemas.nodes import NodeParameter, NodeStructure
+from simple_backend.service.node_index import NodeIndex
+
+
+class NodeCatalogue:
+    """
+    The Rain nodes of rain_structure.json, indexed by clazz and by package together with their parameters by name and
+    the dependencies of each library, so that lookups don't scan the whole structure.
+    The indexes are built once, when the structure is loaded, and never modified. The version identifies the content
+    of the structure, e.g. its hash.
+    """
+
+    def __init__(self, structure: dict, version: str = None):
+        self.version = version
+        self._nodes: List[dict] = structure.get("nodes", [])
+        self._by_clazz: Dict[str, dict] = {}
+        self._by_package: Dict[str, dict] = {}
+        self._parameters: Dict[str, Dict[str, dict]] = {}
+        for node in self._nodes:
+            # the first node with a clazz wins, as the linear scan did
+            self._by_clazz.setdefault(node["clazz"], node)
+            self._by_package.setdefault(node["package"], node)
+            self._parameters.setdefault(node["clazz"], {p["name"]: p for p in node.get("parameter") or []})
+        self._dependencies: Dict[str, Tuple[str, ...]] = {
+            library.lower(): tuple(requirements) for library, requirements in structure.get("dependencies", {}).items()
+        }
+        self._index = NodeIndex(self._nodes)
+
+    def __len__(self) -> int:
+        return len(self._nodes)
+
+    def get_nodes(self) -> List[NodeStructure]:
+        return self._nodes
+
+    def get_node(self, clazz: str) -> Optional[NodeStructure]:
+        return self._by_clazz.get(clazz)
+
+    def get_node_by_package(self, package: str) -> Optional[NodeStructure]:
+        return self._by_package.get(package)
+
+    def get_parameters(self, clazz: str) -> Dict[str, NodeParameter]:
+        return self._parameters.get(clazz, {})
+
+    def get_parameter(self, clazz: str, name: str) -> Optional[NodeParameter]:
+        return self._parameters.get(clazz, {}).get(name)
+
+    def get_dependencies(self) -> Dict[str, Tuple[str, ...]]:
+        return self._dependencies
+
+    def get_library_dependencies(self, library: str) -> Tuple[str, ...]:
+        """
+        Returns the requirements of the nodes of the given library, ignoring the case of its name
+        """
+        return self._dependencies.get(library.lower(), ())
+
+    def search(self, query: str = "", libraries: Optional[Iterable[str]] = None, types: Optional[Iterable[str]] = None,
+               offset: int = 0, limit: int = 20) -> Tuple[int, List[NodeStructure], Dict[str, Dict[str, int]]]:
+        """
+        Returns the nodes matching the query and the tags, see NodeIndex.search
+        """
+        return self._index.search(query, libraries, types, offset, limit)
@@ -0,0 +1,174 @@
+"""
+ Copyright (C) 2023 Università degli Studi di Camerino and Sigma S.p.A.
+ Authors: Alessandro Antinori, Rosario Capparuccia, Riccardo Coltrinari, Flavio Corradini, Marco Piangerelli, Barbara Re, Marco Scarpetta
+
+ This program is free software: you can redistribute it and/or modify
+ it under the terms of the GNU Affero General Public License as
+ published by the Free Software Foundation, either version 3 of the
+ License, or (at your option) any later version.
+
+ This program is distributed in the hope that it will be useful,
+ but WITHOUT ANY WARRANTY; without even the implied warranty of
+ MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+ GNU Affero General Public License for more details.
+
+ You should have received a copy of the GNU Affero General Public License
+ along with this program.  If not, see <https://www.gnu.org/licenses/>.
+ """
+
+import re
+from bisect import bisect_left
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+
+WORD_PATTERN = re.compile(r"[A-Z]+(?![a-z])|[A-Z]?[a-z]+|[0-9]+")
+IDENTIFIER_PATTERN = re.compile(r"\w+")
+# weight of a term found in each field, from the best to the worst: the best field counts for each node
+WEIGHTS = (("clazz", 3), ("parameter", 2), ("description", 1))
+
+
+def tokenize(text: str) -> Set[str]:
+    """
+    Returns the lowercase words of the text, splitting camel case and snake case identifiers, together with the
+    whole identifiers
+    """
+    tokens = set(WORD_PATTERN.findall(text))
+    tokens.update(IDENTIFIER_PATTERN.findall(text))
+    return {token.lower() for token in tokens}
+
+
+def _to_mask(positions: List[int]) -> int:
+    """
+    Returns the int with the bits at the given sorted positions set, built from its bytes to avoid a big int per
+    position
+    """
+    if not positions:
+        return 0
+    data = bytearray(positions[-1] // 8 + 1)
+    for position in positions:
+        data[position >> 3] |= 1 << (position & 7)
+    return int.from_bytes(data, "little")
+
+
+def _union(masks: Iterable[int]) -> int:
+    union = 0
+    for mask in masks:
+        union |= mask
+    return union
+
+
+def _count(mask: int) -> int:
+    return bin(mask).count("1")
+
+
+def _iter_positions(mask: int) -> Iterator[int]:
+    while mask:
+        lowest = mask & -mask
+        yield lowest.bit_length() - 1
+        mask ^= lowest
+
+
+class NodeIndex:
+    """
+    Inverted index of the nodes by the words of their clazz, parameter names and description. The nodes containing a
+    word are stored as the bits of an int, one per field, so that intersections, unions and counts run in C. The sorted
+    vocabulary resolves a prefix to the range of words starting with it. The nodes are also grouped by library and
+    type to filter and count them.
+    """
+
+    def __init__(self, nodes: List[dict]):
+        self._nodes = nodes
+        self._all = (1 << len(nodes)) - 1
+        positions: Dict[str, Dict[str, List[int]]] = {field: {} for field, _ in WEIGHTS}
+        libraries: Dict[str, List[int]] = {}
+        types: Dict[str, List[int]] = {}
+        for position, node in enumerate(nodes):
+            fields = {
+                "clazz": tokenize(node["clazz"]),
+                "parameter": set().union(*(tokenize(p["name"]) for p in node.get("parameter") or [])),
+                "description": tokenize(node.get("description") or ""),
+            }
+            for field, tokens in fields.items():
+                for token in tokens:
+                    positions[field].setdefault(token, []).append(position)
+            tags = node.get("tags") or {}
+            libraries.setdefault(tags.get("library", ""), []).append(position)
+            types.setdefault(tags.get("type", ""), []).append(position)
+        self._postings: Dict[str, Dict[str, int]] = {
+            field: {token: _to_mask(p) for token, p in tokens.items()} for field, tokens in positions.items()
+        }
+        self._vocabulary = sorted(set().union(*positions.values()))
+        self._libraries = {library: _to_mask(p) for library, p in libraries.items()}
+        self._types = {node_type: _to_mask(p) for node_type, p in types.items()}
+
+    def _match(self, prefix: str) -> List[Tuple[int, int]]:
+        """
+        Returns the nodes containing a word starting with the prefix, by the weight of the best field containing it
+        """
+        masks = dict.fromkeys((field for field, _ in WEIGHTS), 0)
+        start = bisect_left(self._vocabulary, prefix)
+        for token in self._vocabulary[start:]:
+            if not token.startswith(prefix):
+                break
+            for field, postings in self._postings.items():
+                masks[field] |= postings.get(token, 0)
+        matches, found = [], 0
+        for field, weight in WEIGHTS:
+            matches.append((weight, masks[field] & ~found))
+            found |= masks[field]
+        return matches
+
+    def _score(self, query: str) -> Dict[int, int]:
+        """
+        Returns the nodes matching every word of the query by score, or all the nodes if the query is empty
+        """
+        scores = {0: self._all}
+        for term in sorted({word.lower() for word in IDENTIFIER_PATTERN.findall(query)}):
+            matches = self._match(term)
+            next_scores: Dict[int, int] = {}
+            for score, mask in scores.items():
+                for weight, match in matches:
+                    if found := mask & match:
+                        next_scores[score + weight] = next_scores.get(score + weight, 0) | found
+            scores = next_scores
+            if not scores:
+                break
+        return scores
+
+    def _filter(self, groups: Dict[str, int], values: Optional[Iterable[str]]) -> int:
+        if not values:
+            return self._all
+        values = {value.lower() for value in values}
+        return _union(mask for name, mask in groups.items() if name.lower() in values)
+
+    def search(self, query: str = "", libraries: Optional[Iterable[str]] = None, types: Optional[Iterable[str]] = None,
+               offset: int = 0, limit: int = 20) -> Tuple[int, List[dict], Dict[str, Dict[str, int]]]:
+        """
+        Returns the number of nodes matching the query and the tags, the requested page of them sorted by relevance
+        and the count of the matches by library and by type. The count by library ignores the library filter and vice
+        versa, so that the other values of a facet can be shown together with the selected one.
+        """
+        scores = self._score(query)
+        matches = _union(scores.values())
+        library_filter, type_filter = self._filter(self._libraries, libraries), self._filter(self._types, types)
+        facets = {
+            "library": {name: count for name, mask in self._libraries.items()
+                        if (count := _count(matches & type_filter & mask))},
+            "type": {name: count for name, mask in self._types.items()
+                     if (count := _count(matches & library_filter & mask))},
+        }
+        page = []
+        total = 0
+        for score in sorted(scores, reverse=True):
+            mask = scores[score] & library_filter & type_filter
+            count = _count(mask)
+            if total + count > offset and len(page) < limit:
+                positions = _iter_positions(mask)
+                for _ in range(max(offset - total, 0)):
+                    next(positions)
+                for position in positions:
+                    if len(page) == limit:
+                        break
+                    page.append(self._nodes[position])
+            total += count
+        return total, page, facets
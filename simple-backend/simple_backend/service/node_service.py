@@ -17,33 +17,44 @@
  """
 
 import ast
+import hashlib
 import json
-import re
 import sys
-import requests
-from typing import List, Optional
-from simple_backend.config import here
-from simple_backend.errors import CustomNodeConfigurationError, NodesRetrievalError
-from simple_backend.schemas.nodes import CustomNode, NodeStructure, CustomNodeIOParams
+from functools import cached_property
+from typing import Dict, List, Optional, Set, Tuple, Union
+from fastapi.encoders import jsonable_encoder
+from simple_backend import config
+from simple_backend.errors import CustomNodeConfigurationError
+from simple_backend.schemas.nodes import CustomNode, NodeStructure, CustomNodeIOParams, NodeSearchResult
+from simple_backend.service import catalogue_service
+from simple_backend.service.cached_response import CachedResponse
+from simple_backend.service.lru_cache import LRUCache
+from simple_backend.service.node_catalogue import NodeCatalogue
 
 
-rain_structure = {}
+catalogue = NodeCatalogue({})
+# responses encoded from the catalogue, keyed by its version and by clazz (None for all the nodes)
+_responses: Dict[Tuple[Optional[str], Optional[str]], CachedResponse] = {}
 
 
 def download_rain_structure(is_testing: bool):
+    """
+    Loads the catalogue saved on disk or, if missing, from config.RAIN_STRUCTURE_URL, and refreshes it in the
+    background unless testing
+    """
     try:
-        global rain_structure
-        if is_testing:
-            with open(file=here("../../tests/fixtures/rain_structure.json")) as structure:
-                rain_structure = json.loads(structure.read())
-        else:
-            nodes_request = requests.get(url="https://raw.githubusercontent.com/SIMPLE-DVS/rain/json/rain_structure.json")
-            if nodes_request.status_code != 200:
-                raise NodesRetrievalError(f"Nodes request failed: {nodes_request.reason}")
-            rain_structure = nodes_request.json()
-    except:
-        print('Download of rain_structure.json failed!')
+        set_catalogue(catalogue_service.load())
+    except Exception as e:
+        print(f'Download of rain_structure.json failed: {e}')
         sys.exit(1)
+    if not is_testing:
+        catalogue_service.manager.start(catalogue.version, set_catalogue)
+
+
+def set_catalogue(new_catalogue: NodeCatalogue) -> None:
+    global catalogue
+    catalogue = new_catalogue
+    _responses.clear()
 
 
 def determine_value_type(v: any):
@@ -56,15 +67,13 @@ def determine_value_type(v: any):
     return t
 
 
-def get_node_param_value_and_type(clazz: str, param: str, value: str):
+def get_node_param_value_and_type(clazz: str, param: str, value: Union[str, ast.expr]):
     v = ast.literal_eval(value)
     if clazz == 'CustomNode':
         return v, determine_value_type(v)
-    n = [x for x in rain_structure["nodes"] if x["clazz"] == clazz][0]
-    ps = n["parameter"]
-    p = [x for x in ps if x["name"] == param][0]
+    p = catalogue.get_parameter(clazz, param)
     t = None
-    if p["type"].lower() == 'any':
+    if p is not None and (p["type"] or '').lower() == 'any':
         t = determine_value_type(v)
     return v, t
 
@@ -90,6 +99,115 @@ def parse_custom_node_requirements(code: str):
     return requirements
 
 
+class CustomNodeIOVisitor(ast.NodeVisitor):
+    """
+    Collects, in a single pass over the tree, the keys read from the input and written to the output of a custom
+    node: the subscripts and the get calls with a constant key on the input and output parameters, on the names they
+    are assigned to and on the parameters of the functions they are passed to. The names shadowed by the parameters of
+    nested functions are ignored.
+    """
+
+    def __init__(self, functions: Dict[str, ast.FunctionDef]):
+        self.inputs: List[str] = []
+        self.outputs: List[str] = []
+        self._functions = functions
+        # the names bound to the input or to the output in the current scope
+        self._aliases: Dict[str, List[str]] = {}
+        self._visited = set()
+
+    def collect(self, statements: list, aliases: Dict[str, List[str]]) -> None:
+        previous, self._aliases = self._aliases, aliases
+        for statement in statements:
+            self.visit(statement)
+        self._aliases = previous
+
+    def visit(self, node: ast.AST):
+        # NodeVisitor.visit builds the name of the method at each node, the methods are cached by class instead
+        cls = node.__class__
+        if (method := _VISIT_METHODS.get(cls)) is None:
+            method = _VISIT_METHODS[cls] = getattr(CustomNodeIOVisitor, f"visit_{cls.__name__}",
+                                                   CustomNodeIOVisitor.generic_visit)
+        return method(self, node)
+
+    def generic_visit(self, node: ast.AST):
+        for field in node._fields:
+            value = getattr(node, field, None)
+            if isinstance(value, list):
+                for item in value:
+                    if isinstance(item, ast.AST):
+                        self.visit(item)
+            elif isinstance(value, ast.AST):
+                self.visit(value)
+
+    def _get_target(self, node: ast.AST) -> Optional[List[str]]:
+        return self._aliases.get(node.id) if isinstance(node, ast.Name) else None
+
+    def visit_Subscript(self, node: ast.Subscript):
+        target = self._get_target(node.value)
+        if target is not None and (key := _get_constant_key(node.slice)) is not None and key not in target:
+            target.append(key)
+        self.generic_visit(node)
+
+    def visit_Call(self, node: ast.Call):
+        func = node.func
+        if isinstance(func, ast.Attribute) and func.attr == "get" and self._get_target(func.value) is self.inputs \
+                and node.args and (key := _get_constant_key(node.args[0])) is not None and key not in self.inputs:
+            self.inputs.append(key)
+        if isinstance(func, ast.Name) and func.id in self._functions and func.id not in self._aliases:
+            self._visit_function_call(self._functions[func.id], node)
+        self.generic_visit(node)
+
+    def _visit_function_call(self, function: ast.FunctionDef, call: ast.Call) -> None:
+        params = [arg.arg for arg in function.args.posonlyargs + function.args.args]
+        aliases = {}
+        for param, arg in zip(params, call.args):
+            if (target := self._get_target(arg)) is not None:
+                aliases[param] = target
+        for keyword in call.keywords:
+            if keyword.arg is not None and (target := self._get_target(keyword.value)) is not None:
+                aliases[keyword.arg] = target
+        key = (id(function), tuple((param, id(target)) for param, target in sorted(aliases.items())))
+        if aliases and key not in self._visited:
+            self._visited.add(key)
+            self.collect(function.body, aliases)
+
+    def visit_Assign(self, node: ast.Assign):
+        self.generic_visit(node)
+        target = self._get_target(node.value)
+        for name in node.targets:
+            if isinstance(name, ast.Name):
+                if target is not None:
+                    self._aliases[name.id] = target
+                else:
+                    self._aliases.pop(name.id, None)
+
+    def _visit_scope(self, node: Union[ast.FunctionDef, ast.AsyncFunctionDef, ast.Lambda], body: list) -> None:
+        args = node.args
+        shadowed = {arg.arg for arg in args.posonlyargs + args.args + args.kwonlyargs + [args.vararg, args.kwarg]
+                    if arg is not None}
+        for default in args.defaults + [d for d in args.kw_defaults if d is not None]:
+            self.visit(default)
+        self.collect(body, {name: target for name, target in self._aliases.items() if name not in shadowed})
+
+    def visit_FunctionDef(self, node: ast.FunctionDef):
+        self._functions[node.name] = node
+        for decorator in node.decorator_list:
+            self.visit(decorator)
+        self._visit_scope(node, node.body)
+
+    visit_AsyncFunctionDef = visit_FunctionDef
+
+    def visit_Lambda(self, node: ast.Lambda):
+        self._visit_scope(node, [node.body])
+
+
+_VISIT_METHODS = {}
+
+
+def _get_constant_key(node: ast.AST) -> Optional[str]:
+    return node.value if isinstance(node, ast.Constant) and isinstance(node.value, str) else None
+
+
 def find_custom_node_params(code, main_func: str) -> CustomNodeIOParams:
     """
     Method that retrieves all the parameters of a custom nodes
@@ -99,24 +217,55 @@ def find_custom_node_params(code, main_func: str) -> CustomNodeIOParams:
         raise CustomNodeConfigurationError(
             f"The signature of the function {main_func} should be: {main_func}(input, output, ...kwargs)")
 
-    body = ast.unparse(code.body)
+    # parse_custom_node_code inserts the other functions of the code as a list at the beginning of the body: they
+    # aren't closures, so they are visited only when the input or the output is passed to them
+    body = [statement for statement in code.body if not isinstance(statement, list)]
+    functions = {f.name: f for statement in code.body if isinstance(statement, list) for f in statement
+                 if isinstance(f, (ast.FunctionDef, ast.AsyncFunctionDef))}
+    visitor = CustomNodeIOVisitor(functions)
+    visitor.collect(body, {params[0]: visitor.inputs, params[1]: visitor.outputs})
+
+    return CustomNodeIOParams(inputs=visitor.inputs, outputs=visitor.outputs, params=params[2:])
+
+
+class CustomNodeAnalysis:
+    """
+    The results of the analysis of a custom node code, each computed the first time it is used
+    """
+
+    def __init__(self, code: str, function_name: str):
+        self._code = code
+        self._function_name = function_name
+
+    @cached_property
+    def function(self) -> ast.FunctionDef:
+        """
+        The parsed function with the other functions of the code inserted in its body, it must not be modified
+        """
+        return parse_custom_node_code(self._code, self._function_name)
+
+    @cached_property
+    def code(self) -> str:
+        return ast.unparse(self.function)
 
-    inputs = get_variables_matches(
-        body, r"{}(\[|\.get\()(\"|\')(?P<param>[a-zA-Z_\d-]+)(\"|\')(\]|\))".format(params[0])
-    )
+    @cached_property
+    def io_params(self) -> CustomNodeIOParams:
+        return find_custom_node_params(self.function, self._function_name)
 
-    outputs = get_variables_matches(
-        body, r"{}\[(\"|\')(?P<param>[a-zA-Z_\d-]+)(\"|\')\]".format(params[1])
-    )
+    @cached_property
+    def requirements(self) -> Set[str]:
+        return parse_custom_node_requirements(self._code)
 
-    return CustomNodeIOParams(inputs=inputs, outputs=outputs, params=params[2:])
 
+custom_node_cache: LRUCache[CustomNodeAnalysis] = LRUCache(config.CUSTOM_NODE_CACHE_SIZE)
 
-def get_variables_matches(code, regex):
+
+def get_custom_node_analysis(code: str, function_name: str) -> CustomNodeAnalysis:
     """
-    Returns the matches given a string and a regex
+    Returns the analysis of the custom node code, shared by the requests with the same code and function name
     """
-    return [x.group("param") for x in re.finditer(regex, code, re.MULTILINE)]
+    key = (hashlib.sha256(code.encode()).hexdigest(), function_name)
+    return custom_node_cache.get(key, lambda: CustomNodeAnalysis(code, function_name))
 
 
 def check_custom_node_code(custom_nodes: List[CustomNode]):
@@ -136,25 +285,50 @@ def check_custom_node_code(custom_nodes: List[CustomNode]):
                 raise CustomNodeConfigurationError(f"Duplicated function name in node {node.node_id}!")
 
 
-def get_nodes_requirements() -> dict[str, list[str]]:
+def get_nodes_requirements() -> dict[str, tuple[str, ...]]:
     """
-    Returns the dependencies for the available Rain nodes
+    Returns the dependencies for the available Rain nodes, by lowercase library name
     """
-    return rain_structure["dependencies"]
+    return catalogue.get_dependencies()
 
 
 def get_nodes_structure() -> list[NodeStructure]:
     """
     Returns the available Rain nodes
     """
-    return rain_structure["nodes"]
+    return catalogue.get_nodes()
 
 
 def get_node(clazz) -> Optional[NodeStructure]:
     """
     Returns the node with the specified clazz
     """
-    for node in rain_structure["nodes"]:
-        if node["clazz"] == clazz:
-            return node
-    return None
+    return catalogue.get_node(clazz)
+
+
+def search_nodes(query: str = "", libraries: Optional[List[str]] = None, types: Optional[List[str]] = None,
+                 offset: int = 0, limit: int = 20) -> NodeSearchResult:
+    """
+    Returns a page of the nodes matching the query and having one of the given libraries and types
+    """
+    total, nodes, facets = catalogue.search(query, libraries, types, offset, limit)
+    return NodeSearchResult(total=total, offset=offset, limit=limit, nodes=nodes, facets=facets)
+
+
+def get_nodes_response(clazz: Optional[str] = None) -> Optional[CachedResponse]:
+    """
+    Returns the available Rain nodes, or the one with the specified clazz, validated and encoded once per version of
+    the catalogue
+    """
+    current = catalogue
+    key = (current.version, clazz)
+    if (response := _responses.get(key)) is None:
+        if clazz is None:
+            content = [NodeStructure.parse_obj(node) for node in current.get_nodes()]
+        elif (node := current.get_node(clazz)) is not None:
+            content = NodeStructure.parse_obj(node)
+        else:
+            return None
+        response = CachedResponse(json.dumps(jsonable_encoder(content), separators=(",", ":")).encode())
+        _responses[key] = response
+    return response
@@ -0,0 +1,132 @@
+"""
+ Copyright (C) 2023 Università degli Studi di Camerino and Sigma S.p.A.
+ Authors: Alessandro Antinori, Rosario Capparuccia, Riccardo Coltrinari, Flavio Corradini, Marco Piangerelli, Barbara Re, Marco Scarpetta
+
+ This program is free software: you can redistribute it and/or modify
+ it under the terms of the GNU Affero General Public License as
+ published by the Free Software Foundation, either version 3 of the
+ License, or (at your option) any later version.
+
+ This program is distributed in the hope that it will be useful,
+ but WITHOUT ANY WARRANTY; without even the implied warranty of
+ MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+ GNU Affero General Public License for more details.
+
+ You should have received a copy of the GNU Affero General Public License
+ along with this program.  If not, see <https://www.gnu.org/licenses/>.
+ """
+
+import asyncio
+from collections import deque
+from enum import Enum
+from typing import Deque, Optional
+
+
+class OverflowPolicy(str, Enum):
+    """
+    What to do when the output is produced faster than it is consumed:
+        - block: the producer waits until there is room in the channel;
+        - drop-oldest: the oldest messages are discarded to make room for the new ones;
+        - summarize: the new messages are discarded and replaced by a summary line.
+    """
+    BLOCK = "block"
+    DROP_OLDEST = "drop-oldest"
+    SUMMARIZE = "summarize"
+
+
+class OutputChannel:
+    """
+    Bounded queue of output messages between the reader of a process and a consumer, which receives the messages
+    coalesced in frames.
+    """
+
+    def __init__(self, max_size: int, policy: OverflowPolicy):
+        self._max_size = max_size
+        self._policy = policy
+        self._messages: Deque[str] = deque()
+        self._size = 0
+        self._dropped = 0
+        self._closed = False
+        self._readable = asyncio.Event()
+        self._writable = asyncio.Event()
+        self._writable.set()
+
+    def _is_full(self, message: str) -> bool:
+        return self._messages and self._size + len(message) > self._max_size
+
+    def _append(self, message: str) -> None:
+        self._messages.append(message)
+        self._size += len(message)
+        self._readable.set()
+
+    def _popleft(self) -> str:
+        message = self._messages.popleft()
+        self._size -= len(message)
+        return message
+
+    def _dropped_summary(self) -> str:
+        summary = f"[{self._dropped} lines dropped]\n"
+        self._dropped = 0
+        return summary
+
+    async def put(self, message: str) -> None:
+        if self._closed:
+            return
+        if self._policy == OverflowPolicy.BLOCK:
+            while self._is_full(message) and not self._closed:
+                self._writable.clear()
+                await self._writable.wait()
+            if self._closed:
+                return
+        elif self._policy == OverflowPolicy.DROP_OLDEST:
+            while self._is_full(message):
+                self._popleft()
+                self._dropped += 1
+        else:
+            if self._is_full(message):
+                self._dropped += 1
+                return
+            if self._dropped:
+                self._append(self._dropped_summary())
+        self._append(message)
+
+    def close(self) -> None:
+        """
+        Closes the channel: the pending messages can still be consumed, the new ones are ignored
+        """
+        if self._dropped and self._policy == OverflowPolicy.SUMMARIZE:
+            self._append(self._dropped_summary())
+        self._closed = True
+        self._readable.set()
+        self._writable.set()
+
+    async def get_frame(self, max_size: int, interval: float) -> Optional[str]:
+        """
+        Returns the pending messages joined in a frame, waiting up to interval seconds after the first one for
+        others to come unless the frame reaches max_size. Returns None when the channel is closed and drained.
+        """
+        while not self._messages and not self._closed:
+            self._readable.clear()
+            await self._readable.wait()
+        if not self._messages:
+            return None
+
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + interval
+        frame = [self._dropped_summary()] if self._dropped and self._policy == OverflowPolicy.DROP_OLDEST else []
+        frame_size = 0
+        while True:
+            while self._messages and frame_size < max_size:
+                message = self._popleft()
+                frame.append(message)
+                frame_size += len(message)
+            self._writable.set()
+            timeout = deadline - loop.time()
+            if frame_size >= max_size or self._closed or timeout <= 0:
+                break
+            self._readable.clear()
+            try:
+                await asyncio.wait_for(self._readable.wait(), timeout)
+            except asyncio.TimeoutError:
+                break
+        return "".join(frame)
@@ -0,0 +1,362 @@
+"""
+ Copyright (C) 2023 Università degli Studi di Camerino and Sigma S.p.A.
+ Authors: Alessandro Antinori, Rosario Capparuccia, Riccardo Coltrinari, Flavio Corradini, Marco Piangerelli, Barbara Re, Marco Scarpetta
+
+ This program is free software: you can redistribute it and/or modify
+ it under the terms of the GNU Affero General Public License as
+ published by the Free Software Foundation, either version 3 of the
+ License, or (at your option) any later version.
+
+ This program is distributed in the hope that it will be useful,
+ but WITHOUT ANY WARRANTY; without even the implied warranty of
+ MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+ GNU Affero General Public License for more details.
+
+ You should have received a copy of the GNU Affero General Public License
+ along with this program.  If not, see <https://www.gnu.org/licenses/>.
+ """
+
+import argparse
+import json
+import os
+import re
+import sqlite3
+import time
+import zipfile
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Iterator, List, Optional, Tuple
+from simple_backend import config
+from simple_backend.errors import HttpQueryError
+
+
+# a directory changed within this many seconds from its last scan could have been changed again after the scan
+# without a new mtime, on file systems with a coarse mtime, so it is scanned again
+RACY_INTERVAL = 2
+REPOSITORY_SORTS = ("name", "created", "modified", "size", "dataflows")
+DATAFLOW_SORTS = ("id", "created", "modified", "size", "nodes")
+TIMESTAMP_PATTERN = re.compile(r"dataflow(\d{13})(-[0-9a-f]{16})?")
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS directories (
+    path TEXT PRIMARY KEY,
+    mtime_ns INTEGER NOT NULL,
+    scanned_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS repositories (
+    name TEXT NOT NULL,
+    archived INTEGER NOT NULL,
+    created REAL NOT NULL,
+    modified REAL NOT NULL,
+    PRIMARY KEY (name, archived)
+);
+CREATE TABLE IF NOT EXISTS dataflows (
+    repository TEXT NOT NULL,
+    archived INTEGER NOT NULL,
+    id TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    created REAL NOT NULL,
+    modified REAL NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    nodes INTEGER,
+    PRIMARY KEY (repository, archived, id)
+);
+"""
+_initialized = set()
+
+
+def _get_root(archived: bool) -> Path:
+    return config.ARCHIVE_DIR if archived else config.BASE_OUTPUT_DIR
+
+
+@contextmanager
+def _transaction(write: bool = False) -> Iterator[sqlite3.Connection]:
+    """
+    Yields a connection to the index in a transaction, committed if no exception is raised. The workers share the
+    index, so write transactions wait for the ones of the others, while read transactions don't block each other.
+    """
+    path = str(config.REPOSITORY_INDEX_PATH)
+    initialized = path in _initialized and os.path.exists(path)
+    connection = sqlite3.connect(path, timeout=30, isolation_level=None)
+    try:
+        if not initialized:
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.executescript(SCHEMA)
+            _initialized.add(path)
+        connection.execute("BEGIN IMMEDIATE" if write else "BEGIN")
+        try:
+            yield connection
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        connection.execute("COMMIT")
+    finally:
+        connection.close()
+
+
+def _is_scanned(connection: sqlite3.Connection, path: Path, mtime_ns: int) -> bool:
+    row = connection.execute("SELECT mtime_ns, scanned_at FROM directories WHERE path = ?", (str(path),)).fetchone()
+    return row is not None and row[0] == mtime_ns and mtime_ns / 1e9 < row[1] - RACY_INTERVAL
+
+
+def _set_scanned(connection: sqlite3.Connection, path: Path, mtime_ns: int) -> None:
+    connection.execute("INSERT OR REPLACE INTO directories VALUES (?, ?, ?)", (str(path), mtime_ns, time.time()))
+
+
+def read_node_count(path: Path) -> Optional[int]:
+    """
+    Returns the number of nodes in the UI state saved in the Dataflow, if any
+    """
+    try:
+        with zipfile.ZipFile(path) as dataflow:
+            return len(json.loads(dataflow.read("ui.json")).get("nodes", {}))
+    except (OSError, KeyError, ValueError, zipfile.BadZipFile):
+        return None
+
+
+def _get_created(path: Path, mtime: float) -> float:
+    match = TIMESTAMP_PATTERN.fullmatch(path.stem)
+    return int(match.group(1)) / 1000 if match else mtime
+
+
+def _scan_repository(connection: sqlite3.Connection, name: str, archived: bool) -> bool:
+    """
+    Updates the Dataflows of the repository if its directory changed since the last scan, reading only the new or
+    changed zip files. Returns False if the repository doesn't exist.
+    """
+    path = _get_root(archived) / name
+    try:
+        stat = path.stat()
+    except OSError:
+        stat = None
+    if stat is None or not path.is_dir():
+        connection.execute("DELETE FROM repositories WHERE name = ? AND archived = ?", (name, archived))
+        connection.execute("DELETE FROM dataflows WHERE repository = ? AND archived = ?", (name, archived))
+        connection.execute("DELETE FROM directories WHERE path = ?", (str(path),))
+        return False
+    connection.execute("INSERT OR IGNORE INTO repositories VALUES (?, ?, ?, ?)",
+                       (name, archived, stat.st_ctime, stat.st_mtime))
+    if _is_scanned(connection, path, stat.st_mtime_ns):
+        return True
+
+    indexed = {row[0]: row[1] for row in connection.execute(
+        "SELECT id, mtime_ns FROM dataflows WHERE repository = ? AND archived = ?", (name, archived))}
+    modified = stat.st_mtime
+    for file in path.iterdir():
+        if file.suffix != ".zip" or not file.is_file():
+            continue
+        file_stat = file.stat()
+        modified = max(modified, file_stat.st_mtime)
+        if indexed.pop(file.stem, None) != file_stat.st_mtime_ns:
+            connection.execute("INSERT OR REPLACE INTO dataflows VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                               (name, archived, file.stem, file_stat.st_size,
+                                _get_created(file, file_stat.st_mtime), file_stat.st_mtime, file_stat.st_mtime_ns,
+                                read_node_count(file)))
+    connection.executemany("DELETE FROM dataflows WHERE repository = ? AND archived = ? AND id = ?",
+                           [(name, archived, dataflow_id) for dataflow_id in indexed])
+    connection.execute("UPDATE repositories SET modified = ? WHERE name = ? AND archived = ?",
+                       (modified, name, archived))
+    _set_scanned(connection, path, stat.st_mtime_ns)
+    return True
+
+
+def _scan_repositories(connection: sqlite3.Connection, archived: bool) -> None:
+    """
+    Updates the list of repositories if their directory changed since the last scan, then each repository
+    """
+    root = _get_root(archived)
+    mtime_ns = root.stat().st_mtime_ns
+    if not _is_scanned(connection, root, mtime_ns):
+        names = {p.name for p in root.iterdir() if p.is_dir() and p != config.ARCHIVE_DIR}
+        indexed = {row[0] for row in connection.execute(
+            "SELECT name FROM repositories WHERE archived = ?", (archived,))}
+        names.update(indexed)
+        _set_scanned(connection, root, mtime_ns)
+    else:
+        names = {row[0] for row in connection.execute("SELECT name FROM repositories WHERE archived = ?", (archived,))}
+    for name in names:
+        _scan_repository(connection, name, archived)
+
+
+def _is_current(connection: sqlite3.Connection, archived: bool, name: Optional[str]) -> bool:
+    """
+    Returns True if the directories of the repositories, or only of the given one, didn't change since their last scan
+    """
+    root = _get_root(archived)
+    if name is None:
+        if not _is_scanned(connection, root, root.stat().st_mtime_ns):
+            return False
+        paths = [root / row[0] for row in connection.execute(
+            "SELECT name FROM repositories WHERE archived = ?", (archived,))]
+    else:
+        paths = [root / name]
+    for path in paths:
+        try:
+            mtime_ns = path.stat().st_mtime_ns
+        except OSError:
+            return False
+        if not _is_scanned(connection, path, mtime_ns):
+            return False
+    return True
+
+
+@contextmanager
+def _scanned(archived: bool, name: Optional[str] = None) -> Iterator[sqlite3.Connection]:
+    """
+    Yields a connection to the index in a read transaction if the repositories, or only the given one, are up to
+    date, otherwise in the write transaction that scans them first
+    """
+    with _transaction() as connection:
+        if _is_current(connection, archived, name):
+            yield connection
+            return
+    with _transaction(True) as connection:
+        if name is None:
+            _scan_repositories(connection, archived)
+        elif not _scan_repository(connection, name, archived):
+            raise FileNotFoundError(f"Repository {name} does not exists!")
+        yield connection
+
+
+def rebuild() -> Tuple[int, int]:
+    """
+    Rebuilds the index from the repositories on disk, returning the number of repositories and of Dataflows
+    """
+    with _transaction(True) as connection:
+        for table in ("directories", "repositories", "dataflows"):
+            connection.execute(f"DELETE FROM {table}")
+        for archived in (False, True):
+            _scan_repositories(connection, archived)
+        return (connection.execute("SELECT COUNT(*) FROM repositories").fetchone()[0],
+                connection.execute("SELECT COUNT(*) FROM dataflows").fetchone()[0])
+
+
+def _update(operation: Callable[..., None], *args) -> None:
+    """
+    Runs an update of the index after the change of the repositories on disk, marking their directories as scanned so
+    that the next list doesn't scan them again. If it fails the change is found by the next scan, since it changed the
+    mtime of the directories.
+    """
+    try:
+        with _transaction(True) as connection:
+            operation(connection, *args)
+    except sqlite3.Error as e:
+        print(f"Update of the repositories index failed: {e}")
+
+
+def _add_repository(connection: sqlite3.Connection, name: str) -> None:
+    now = time.time()
+    connection.execute("INSERT OR IGNORE INTO repositories VALUES (?, 0, ?, ?)", (name, now, now))
+
+
+def _add_dataflow(connection: sqlite3.Connection, repository: str, path: Path, nodes: Optional[int]) -> None:
+    stat = path.stat()
+    connection.execute("INSERT OR IGNORE INTO repositories VALUES (?, 0, ?, ?)",
+                       (repository, stat.st_mtime, stat.st_mtime))
+    connection.execute("INSERT OR REPLACE INTO dataflows VALUES (?, 0, ?, ?, ?, ?, ?, ?)",
+                       (repository, path.stem, stat.st_size, _get_created(path, stat.st_mtime), stat.st_mtime,
+                        stat.st_mtime_ns, nodes))
+    connection.execute("UPDATE repositories SET modified = MAX(modified, ?) WHERE name = ? AND archived = 0",
+                       (stat.st_mtime, repository))
+    _set_scanned(connection, path.parent, path.parent.stat().st_mtime_ns)
+
+
+def _remove_dataflow(connection: sqlite3.Connection, repository: str, dataflow_id: str) -> None:
+    connection.execute("DELETE FROM dataflows WHERE repository = ? AND archived = 0 AND id = ?",
+                       (repository, dataflow_id))
+    connection.execute("UPDATE repositories SET modified = ? WHERE name = ? AND archived = 0",
+                       (time.time(), repository))
+    path = config.BASE_OUTPUT_DIR / repository
+    _set_scanned(connection, path, path.stat().st_mtime_ns)
+
+
+def _remove_repository(connection: sqlite3.Connection, name: str, archived: bool) -> None:
+    connection.execute("DELETE FROM repositories WHERE name = ? AND archived = ?", (name, archived))
+    connection.execute("DELETE FROM dataflows WHERE repository = ? AND archived = ?", (name, archived))
+
+
+def _move_repository(connection: sqlite3.Connection, name: str, archived: bool) -> None:
+    _remove_repository(connection, name, archived)
+    connection.execute("UPDATE repositories SET archived = ? WHERE name = ? AND archived = ?",
+                       (archived, name, not archived))
+    connection.execute("UPDATE dataflows SET archived = ? WHERE repository = ? AND archived = ?",
+                       (archived, name, not archived))
+
+
+def add_repository(name: str) -> None:
+    _update(_add_repository, name)
+
+
+def add_dataflow(repository: str, path: Path, nodes: Optional[int] = None) -> None:
+    _update(_add_dataflow, repository, path, nodes)
+
+
+def remove_dataflow(repository: str, dataflow_id: str) -> None:
+    _update(_remove_dataflow, repository, dataflow_id)
+
+
+def remove_repository(name: str, archived: bool) -> None:
+    _update(_remove_repository, name, archived)
+
+
+def move_repository(name: str, archived: bool) -> None:
+    """
+    Moves the repository, with its Dataflows, to the archived repositories or, if not archived, back
+    """
+    _update(_move_repository, name, archived)
+
+
+def _get_order(sort: str, order: str, sorts: Tuple[str, ...], key: str) -> str:
+    if sort not in sorts:
+        raise HttpQueryError(f"Unknown sort {sort}, it must be one of: {', '.join(sorts)}")
+    direction = "DESC" if order == "desc" else "ASC"
+    return f"{sort} {direction}, {key} {direction}" if sort != key else f"{key} {direction}"
+
+
+def list_repositories(archived: bool = False, name: Optional[str] = None, sort: str = "name", order: str = "asc",
+                      offset: int = 0, limit: int = 50) -> Tuple[int, List[dict]]:
+    """
+    Returns the number of repositories whose name contains the given one and a page of them, sorted by the given
+    column, each with the number and the total size of its Dataflows
+    """
+    order_by = _get_order(sort, order, REPOSITORY_SORTS, "name")
+    pattern = "%" + (name or "").replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+    with _scanned(archived) as connection:
+        total = connection.execute("SELECT COUNT(*) FROM repositories WHERE archived = ? AND name LIKE ? ESCAPE '\\'",
+                                   (archived, pattern)).fetchone()[0]
+        rows = connection.execute(f"""
+            SELECT r.name, r.archived, r.created, r.modified, COUNT(d.id) AS dataflows, COALESCE(SUM(d.size), 0) AS size
+            FROM repositories r LEFT JOIN dataflows d ON d.repository = r.name AND d.archived = r.archived
+            WHERE r.archived = ? AND r.name LIKE ? ESCAPE '\\'
+            GROUP BY r.name, r.archived ORDER BY {order_by} LIMIT ? OFFSET ?""",
+                                  (archived, pattern, limit, offset)).fetchall()
+    columns = ("name", "archived", "created", "modified", "dataflows", "size")
+    return total, [dict(zip(columns, row), archived=bool(row[1])) for row in rows]
+
+
+def get_repository_names(archived: bool = False) -> List[str]:
+    with _scanned(archived) as connection:
+        return [row[0] for row in connection.execute(
+            "SELECT name FROM repositories WHERE archived = ? ORDER BY name", (archived,))]
+
+
+def list_dataflows(repository: str, archived: bool = False, sort: str = "id", order: str = "asc", offset: int = 0,
+                   limit: Optional[int] = 50) -> Tuple[int, List[dict]]:
+    """
+    Returns the number of Dataflows of the repository and a page of them sorted by the given column
+    """
+    order_by = _get_order(sort, order, DATAFLOW_SORTS, "id")
+    with _scanned(archived, repository) as connection:
+        total = connection.execute("SELECT COUNT(*) FROM dataflows WHERE repository = ? AND archived = ?",
+                                   (repository, archived)).fetchone()[0]
+        rows = connection.execute(f"""
+            SELECT id, size, created, modified, nodes FROM dataflows WHERE repository = ? AND archived = ?
+            ORDER BY {order_by} LIMIT ? OFFSET ?""",
+                                  (repository, archived, -1 if limit is None else limit, offset)).fetchall()
+    return total, [dict(zip(("id", "size", "created", "modified", "nodes"), row)) for row in rows]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Rebuilds the index of the repositories and of their Dataflows")
+    parser.parse_args()
+    repositories, dataflows = rebuild()
+    print(f"{repositories} repositories and {dataflows} Dataflows indexed in {config.REPOSITORY_INDEX_PATH}")
@@ -19,10 +19,19 @@
 import sys
 import shutil
 import zipfile
-from typing import List
+from pathlib import Path
+from typing import Iterable, List, Optional
+from filelock import FileLock
 from simple_backend import config
 from simple_backend.errors import BadRequestError
 from simple_backend.schemas.dataflow import DataFlow
+from simple_backend.service import repository_index
+
+
+DATAFLOW_MEMBERS = {"script": "script.py", "metadata": "metadata.yml", "requirements": "requirements.txt",
+                    "ui": "ui.json"}
+# the names of the routes under /repositories, which a repository can't have since they would hide it
+RESERVED_NAMES = ("archived", "summary")
 
 
 try:
@@ -33,48 +42,69 @@ except:
     print('Can\'t create repositories directory!')
     sys.exit(1)
 
+def get_lock(repository: str) -> FileLock:
+    """ Returns the lock of the repository, held while it or its Dataflows are changed, also when it is archived. """
+    config.REPOSITORY_LOCK_DIR.mkdir(parents=True, exist_ok=True)
+    return FileLock(str(config.REPOSITORY_LOCK_DIR / f"{repository}.lock"))
+
+
 def get_repositories_names() -> List[str]:
     """ Returns the immediate subdirectories names of the output dir. """
-    return [name.stem for name in config.BASE_OUTPUT_DIR.iterdir() if name.is_dir() and not name == config.ARCHIVE_DIR]
+    return repository_index.get_repository_names(False)
 
 
 def get_archived_repositories_names() -> List[str]:
     """ Returns the immediate subdirectories names of the archived output dir. """
-    return [name.stem for name in config.ARCHIVE_DIR.iterdir() if name.is_dir()]
+    return repository_index.get_repository_names(True)
 
 
 def get_repository_content(repository: str) -> List[list]:
     """ Returns the content (only zip file names) and the last modified dates of the given repository. """
-    return [[name.stem, name.stat().st_mtime] for name in (config.BASE_OUTPUT_DIR / repository).iterdir()
-            if name.is_file() and name.suffix == ".zip"]
+    _, dataflows = repository_index.list_dataflows(repository, limit=None)
+    return [[dataflow["id"], dataflow["modified"]] for dataflow in dataflows]
 
 
 def create_repository(repository: str) -> None:
-    (config.BASE_OUTPUT_DIR / repository).mkdir()
+    if repository in RESERVED_NAMES:
+        raise BadRequestError(f"Repository name '{repository}' is reserved, it can't be one of: "
+                              f"{', '.join(RESERVED_NAMES)}")
+    with get_lock(repository):
+        (config.BASE_OUTPUT_DIR / repository).mkdir()
+        repository_index.add_repository(repository)
 
 
 def delete_repository(repository: str, archived: bool, shallow: bool) -> None:
     repo_path = (config.ARCHIVE_DIR if archived else config.BASE_OUTPUT_DIR) / repository
 
-    if not repo_path.is_dir():
-        raise BadRequestError(f"Repository '{repository}' does not exists!")
+    with get_lock(repository):
+        if not repo_path.is_dir():
+            raise BadRequestError(f"Repository '{repository}' does not exists!")
 
-    if shallow:
-        shutil.move(str(repo_path), config.ARCHIVE_DIR)
-    else:
-        shutil.rmtree(repo_path)
+        if shallow:
+            if (config.ARCHIVE_DIR / repository).exists():
+                raise BadRequestError(f"Repository '{repository}' is already archived!")
+            shutil.move(str(repo_path), config.ARCHIVE_DIR)
+            repository_index.move_repository(repository, True)
+        else:
+            shutil.rmtree(repo_path)
+            repository_index.remove_repository(repository, archived)
 
 
 def unarchive_repository(repository: str) -> None:
     repo_path = config.ARCHIVE_DIR / repository
 
-    if not repo_path.is_dir():
-        raise BadRequestError(f"Repository '{repository}' does not exists!")
+    with get_lock(repository):
+        if not repo_path.is_dir():
+            raise BadRequestError(f"Repository '{repository}' does not exists!")
+
+        if (config.BASE_OUTPUT_DIR / repository).exists():
+            raise FileExistsError(repository)
 
-    shutil.move(str(repo_path), config.BASE_OUTPUT_DIR)
+        shutil.move(str(repo_path), config.BASE_OUTPUT_DIR)
+        repository_index.move_repository(repository, False)
 
 
-def get_dataflow_from_repository(repository: str, id: str) -> DataFlow:
+def get_dataflow_path(repository: str, id: str) -> Path:
     repo_path = config.BASE_OUTPUT_DIR / repository
 
     if not repo_path.exists() or not repo_path.is_dir():
@@ -85,25 +115,31 @@ def get_dataflow_from_repository(repository: str, id: str) -> DataFlow:
     if not dataflow_path.exists() or not dataflow_path.is_file():
         raise BadRequestError(f"Dataflow {id} does not exists!")
 
-    dataflow_path = str(dataflow_path)
+    return dataflow_path
+
+
+def get_dataflow_from_repository(repository: str, id: str, fields: Optional[Iterable[str]] = None) -> DataFlow:
+    """ Returns the Dataflow reading only the members of the given fields, or all of them if fields is None. """
+    dataflow_path = get_dataflow_path(repository, id)
+    fields = DATAFLOW_MEMBERS if fields is None else {field: DATAFLOW_MEMBERS[field] for field in fields}
 
     with zipfile.ZipFile(dataflow_path, "r") as dataflow:
-        script = dataflow.read('script.py') if 'script.py' in dataflow.namelist() else None
-        metadata = dataflow.read('metadata.yml') if 'metadata.yml' in dataflow.namelist() else None
-        requirements = dataflow.read('requirements.txt') if 'requirements.txt' in dataflow.namelist() else None
-        ui = dataflow.read('ui.json') if 'ui.json' in dataflow.namelist() else None
+        names = set(dataflow.namelist())
+        members = {field: dataflow.read(member) if member in names else None for field, member in fields.items()}
 
-    return DataFlow(id=id, path=dataflow_path, script=script, metadata=metadata, requirements=requirements, ui=ui)
+    return DataFlow(id=id, path=str(dataflow_path), **members)
 
 
 def delete_dataflow(repository: str, id: str) -> None:
     repo_path = config.BASE_OUTPUT_DIR / repository
     dataflow_path = repo_path / f"{id}.zip"
 
-    if not repo_path.is_dir():
-        raise BadRequestError(f"Repository {repository} does not exists!")
+    with get_lock(repository):
+        if not repo_path.is_dir():
+            raise BadRequestError(f"Repository {repository} does not exists!")
 
-    if not dataflow_path.exists() or not dataflow_path.is_file():
-        raise BadRequestError(f"Repository {repository} does not contain the dataflow '{id}'")
+        if not dataflow_path.exists() or not dataflow_path.is_file():
+            raise BadRequestError(f"Repository {repository} does not contain the dataflow '{id}'")
 
-    dataflow_path.unlink()
+        dataflow_path.unlink()
+        repository_index.remove_dataflow(repository, id)
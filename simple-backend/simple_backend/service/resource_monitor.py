@@ -0,0 +1,129 @@
+"""
+ Copyright (C) 2023 Università degli Studi di Camerino and Sigma S.p.A.
+ Authors: Alessandro Antinori, Rosario Capparuccia, Riccardo Coltrinari, Flavio Corradini, Marco Piangerelli, Barbara Re, Marco Scarpetta
+
+ This program is free software: you can redistribute it and/or modify
+ it under the terms of the GNU Affero General Public License as
+ published by the Free Software Foundation, either version 3 of the
+ License, or (at your option) any later version.
+
+ This program is distributed in the hope that it will be useful,
+ but WITHOUT ANY WARRANTY; without even the implied warranty of
+ MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+ GNU Affero General Public License for more details.
+
+ You should have received a copy of the GNU Affero General Public License
+ along with this program.  If not, see <https://www.gnu.org/licenses/>.
+ """
+
+import json
+import os
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+from simple_backend import config
+from simple_backend.schemas.execution import ExecutionMetrics
+
+PROC_DIR = "/proc"
+LIMITS_SCRIPT = Path(__file__).resolve().parent.parent / "runner" / "limits.py"
+
+
+@dataclass
+class ProcessUsage:
+    user_cpu: float
+    system_cpu: float
+    rss: int
+    read_bytes: int
+    write_bytes: int
+
+
+def is_supported() -> bool:
+    return os.path.exists(os.path.join(PROC_DIR, "self", "stat"))
+
+
+def _read_stat(pid: int) -> Optional[Tuple[int, ProcessUsage]]:
+    """
+    Returns the session and the usage of the process from /proc/{pid}/stat and /proc/{pid}/io
+    """
+    try:
+        with open(os.path.join(PROC_DIR, str(pid), "stat"), "rb") as f:
+            # the command name can contain spaces, the fields start after its closing parenthesis
+            fields = f.read().rsplit(b")", 1)[1].split()
+    except (OSError, IndexError):
+        return None
+    ticks = os.sysconf("SC_CLK_TCK")
+    usage = ProcessUsage(user_cpu=int(fields[11]) / ticks, system_cpu=int(fields[12]) / ticks,
+                         rss=int(fields[21]) * os.sysconf("SC_PAGE_SIZE"), read_bytes=0, write_bytes=0)
+    try:
+        with open(os.path.join(PROC_DIR, str(pid), "io"), "rb") as f:
+            for line in f:
+                key, value = line.split(b":")
+                if key == b"read_bytes":
+                    usage.read_bytes = int(value)
+                elif key == b"write_bytes":
+                    usage.write_bytes = int(value)
+    except (OSError, ValueError):
+        pass
+    return int(fields[3]), usage
+
+
+def iter_session(session: int) -> Iterator[Tuple[int, ProcessUsage]]:
+    """
+    Yields the usage of the processes of the given session
+    """
+    for name in os.listdir(PROC_DIR):
+        if name.isdigit() and (stat := _read_stat(int(name))) is not None and stat[0] == session:
+            yield int(name), stat[1]
+
+
+class ProcessTreeMonitor:
+    """
+    Samples the processes started by an execution, which are all in the session led by its process.
+    CPU time and I/O of every process are the last sampled ones, so processes living less than the sampling interval
+    may not be accounted, while the peak RSS is the highest total RSS of the processes alive at the same time.
+    """
+
+    def __init__(self, session: int):
+        self._session = session
+        self._usage: Dict[int, ProcessUsage] = {}
+        self._peak_rss = 0
+
+    def sample(self) -> None:
+        if not is_supported():
+            return
+        rss = 0
+        for pid, usage in iter_session(self._session):
+            self._usage[pid] = usage
+            rss += usage.rss
+        self._peak_rss = max(self._peak_rss, rss)
+
+    def update(self, metrics: ExecutionMetrics) -> None:
+        metrics.user_cpu = max(metrics.user_cpu, sum(u.user_cpu for u in self._usage.values()))
+        metrics.system_cpu = max(metrics.system_cpu, sum(u.system_cpu for u in self._usage.values()))
+        metrics.read_bytes = max(metrics.read_bytes, sum(u.read_bytes for u in self._usage.values()))
+        metrics.write_bytes = max(metrics.write_bytes, sum(u.write_bytes for u in self._usage.values()))
+        metrics.peak_rss = max(metrics.peak_rss, self._peak_rss)
+        metrics.processes = max(metrics.processes, len(self._usage))
+
+
+def get_limits() -> Dict[str, int]:
+    """
+    Returns the limits of the execution processes: the address space in bytes and the CPU time in seconds
+    """
+    limits = {}
+    if config.EXECUTION_MAX_MEMORY_MB > 0:
+        limits["memory"] = config.EXECUTION_MAX_MEMORY_MB * 1024 * 1024
+    if config.EXECUTION_MAX_CPU_SECONDS > 0:
+        limits["cpu"] = config.EXECUTION_MAX_CPU_SECONDS
+    return limits
+
+
+def get_command(python: str, script: str, limits: Dict[str, int]) -> List[str]:
+    """
+    Returns the command running the script with the interpreter, through runner/limits.py if there are limits, so
+    that they are applied without a preexec_fn, which isn't safe in a process with threads.
+    Once the CPU time is exceeded the process receives SIGXCPU, and SIGKILL one second later.
+    """
+    if not limits or os.name != "posix":
+        return [python, script]
+    return [python, str(LIMITS_SCRIPT), json.dumps(limits), script]
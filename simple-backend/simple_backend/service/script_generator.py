@@ -16,11 +16,103 @@
  along with this program.  If not, see <https://www.gnu.org/licenses/>.
  """
 
-import ast
 from jinja2 import Environment, BaseLoader
-from simple_backend.service.node_service import parse_custom_node_code
+from simple_backend.service.node_service import get_custom_node_analysis
+
+EVENT_MARKER = "[rainfall-event] "
 
 template = """import {{ rain_module }} as sr
+{% if profile or checkpoints %}
+import json as _rainfall_json
+import os as _rainfall_os
+import sys as _rainfall_sys
+import time as _rainfall_time
+{%- if checkpoints %}
+import pickle as _rainfall_pickle
+{%- endif %}
+
+
+def _rainfall_memory():
+    rss, peak_rss = None, None
+    try:
+        with open("/proc/self/statm") as statm:
+            rss = int(statm.read().split()[1]) * _rainfall_os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        pass
+    try:
+        import resource
+        peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        peak_rss *= 1 if _rainfall_sys.platform == "darwin" else 1024
+    except ImportError:
+        pass
+    return rss, peak_rss
+
+
+def _rainfall_event(event, node_id, **fields):
+    rss, peak_rss = _rainfall_memory()
+    fields.update(event=event, node_id=node_id, time=_rainfall_time.time(), rss=rss, peak_rss=peak_rss)
+    # a single write keeps the line whole when the nodes run in concurrent processes
+    _rainfall_sys.stdout.write("{{ event_marker }}" + _rainfall_json.dumps(fields) + "\\n")
+    _rainfall_sys.stdout.flush()
+{% endif %}
+{% if checkpoints %}
+
+_RAINFALL_CHECKPOINT_DIR = {{ checkpoint_dir }}
+
+
+def _rainfall_checkpoint(node, node_id, key, outputs):
+    # the outputs of the node, read and written as its attributes, are saved once computed and loaded in the next
+    # executions with the same key instead of executing the node again
+    execute = node.execute
+    path = _rainfall_os.path.join(_RAINFALL_CHECKPOINT_DIR, key + ".pkl")
+
+    def checkpointed_execute(*args, **kwargs):
+        try:
+            with open(path, "rb") as checkpoint:
+                values = _rainfall_pickle.load(checkpoint)
+            if any(name not in values for name in outputs):
+                raise KeyError(key)
+            for name, value in values.items():
+                setattr(node, name, value)
+            _rainfall_os.utime(path)
+            _rainfall_event("checkpoint", node_id, key=key, hit=True)
+            return None
+        except Exception:
+            pass
+        result = execute(*args, **kwargs)
+        tmp_path = "%s.%d.tmp" % (path, _rainfall_os.getpid())
+        try:
+            _rainfall_os.makedirs(_RAINFALL_CHECKPOINT_DIR, exist_ok=True)
+            with open(tmp_path, "wb") as checkpoint:
+                _rainfall_pickle.dump({name: getattr(node, name) for name in outputs}, checkpoint,
+                                      protocol=_rainfall_pickle.HIGHEST_PROTOCOL)
+            _rainfall_os.replace(tmp_path, path)
+        except Exception:
+            if _rainfall_os.path.exists(tmp_path):
+                _rainfall_os.remove(tmp_path)
+        _rainfall_event("checkpoint", node_id, key=key, hit=False)
+        return result
+
+    node.execute = checkpointed_execute
+{% endif %}
+{% if profile %}
+
+def _rainfall_profile(node, node_id):
+    execute = node.execute
+
+    def profiled_execute(*args, **kwargs):
+        _rainfall_event("start", node_id)
+        start = _rainfall_time.perf_counter()
+        try:
+            result = execute(*args, **kwargs)
+        except BaseException:
+            _rainfall_event("end", node_id, duration=_rainfall_time.perf_counter() - start, failed=True)
+            raise
+        _rainfall_event("end", node_id, duration=_rainfall_time.perf_counter() - start, failed=False)
+        return result
+
+    node.execute = profiled_execute
+{% endif %}
 
 {% for code in nodes|selectattr('code','defined')|map(attribute='code')|unique|list %}
 {{ code }}
@@ -38,6 +130,13 @@ df = sr.DataFlow("dataflow1")
     {{ par }}={{ '\"' + node.parameters[par] + '\"' if node.parameters[par] is string else node.parameters[par] }},
 {%- endfor %}
 )
+{%- if node.node_id in checkpoints %}
+_rainfall_checkpoint({{ node.node_id }}, "{{ node.node_id }}", "{{ checkpoints[node.node_id] }}",
+                     {{ node_outputs.get(node.node_id, []) }})
+{%- endif %}
+{%- if profile %}
+_rainfall_profile({{ node.node_id }}, "{{ node.node_id }}")
+{%- endif %}
 {% endfor %}
 
 df.add_edges([
@@ -45,15 +144,68 @@ df.add_edges([
     {{ edge.source }} @ '{{ edge.source_var }}' > {{ edge.destination }} @ '{{ edge.destination_var }}',
 {%- endfor %}
 ])
+{% if workers %}
+
+# the nodes are executed in a pool of processes as soon as the outputs of their upstream nodes are available, so
+# that independent branches run concurrently; inputs and outputs are passed between the processes by pickling them
+_RAINFALL_NODES = {
+{%- for node in nodes %}
+    "{{ node.node_id }}": {{ node.node_id }},
+{%- endfor %}
+}
+_RAINFALL_OUTPUTS = {{ node_outputs }}
+_RAINFALL_UPSTREAM = {{ upstream }}
+_RAINFALL_ORDER = {{ order }}
+
+
+def _rainfall_execute_node(node_id, inputs):
+    node = _RAINFALL_NODES[node_id]
+    for name, value in inputs.items():
+        setattr(node, name, value)
+    node.execute()
+    return {name: getattr(node, name) for name in _RAINFALL_OUTPUTS.get(node_id, [])}
+
+
+def _rainfall_execute_parallel(workers):
+    from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+    outputs, running, waiting = {}, {}, list(_RAINFALL_ORDER)
+    with ProcessPoolExecutor(workers) as pool:
+        while waiting or running:
+            for node_id in [n for n in waiting if all(u[0] in outputs for u in _RAINFALL_UPSTREAM.get(n, []))]:
+                inputs = {dst: outputs[src][var] for src, var, dst in _RAINFALL_UPSTREAM.get(node_id, [])}
+                running[pool.submit(_rainfall_execute_node, node_id, inputs)] = node_id
+                waiting.remove(node_id)
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                outputs[running.pop(future)] = future.result()
+
+
+if __name__ == "__main__":
+    _rainfall_execute_parallel({{ workers }})
+{% else %}
 
 df.execute()
-"""
+{% endif %}"""
 
 
 class ScriptGenerator:
-    def __init__(self, nodes, edges):
+    def __init__(self, nodes, edges, profile=False, checkpoints=None, checkpoint_dir=None, workers=0, levels=None):
+        """
+        If profile is True, the generated script prints a line starting with EVENT_MARKER followed by a JSON event
+        when the execution of each node starts and ends, with its duration and the memory of the process.
+        checkpoints maps the id of the nodes to the keys under which their outputs are saved in checkpoint_dir:
+        a node whose checkpoint exists is not executed and an event reports whether it was loaded or computed.
+        If workers is greater than 0, the script executes the independent nodes concurrently in a pool of workers
+        processes instead of calling DataFlow.execute, submitting them in the order of the topological levels.
+        """
         self._nodes = nodes
         self._edges = edges
+        self._profile = profile
+        self._checkpoints = checkpoints or {}
+        self._checkpoint_dir = checkpoint_dir
+        self._workers = workers
+        self._levels = levels
         self._rain_module = "rain"
         self.jinja_env = Environment(loader=BaseLoader())
         self.jinja_template = self.jinja_env.from_string(template)
@@ -61,12 +213,29 @@ class ScriptGenerator:
     def generate_script(self):
         custom_nodes = [n for n in self._nodes if n.node == 'rain.nodes.custom.custom.CustomNode']
         for c in custom_nodes:
-            c.code = ast.unparse(parse_custom_node_code(c.code, c.function_name))
+            c.code = get_custom_node_analysis(c.code, c.function_name).code
+
+        node_outputs, upstream = {}, {}
+        for edge in self._edges:
+            outputs = node_outputs.setdefault(edge.source, [])
+            if edge.source_var not in outputs:
+                outputs.append(edge.source_var)
+            upstream.setdefault(edge.destination, []).append((edge.source, edge.source_var, edge.destination_var))
+        order = [node_id for level in self._levels for node_id in level] if self._levels else \
+            [node.node_id for node in self._nodes]
 
         jinja_vars = {
             "rain_module": self._rain_module,
             "nodes": self._nodes,
             "edges": self._edges,
+            "profile": self._profile,
+            "event_marker": EVENT_MARKER,
+            "checkpoints": self._checkpoints,
+            "checkpoint_dir": repr(str(self._checkpoint_dir)),
+            "node_outputs": node_outputs,
+            "upstream": upstream,
+            "order": order,
+            "workers": self._workers,
         }
 
         return self.jinja_template.render(jinja_vars)
@@ -0,0 +1,194 @@
+"""
+ Copyright (C) 2023 Università degli Studi di Camerino and Sigma S.p.A.
+ Authors: Alessandro Antinori, Rosario Capparuccia, Riccardo Coltrinari, Flavio Corradini, Marco Piangerelli, Barbara Re, Marco Scarpetta
+
+ This program is free software: you can redistribute it and/or modify
+ it under the terms of the GNU Affero General Public License as
+ published by the Free Software Foundation, either version 3 of the
+ License, or (at your option) any later version.
+
+ This program is distributed in the hope that it will be useful,
+ but WITHOUT ANY WARRANTY; without even the implied warranty of
+ MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+ GNU Affero General Public License for more details.
+
+ You should have received a copy of the GNU Affero General Public License
+ along with this program.  If not, see <https://www.gnu.org/licenses/>.
+ """
+
+import ast
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+from simple_backend.errors import HttpQueryError
+from simple_backend.schemas.script import ReversedScript
+from simple_backend.service.dag_layout import layered_layout
+from simple_backend.service.node_service import get_node_param_value_and_type, find_custom_node_params
+
+
+@dataclass
+class ScriptNode:
+    node_id: str
+    clazz: str
+    params: Dict[str, ast.expr]
+
+
+@dataclass
+class ParsedScript:
+    nodes: List[ScriptNode] = field(default_factory=list)
+    edges: List[Tuple[str, str, str, str]] = field(default_factory=list)
+    functions: Dict[str, ast.FunctionDef] = field(default_factory=dict)
+
+
+class ScriptVisitor(ast.NodeVisitor):
+    """
+    Collects, in a single pass over a rain script, the modules rain is imported as, the nodes created by calling a
+    rain class and assigning the result to a name, the edges passed to add_edges and add_edge, and the top level
+    functions, i.e. the custom functions
+    """
+
+    def __init__(self):
+        self.script = ParsedScript()
+        self._libraries = set()
+        self._depth = 0
+
+    def visit_Import(self, node: ast.Import):
+        for alias in node.names:
+            if alias.name == 'rain':
+                self._libraries.add(alias.asname or alias.name)
+
+    def visit_FunctionDef(self, node: ast.FunctionDef):
+        # the bodies of the functions are user code, nothing to collect there
+        if self._depth == 0:
+            self.script.functions[node.name] = node
+
+    visit_AsyncFunctionDef = visit_FunctionDef
+
+    def visit_ClassDef(self, node: ast.ClassDef):
+        self._depth += 1
+        self.generic_visit(node)
+        self._depth -= 1
+
+    def visit_Assign(self, node: ast.Assign):
+        call = node.value
+        if len(node.targets) == 1 and isinstance(node.targets[0], ast.Name) and isinstance(call, ast.Call) and \
+                (clazz := self._get_rain_class(call.func)) is not None and clazz != 'DataFlow':
+            params = {keyword.arg: keyword.value for keyword in call.keywords if keyword.arg is not None}
+            self.script.nodes.append(ScriptNode(node.targets[0].id, clazz, params))
+        else:
+            self.generic_visit(node)
+
+    def visit_Call(self, node: ast.Call):
+        func = node.func
+        if isinstance(func, ast.Attribute) and node.args:
+            if func.attr == 'add_edges' and isinstance(node.args[0], (ast.List, ast.Tuple)):
+                for element in node.args[0].elts:
+                    self._add_edge(element)
+                return
+            if func.attr == 'add_edge':
+                self._add_edge(node.args[0])
+                return
+        self.generic_visit(node)
+
+    def _get_rain_class(self, func: ast.expr) -> Optional[str]:
+        """
+        Returns the dotted name after the rain module of an attribute like sr.nodes.Clazz
+        """
+        names = []
+        while isinstance(func, ast.Attribute):
+            names.append(func.attr)
+            func = func.value
+        if isinstance(func, ast.Name) and func.id in self._libraries and names:
+            return '.'.join(reversed(names))
+        return None
+
+    def _add_edge(self, edge: ast.expr) -> None:
+        """
+        Adds an edge written as node @ 'var' > node @ 'var'
+        """
+        if not (isinstance(edge, ast.Compare) and len(edge.ops) == 1 and isinstance(edge.ops[0], ast.Gt)):
+            raise ValueError(f"Invalid edge at line {edge.lineno}")
+        source, destination = _get_port(edge.left), _get_port(edge.comparators[0])
+        if source is None or destination is None:
+            raise ValueError(f"Invalid edge at line {edge.lineno}")
+        self.script.edges.append(source + destination)
+
+
+def _get_port(node: ast.expr) -> Optional[Tuple[str, str]]:
+    if isinstance(node, ast.BinOp) and isinstance(node.op, ast.MatMult) and isinstance(node.left, ast.Name) and \
+            isinstance(node.right, ast.Constant) and isinstance(node.right.value, str):
+        return node.left.id, node.right.value
+    return None
+
+
+def parse_script(code: str) -> ParsedScript:
+    """
+    Returns the nodes, the edges and the functions of a rain script
+    """
+    visitor = ScriptVisitor()
+    visitor.visit(ast.parse(code))
+    if not visitor.script.nodes:
+        raise ValueError("The script doesn't create any rain node")
+    return visitor.script
+
+
+LAYOUTS = ('spring', 'layered')
+
+
+def get_layout(node_ids: List[str], edges: List[Tuple[str, str, str, str]], layout: str = 'spring') \
+        -> Dict[str, List[float]]:
+    """
+    Returns the position of each node in the UI, computed by the spring layout of networkx or by the layered layout,
+    which is deterministic and draws the data flow from left to right
+    """
+    if layout not in LAYOUTS:
+        raise HttpQueryError(f"Unknown layout {layout}, it must be one of: {', '.join(LAYOUTS)}")
+    if layout == 'layered':
+        return layered_layout(node_ids, [(e[0], e[2]) for e in edges])
+    # networkx is imported only when needed, since importing it slows down the startup
+    import networkx as nx
+    g = nx.DiGraph()
+    g.add_nodes_from(node_ids)
+    g.add_edges_from([(e[0], e[2]) for e in edges])
+    scale = 500
+    pos = nx.spring_layout(g, scale=scale)
+    return {n: [pos[n][0]+scale, pos[n][1]+scale] for n in pos}
+
+
+def reverse_script(code: str, layout: str = 'spring') -> ReversedScript:
+    """
+    Converts a rain script to the UI state, placing the nodes with the given layout
+    """
+    script = parse_script(code)
+    pos = get_layout([node.node_id for node in script.nodes], script.edges, layout)
+
+    nodes, custom_structures = [], {}
+    for node in script.nodes:
+        clazz = node.clazz
+        if node.clazz == 'CustomNode':
+            function = node.params["use_function"]
+            function_name = function.id if isinstance(function, ast.Name) else ast.literal_eval(function)
+            clazz = ''.join(x.capitalize() or '_' for x in function_name.split('_'))
+            if clazz not in custom_structures:
+                custom_function = script.functions[function_name]
+                ioparams = find_custom_node_params(custom_function, function_name)
+                custom_structures[clazz] = {"function_name": function_name, "clazz": clazz,
+                                            "code": ast.unparse(custom_function), "inputs": ioparams.inputs,
+                                            "outputs": ioparams.outputs, "params": ioparams.params}
+
+        params = []
+        for k, v in node.params.items():
+            if k == 'node_id' or (node.clazz == 'CustomNode' and k == 'use_function'):
+                continue
+            actual_param = {"key": k}
+            (val, t) = get_node_param_value_and_type(node.clazz, k, v)
+            actual_param["value"] = val
+            if t:
+                actual_param["type"] = t
+            params.append(actual_param)
+        nodes.append({"node": node.node_id, "clazz": clazz, "pos": pos[node.node_id], "params": params})
+
+    return ReversedScript(
+        nodes=nodes,
+        custom=list(custom_structures.values()),
+        edges=[{"from_node": e[0], "from_var": e[1], "to_node": e[2], "to_var": e[3]} for e in script.edges]
+    )
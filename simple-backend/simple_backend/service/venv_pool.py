@@ -0,0 +1,184 @@
+"""
+ Copyright (C) 2023 Università degli Studi di Camerino and Sigma S.p.A.
+ Authors: Alessandro Antinori, Rosario Capparuccia, Riccardo Coltrinari, Flavio Corradini, Marco Piangerelli, Barbara Re, Marco Scarpetta
+
+ This program is free software: you can redistribute it and/or modify
+ it under the terms of the GNU Affero General Public License as
+ published by the Free Software Foundation, either version 3 of the
+ License, or (at your option) any later version.
+
+ This program is distributed in the hope that it will be useful,
+ but WITHOUT ANY WARRANTY; without even the implied warranty of
+ MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+ GNU Affero General Public License for more details.
+
+ You should have received a copy of the GNU Affero General Public License
+ along with this program.  If not, see <https://www.gnu.org/licenses/>.
+ """
+
+import os
+import shutil
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import List, Optional
+from filelock import FileLock
+from virtualenv import cli_run
+from simple_backend import config
+from simple_backend.service import wheelhouse_service
+
+
+READY_DIR = "ready"
+BUILDING_DIR = "building"
+BUILD_TIMEOUT = 60 * 60
+# the interval between two checks doubles after each failed build, up to this many seconds
+MAX_BACKOFF = 60 * 60
+
+
+def _get_dir(name: str) -> Path:
+    path = config.VENV_POOL_DIR / name
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+
+
+def _get_age(path: Path) -> float:
+    try:
+        return time.time() - path.stat().st_mtime
+    except OSError:
+        return 0
+
+
+def get_ready_venvs() -> List[Path]:
+    """
+    Returns the ready virtual environments, the oldest first
+    """
+    return sorted(_get_dir(READY_DIR).iterdir(), key=lambda p: -_get_age(p))
+
+
+def is_enabled() -> bool:
+    """
+    Returns True if the pool has a size and is on the same file system of config.VENV_CACHE_DIR, since the virtual
+    environments are leased moving them
+    """
+    if config.VENV_POOL_SIZE <= 0:
+        return False
+    config.VENV_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    return _get_dir(READY_DIR).stat().st_dev == config.VENV_CACHE_DIR.stat().st_dev
+
+
+def lease(destination: Path) -> bool:
+    """
+    Moves a ready virtual environment, with config.RAIN_REQUIREMENT installed, to the destination.
+    Returns False if none is available. The pool and the destination must be on the same file system.
+    """
+    if not is_enabled():
+        return False
+    for venv in get_ready_venvs():
+        if _get_age(venv) > config.VENV_POOL_MAX_IDLE:
+            continue
+        try:
+            os.rename(venv, destination)
+        except FileNotFoundError:
+            # another worker leased it in the meanwhile
+            continue
+        except OSError as e:
+            print(f'Lease of the pooled virtual environment failed: {e}')
+            return False
+        manager.wake_up()
+        return True
+    return False
+
+
+def build_venv(name: str) -> bool:
+    """
+    Creates a virtual environment with config.RAIN_REQUIREMENT installed and moves it among the ready ones.
+    Returns False if the creation failed.
+    """
+    path = _get_dir(BUILDING_DIR) / name
+    try:
+        session = cli_run([str(path)])
+        wheelhouse_service.install(str(session.creator.exe), [config.RAIN_REQUIREMENT])
+        os.rename(path, _get_dir(READY_DIR) / name)
+        os.utime(_get_dir(READY_DIR) / name)
+        return True
+    except Exception as e:
+        print(f'Creation of the pooled virtual environment failed: {e}')
+        shutil.rmtree(path, ignore_errors=True)
+        return False
+
+
+def get_check_interval(failures: int) -> float:
+    """
+    Returns the seconds to wait before the next check of the pool after the given number of consecutive failed builds
+    """
+    return min(config.VENV_POOL_CHECK_INTERVAL * 2 ** failures, max(MAX_BACKOFF, config.VENV_POOL_CHECK_INTERVAL))
+
+
+class VenvPoolManager:
+    """
+    Keeps config.VENV_POOL_SIZE virtual environments ready to be leased, building at most
+    config.VENV_POOL_REFILL_CONCURRENCY of them at a time and replacing the ones idle for more than
+    config.VENV_POOL_MAX_IDLE seconds. The pool is shared by all the workers through the file system. After a failed
+    build, e.g. if rain can't be downloaded, the pool is checked less often.
+    """
+
+    def __init__(self):
+        self._thread: Optional[threading.Thread] = None
+        self._wake_up = threading.Event()
+        self._builds = []
+
+    def start(self) -> None:
+        if self._thread is not None or config.VENV_POOL_SIZE <= 0:
+            return
+        if not is_enabled():
+            print(f'The pool of virtual environments is disabled since {config.VENV_POOL_DIR} is not on the '
+                  f'same file system of {config.VENV_CACHE_DIR}')
+            return
+        self._thread = threading.Thread(target=self._run, name="venv-pool", daemon=True)
+        self._thread.start()
+
+    def wake_up(self) -> None:
+        self._wake_up.set()
+
+    def _run(self) -> None:
+        failures = 0
+        with ThreadPoolExecutor(max_workers=max(config.VENV_POOL_REFILL_CONCURRENCY, 1)) as executor:
+            while True:
+                builds = []
+                for build in self._builds:
+                    if not build.done():
+                        builds.append(build)
+                    else:
+                        failures = 0 if build.result() else failures + 1
+                self._builds = builds
+                for name in self.refill():
+                    self._builds.append(executor.submit(build_venv, name))
+                self._wake_up.wait(get_check_interval(failures))
+                self._wake_up.clear()
+
+    def refill(self) -> List[str]:
+        """
+        Removes the expired virtual environments and reserves the names of the ones to build
+        """
+        with FileLock(str(config.VENV_POOL_DIR / ".lock")):
+            for venv in get_ready_venvs():
+                if _get_age(venv) > config.VENV_POOL_MAX_IDLE:
+                    shutil.rmtree(venv, ignore_errors=True)
+            building = []
+            for venv in _get_dir(BUILDING_DIR).iterdir():
+                if _get_age(venv) > BUILD_TIMEOUT:
+                    shutil.rmtree(venv, ignore_errors=True)
+                else:
+                    building.append(venv)
+
+            available = len(get_ready_venvs()) + len(building)
+            concurrency = config.VENV_POOL_REFILL_CONCURRENCY - len(self._builds)
+            names = [uuid.uuid4().hex for _ in range(min(config.VENV_POOL_SIZE - available, concurrency))]
+            for name in names:
+                (_get_dir(BUILDING_DIR) / name).mkdir()
+            return names
+
+
+manager = VenvPoolManager()
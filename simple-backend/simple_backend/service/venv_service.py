@@ -0,0 +1,288 @@
+"""
+ Copyright (C) 2023 Università degli Studi di Camerino and Sigma S.p.A.
+ Authors: Alessandro Antinori, Rosario Capparuccia, Riccardo Coltrinari, Flavio Corradini, Marco Piangerelli, Barbara Re, Marco Scarpetta
+
+ This program is free software: you can redistribute it and/or modify
+ it under the terms of the GNU Affero General Public License as
+ published by the Free Software Foundation, either version 3 of the
+ License, or (at your option) any later version.
+
+ This program is distributed in the hope that it will be useful,
+ but WITHOUT ANY WARRANTY; without even the implied warranty of
+ MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+ GNU Affero General Public License for more details.
+
+ You should have received a copy of the GNU Affero General Public License
+ along with this program.  If not, see <https://www.gnu.org/licenses/>.
+ """
+
+import hashlib
+import json
+import os
+import platform
+import re
+import shutil
+import sys
+import time
+import uuid
+from contextlib import contextmanager
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Iterator, List, Optional
+from filelock import FileLock, Timeout
+from virtualenv import cli_run
+from simple_backend import config
+from simple_backend.errors import BadRequestError, VenvInUseError
+from simple_backend.service import venv_pool, wheelhouse_service
+
+
+ENTRY_FILE = "entry.json"
+LEASES_DIR = "leases"
+LOCKS_DIR = ".locks"
+
+
+@dataclass
+class VenvLease:
+    key: str
+    path: Path
+    cached: bool
+    lease_file: Path
+    install_time: float = 0.0
+
+
+def get_venv_scripts_dir() -> str:
+    """
+    Returns the name of the directory containing the executables of a virtual environment
+    """
+    if str(os.name).lower() == "nt":
+        return "Scripts"
+    elif str(os.name).lower() == "posix":
+        return "bin"
+    else:
+        raise BadRequestError("unsupported OS")
+
+
+def get_venv_executable(venv: Path, name: str) -> str:
+    """
+    Returns the path of the given executable (e.g. python, pip) within the virtual environment
+    """
+    return str(Path(venv) / get_venv_scripts_dir() / name)
+
+
+def get_python_version() -> str:
+    return f"{platform.python_implementation()}-{'.'.join(str(v) for v in sys.version_info[:3])}"
+
+
+def normalize_requirements(dependencies: Optional[List[str]]) -> List[str]:
+    """
+    Strips, de-duplicates and sorts the given requirements, ignoring blank lines and comments
+    """
+    requirements = {d.strip() for d in dependencies or [] if d.strip() and not d.strip().startswith('#')}
+    return sorted(requirements, key=str.lower)
+
+
+def get_cache_key(dependencies: Optional[List[str]]) -> str:
+    """
+    Returns the key of the cached virtual environment for the given dependencies and the current interpreter
+    """
+    payload = json.dumps({"python": get_python_version(), "requirements": normalize_requirements(dependencies)})
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def _get_lock(name: str) -> FileLock:
+    locks_dir = config.VENV_CACHE_DIR / LOCKS_DIR
+    locks_dir.mkdir(parents=True, exist_ok=True)
+    return FileLock(str(locks_dir / f"{name}.lock"))
+
+
+def _read_entry(entry_path: Path) -> Optional[dict]:
+    try:
+        with (entry_path / ENTRY_FILE).open() as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_entry(entry_path: Path, entry: dict) -> None:
+    tmp_file = entry_path / f"{ENTRY_FILE}.{uuid.uuid4().hex}"
+    with tmp_file.open('w') as f:
+        json.dump(entry, f)
+    os.replace(tmp_file, entry_path / ENTRY_FILE)
+
+
+def _get_dir_size(path: Path) -> int:
+    size = 0
+    for root, _, files in os.walk(path):
+        for file in files:
+            try:
+                size += os.lstat(os.path.join(root, file)).st_size
+            except OSError:
+                pass
+    return size
+
+
+def _get_active_leases(entry_path: Path) -> List[Path]:
+    """
+    Returns the leases of a cached environment, removing the ones older than the configured timeout
+    """
+    leases_path = entry_path / LEASES_DIR
+    if not leases_path.is_dir():
+        return []
+    active = []
+    for lease in leases_path.iterdir():
+        try:
+            if time.time() - lease.stat().st_mtime > config.VENV_CACHE_LEASE_TIMEOUT:
+                lease.unlink()
+            else:
+                active.append(lease)
+        except OSError:
+            pass
+    return active
+
+
+def _build_entry(key: str, entry_path: Path, requirements: List[str]) -> float:
+    """
+    Creates the virtual environment in a temporary directory and moves it in place only if the installation succeeded.
+    If the requirements include rain, a pre-warmed virtual environment is leased from the pool when available.
+    Returns the seconds spent installing the requirements.
+    """
+    shutil.rmtree(entry_path, ignore_errors=True)
+    entry_path.mkdir(parents=True)
+    requirements_file = entry_path / "requirements.txt"
+    requirements_file.write_text("\n".join(requirements))
+    tmp_venv = entry_path / f"venv.{uuid.uuid4().hex}"
+    try:
+        if config.RAIN_REQUIREMENT in requirements and venv_pool.lease(tmp_venv):
+            extras = [r for r in requirements if r != config.RAIN_REQUIREMENT]
+        else:
+            cli_run([str(tmp_venv)])
+            extras = requirements
+        install_start = time.monotonic()
+        wheelhouse_service.install(get_venv_executable(tmp_venv, "python"), extras)
+        install_time = time.monotonic() - install_start
+        os.replace(tmp_venv, entry_path / "venv")
+    except Exception:
+        shutil.rmtree(entry_path, ignore_errors=True)
+        raise
+
+    now = time.time()
+    _write_entry(entry_path, {"key": key, "python": get_python_version(), "requirements": requirements,
+                              "size": _get_dir_size(entry_path / "venv"), "created_at": now, "last_used": now})
+    return install_time
+
+
+def acquire_venv(dependencies: Optional[List[str]]) -> VenvLease:
+    """
+    Returns a virtual environment with the given dependencies installed, reusing the cached one if available.
+    The environment can't be evicted until the lease is released.
+    """
+    key = get_cache_key(dependencies)
+    entry_path = config.VENV_CACHE_DIR / key
+    lease_file = entry_path / LEASES_DIR / f"{os.getpid()}-{uuid.uuid4().hex}"
+
+    install_time = 0.0
+    with _get_lock(key):
+        entry = _read_entry(entry_path)
+        cached = entry is not None and (entry_path / "venv").is_dir()
+        if not cached:
+            install_time = _build_entry(key, entry_path, normalize_requirements(dependencies))
+            entry = _read_entry(entry_path)
+        lease_file.parent.mkdir(exist_ok=True)
+        lease_file.touch()
+        entry["last_used"] = time.time()
+        _write_entry(entry_path, entry)
+
+    return VenvLease(key=key, path=entry_path / "venv", cached=cached, lease_file=lease_file,
+                     install_time=install_time)
+
+
+def release_venv(lease: VenvLease) -> None:
+    """
+    Releases the lease on the virtual environment and evicts the cache entries exceeding the limits
+    """
+    try:
+        lease.lease_file.unlink()
+    except OSError:
+        pass
+    evict()
+
+
+@contextmanager
+def lease_venv(dependencies: Optional[List[str]]) -> Iterator[VenvLease]:
+    """
+    Yields a leased virtual environment with the given dependencies installed, releasing it on exit
+    """
+    lease = acquire_venv(dependencies)
+    try:
+        yield lease
+    finally:
+        release_venv(lease)
+
+
+def list_entries() -> List[dict]:
+    """
+    Returns the cached virtual environments, the most recently used first
+    """
+    if not config.VENV_CACHE_DIR.is_dir():
+        return []
+    entries = []
+    for entry_path in config.VENV_CACHE_DIR.iterdir():
+        if entry_path.name == LOCKS_DIR or not entry_path.is_dir():
+            continue
+        entry = _read_entry(entry_path)
+        if entry is not None:
+            entry["leases"] = len(_get_active_leases(entry_path))
+            entries.append(entry)
+    return sorted(entries, key=lambda e: e["last_used"], reverse=True)
+
+
+def _remove_entry(key: str) -> bool:
+    """
+    Removes the cached environment if it is not leased nor being built. Returns whether it has been removed.
+    """
+    entry_path = config.VENV_CACHE_DIR / key
+    lock = _get_lock(key)
+    try:
+        lock.acquire(timeout=0)
+    except Timeout:
+        return False
+    try:
+        if _get_active_leases(entry_path):
+            return False
+        shutil.rmtree(entry_path, ignore_errors=True)
+    finally:
+        lock.release()
+    return True
+
+
+def evict() -> List[str]:
+    """
+    Removes the least recently used environments until the cache respects the configured limits
+    """
+    evicted = []
+    with _get_lock("cache"):
+        entries = list_entries()
+        max_size = config.VENV_CACHE_MAX_SIZE_MB * 1024 * 1024
+        total_size = sum(e["size"] for e in entries)
+        for entry in reversed(entries):
+            if len(entries) - len(evicted) <= config.VENV_CACHE_MAX_ENTRIES and total_size <= max_size:
+                break
+            if entry["leases"] == 0 and _remove_entry(entry["key"]):
+                evicted.append(entry["key"])
+                total_size -= entry["size"]
+    return evicted
+
+
+def purge(key: Optional[str] = None) -> List[str]:
+    """
+    Removes the given cached environment or all the ones that are not in use
+    """
+    with _get_lock("cache"):
+        if key is None:
+            return [e["key"] for e in list_entries() if e["leases"] == 0 and _remove_entry(e["key"])]
+
+        if not re.fullmatch(r'[0-9a-f]{64}', key) or _read_entry(config.VENV_CACHE_DIR / key) is None:
+            raise BadRequestError(f"Virtual environment {key} does not exists!")
+        if not _remove_entry(key):
+            raise VenvInUseError(f"Virtual environment {key} is in use!")
+        return [key]
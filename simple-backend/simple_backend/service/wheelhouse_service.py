@@ -0,0 +1,167 @@
+"""
+ Copyright (C) 2023 Università degli Studi di Camerino and Sigma S.p.A.
+ Authors: Alessandro Antinori, Rosario Capparuccia, Riccardo Coltrinari, Flavio Corradini, Marco Piangerelli, Barbara Re, Marco Scarpetta
+
+ This program is free software: you can redistribute it and/or modify
+ it under the terms of the GNU Affero General Public License as
+ published by the Free Software Foundation, either version 3 of the
+ License, or (at your option) any later version.
+
+ This program is distributed in the hope that it will be useful,
+ but WITHOUT ANY WARRANTY; without even the implied warranty of
+ MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+ GNU Affero General Public License for more details.
+
+ You should have received a copy of the GNU Affero General Public License
+ along with this program.  If not, see <https://www.gnu.org/licenses/>.
+ """
+
+import argparse
+import json
+import re
+import subprocess
+import sys
+import tempfile
+import zipfile
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+from filelock import FileLock
+from simple_backend import config
+from simple_backend.errors import BadRequestError, VenvCreationError
+
+
+STATS_FILE = "stats.json"
+
+
+def canonicalize_name(name: str) -> str:
+    return re.sub(r"[-_.]+", "-", name).lower()
+
+
+def get_requirement_name(requirement: str) -> Optional[str]:
+    """
+    Returns the canonical name of the distribution of a requirement, also for the direct URL ones having an #egg
+    """
+    requirement = requirement.strip()
+    if egg := re.search(r"#egg=([A-Za-z0-9._-]+)", requirement):
+        return canonicalize_name(egg.group(1))
+    if "://" in requirement:
+        return None
+    if name := re.match(r"[A-Za-z0-9][A-Za-z0-9._-]*", requirement):
+        return canonicalize_name(name.group(0))
+    return None
+
+
+def _get_lock() -> FileLock:
+    config.WHEELHOUSE_DIR.mkdir(parents=True, exist_ok=True)
+    return FileLock(str(config.WHEELHOUSE_DIR / ".lock"))
+
+
+def get_wheels() -> Dict[str, List[str]]:
+    """
+    Returns the wheel files in the wheelhouse grouped by canonical distribution name
+    """
+    wheels = {}
+    if config.WHEELHOUSE_DIR.is_dir():
+        for wheel in sorted(config.WHEELHOUSE_DIR.glob("*.whl")):
+            wheels.setdefault(canonicalize_name(wheel.name.split("-")[0]), []).append(wheel.name)
+    return wheels
+
+
+def get_offline_requirements(requirements: Iterable[str]) -> Optional[List[str]]:
+    """
+    Returns the requirements to install from the wheelhouse only, with the direct URLs replaced by the distribution
+    names, or None if some of them are not in the wheelhouse
+    """
+    wheels = get_wheels()
+    offline_requirements = []
+    for requirement in requirements:
+        name = get_requirement_name(requirement)
+        if name is None or name not in wheels:
+            return None
+        offline_requirements.append(name if "://" in requirement else requirement.strip())
+    return offline_requirements
+
+
+def get_stats() -> dict:
+    try:
+        with (config.WHEELHOUSE_DIR / STATS_FILE).open() as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {"hits": 0, "misses": 0}
+
+
+def _record(outcome: str) -> None:
+    with _get_lock():
+        stats = get_stats()
+        stats[outcome] = stats.get(outcome, 0) + 1
+        with (config.WHEELHOUSE_DIR / STATS_FILE).open('w') as f:
+            json.dump(stats, f)
+
+
+def install(python: str, requirements: List[str]) -> None:
+    """
+    Installs the requirements with the given interpreter. If all of them are in the wheelhouse, the index is not
+    contacted; otherwise the wheelhouse is used together with the index.
+    """
+    requirements = [r.strip() for r in requirements if r.strip() and not r.strip().startswith('#')]
+    if not requirements:
+        return
+    find_links = ["--find-links", str(config.WHEELHOUSE_DIR)] if config.WHEELHOUSE_DIR.is_dir() else []
+
+    if (offline_requirements := get_offline_requirements(requirements)) is not None:
+        result = subprocess.run([python, "-m", "pip", "install", "--no-index", *find_links, *offline_requirements])
+        if result.returncode == 0:
+            _record("hits")
+            return
+    _record("misses")
+
+    result = subprocess.run([python, "-m", "pip", "install", *find_links, *requirements])
+    if result.returncode != 0:
+        raise VenvCreationError(f"Installation of the requirements failed with exit code {result.returncode}")
+
+
+def warm(requirements: Iterable[str]) -> List[str]:
+    """
+    Builds the wheels of the requirements, and of their dependencies, in the wheelhouse. Returns the added wheels.
+    """
+    requirements = sorted({r.strip() for r in requirements if r.strip() and not r.strip().startswith('#')})
+    if not requirements:
+        return []
+    with _get_lock():
+        before = {w for ws in get_wheels().values() for w in ws}
+        with tempfile.TemporaryDirectory() as tmp:
+            requirements_file = Path(tmp) / "requirements.txt"
+            requirements_file.write_text("\n".join(requirements))
+            result = subprocess.run([sys.executable, "-m", "pip", "wheel", "--wheel-dir", str(config.WHEELHOUSE_DIR),
+                                     "--find-links", str(config.WHEELHOUSE_DIR), "-r", str(requirements_file)])
+        if result.returncode != 0:
+            raise VenvCreationError(f"Build of the wheels failed with exit code {result.returncode}")
+        return sorted({w for ws in get_wheels().values() for w in ws} - before)
+
+
+def get_repositories_requirements(repositories: Optional[List[str]] = None) -> List[str]:
+    """
+    Returns the requirements of all the Dataflows in the given repositories, by default all the repositories. Only the
+    names of the repositories are accepted, not paths to other directories.
+    """
+    names = [p.name for p in config.BASE_OUTPUT_DIR.iterdir() if p.is_dir() and p != config.ARCHIVE_DIR]
+    if repositories is None:
+        repositories = names
+    requirements = set()
+    for repository in repositories:
+        if repository not in names:
+            raise BadRequestError(f"Repository {repository} does not exists!")
+        repo_path = config.BASE_OUTPUT_DIR / repository
+        for dataflow_path in repo_path.glob("*.zip"):
+            with zipfile.ZipFile(dataflow_path) as dataflow:
+                if 'requirements.txt' in dataflow.namelist():
+                    requirements.update(dataflow.read('requirements.txt').decode().splitlines())
+    return sorted(requirements)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Builds the wheelhouse from the requirements of the Dataflows")
+    parser.add_argument("repositories", nargs="*", help="the repositories to consider, by default all of them")
+    args = parser.parse_args()
+    added = warm(get_repositories_requirements(args.repositories or None))
+    print(f"{len(added)} wheels added to {config.WHEELHOUSE_DIR}")
@@ -0,0 +1,156 @@
+"""
+ Copyright (C) 2023 Università degli Studi di Camerino and Sigma S.p.A.
+ Authors: Alessandro Antinori, Rosario Capparuccia, Riccardo Coltrinari, Flavio Corradini, Marco Piangerelli, Barbara Re, Marco Scarpetta
+
+ This program is free software: you can redistribute it and/or modify
+ it under the terms of the GNU Affero General Public License as
+ published by the Free Software Foundation, either version 3 of the
+ License, or (at your option) any later version.
+
+ This program is distributed in the hope that it will be useful,
+ but WITHOUT ANY WARRANTY; without even the implied warranty of
+ MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+ GNU Affero General Public License for more details.
+
+ You should have received a copy of the GNU Affero General Public License
+ along with this program.  If not, see <https://www.gnu.org/licenses/>.
+ """
+
+import asyncio
+import json
+import os
+import tempfile
+import uuid
+from pathlib import Path
+from typing import Dict, List, Optional, Set, Tuple
+from starlette.concurrency import run_in_threadpool
+from simple_backend import config
+from simple_backend.service import venv_service
+
+
+ZYGOTE_SCRIPT = Path(__file__).resolve().parent.parent / "runner" / "zygote.py"
+MARKER = b"\x00rainfall-zygote:"
+
+
+def is_supported() -> bool:
+    return os.name == "posix" and hasattr(os, "fork")
+
+
+class Zygote:
+    """
+    A warm runner process started with the interpreter of a virtual environment, see runner/zygote.py.
+    It holds a lease on the virtual environment until it exits.
+    """
+
+    def __init__(self, python: str):
+        self._python = python
+        self._socket_path = os.path.join(tempfile.gettempdir(), f"rainfall-{uuid.uuid4().hex[:16]}.sock")
+        self._process: Optional[asyncio.subprocess.Process] = None
+
+    @property
+    def alive(self) -> bool:
+        return self._process is not None and self._process.returncode is None
+
+    async def start(self) -> None:
+        self._process = await asyncio.create_subprocess_exec(
+            self._python, str(ZYGOTE_SCRIPT), self._socket_path, "--preload", config.WARM_RUNNER_PRELOAD,
+            "--idle-timeout", str(config.WARM_RUNNER_IDLE_TIMEOUT),
+            "--max-memory", str(config.WARM_RUNNER_MAX_MEMORY_MB),
+            stdout=asyncio.subprocess.PIPE, start_new_session=True)
+        try:
+            ready = await asyncio.wait_for(self._wait_ready(), config.WARM_RUNNER_START_TIMEOUT)
+        except asyncio.TimeoutError:
+            ready = False
+        if not ready:
+            self.stop()
+            raise RuntimeError("The warm runner didn't start")
+
+    async def _wait_ready(self) -> bool:
+        """
+        Skips the output of the preloaded modules until the readiness line of the runner, returning False if it exits
+        """
+        while True:
+            try:
+                line = await self._process.stdout.readline()
+            except ValueError:
+                # a line longer than the buffer, which is discarded
+                continue
+            if not line:
+                return False
+            if line.rstrip(b"\n") == MARKER + b"ready":
+                return True
+
+    async def wait(self) -> None:
+        await self._process.wait()
+
+    def stop(self) -> None:
+        if self.alive:
+            self._process.kill()
+        if os.path.exists(self._socket_path):
+            os.unlink(self._socket_path)
+
+    async def run(self, script: str, cwd: str,
+                  limits: Dict[str, int] = None) -> Tuple[asyncio.StreamReader, asyncio.StreamWriter]:
+        """
+        Runs the script in a child of the runner, returning the connection from which its output is read
+        """
+        reader, writer = await asyncio.open_unix_connection(self._socket_path, limit=config.EXECUTION_FRAME_SIZE * 2)
+        writer.write(json.dumps({"script": script, "cwd": cwd, "limits": limits or {}}).encode() + b"\n")
+        await writer.drain()
+        return reader, writer
+
+
+class ZygoteManager:
+    """
+    Keeps a warm runner for each virtual environment used by the warm executions of the worker. A runner exits by
+    itself after config.WARM_RUNNER_IDLE_TIMEOUT seconds without executions or once its memory exceeds
+    config.WARM_RUNNER_MAX_MEMORY_MB, and is restarted when needed.
+    """
+
+    def __init__(self):
+        self._zygotes: Dict[str, Zygote] = {}
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self._releases: Set[asyncio.Task] = set()
+
+    async def run(self, dependencies: Optional[List[str]], script: str, cwd: str,
+                  limits: Dict[str, int] = None) -> Tuple[asyncio.StreamReader, asyncio.StreamWriter]:
+        key = venv_service.get_cache_key(dependencies)
+        lock = self._locks.setdefault(key, asyncio.Lock())
+        async with lock:
+            zygote = self._zygotes.get(key)
+            if zygote is not None and zygote.alive:
+                try:
+                    return await zygote.run(script, cwd, limits)
+                except OSError:
+                    # the runner stopped accepting executions
+                    pass
+            zygote = await self._start(dependencies)
+            self._zygotes[key] = zygote
+            return await zygote.run(script, cwd, limits)
+
+    async def _start(self, dependencies: Optional[List[str]]) -> Zygote:
+        venv = await run_in_threadpool(venv_service.acquire_venv, dependencies)
+        zygote = Zygote(venv_service.get_venv_executable(venv.path, "python"))
+        try:
+            await zygote.start()
+        except Exception:
+            await run_in_threadpool(venv_service.release_venv, venv)
+            raise
+
+        async def release():
+            await zygote.wait()
+            await run_in_threadpool(venv_service.release_venv, venv)
+        task = asyncio.ensure_future(release())
+        self._releases.add(task)
+        task.add_done_callback(self._releases.discard)
+        return zygote
+
+    async def stop(self) -> None:
+        for zygote in self._zygotes.values():
+            zygote.stop()
+        self._zygotes.clear()
+        if self._releases:
+            await asyncio.wait(self._releases)
+
+
+manager = ZygoteManager()
@@ -17,82 +17,163 @@
  """
 
 import asyncio
-from fastapi import APIRouter, WebSocket
-import re
-import subprocess
-import os
-from virtualenv import cli_run
+import time
+from pathlib import Path
+from typing import Iterator, List
+from fastapi import APIRouter, WebSocket, status
+from starlette.concurrency import run_in_threadpool
+from simple_backend import config as app_config
 from simple_backend.errors import BadRequestError
+from simple_backend.schemas.execution import ExecutionMetricsMessage
 from simple_backend.schemas.nodes import ConfigurationSchema
-from simple_backend.service import config_service
+from simple_backend.service.execution_service import ExecutionJob, FINAL_STATUSES, JobStatus, scheduler
+from simple_backend.service.log_store import ExecutionLog
+from simple_backend.service.output_channel import OutputChannel, OverflowPolicy
 
 
 router = APIRouter()
 
+LOG_PAGE_SIZE = 1000
+
+
+def join_frames(lines: List[str], max_size: int) -> Iterator[str]:
+    """
+    Joins the lines in frames of at most max_size characters, unless a single line is longer
+    """
+    frame, frame_size = [], 0
+    for line in lines:
+        if frame and frame_size + len(line) > max_size:
+            yield "".join(frame)
+            frame, frame_size = [], 0
+        frame.append(line)
+        frame_size += len(line)
+    if frame:
+        yield "".join(frame)
+
+
+def get_metrics_message(job: ExecutionJob, final: bool) -> str:
+    return ExecutionMetricsMessage(id=job.id, final=final, metrics=job.metrics, profile=job.profile,
+                                   checkpoints=job.checkpoints).json()
+
+
+def get_record_metrics_message(record: dict, final: bool) -> str:
+    return ExecutionMetricsMessage(id=record["id"], final=final, metrics=record.get("metrics", {}),
+                                   profile=record.get("profile", {}), checkpoints=record.get("checkpoints", {})).json()
+
+
+async def send_frames(ws: WebSocket, job: ExecutionJob, subscriber: OutputChannel, metrics: bool) -> None:
+    """
+    Sends the frames of the subscriber until the execution is over and, if metrics is true, the resources used by the
+    running execution every config.EXECUTION_METRICS_INTERVAL seconds. Both are sent by this task, since a WebSocket
+    can't be written by two tasks at once.
+    """
+    loop = asyncio.get_running_loop()
+    metrics_sent_at = loop.time()
+    frame_task = asyncio.ensure_future(subscriber.get_frame(app_config.EXECUTION_FRAME_SIZE,
+                                                            app_config.EXECUTION_FRAME_INTERVAL))
+    try:
+        while True:
+            timeout = max(metrics_sent_at + app_config.EXECUTION_METRICS_INTERVAL - loop.time(), 0) if metrics \
+                else None
+            await asyncio.wait({frame_task}, timeout=timeout)
+            if frame_task.done():
+                if (frame := frame_task.result()) is None:
+                    return
+                await ws.send_text(frame)
+                frame_task = asyncio.ensure_future(subscriber.get_frame(app_config.EXECUTION_FRAME_SIZE,
+                                                                        app_config.EXECUTION_FRAME_INTERVAL))
+            if metrics and job.status not in FINAL_STATUSES and \
+                    loop.time() - metrics_sent_at >= app_config.EXECUTION_METRICS_INTERVAL:
+                await ws.send_text(get_metrics_message(job, False))
+                metrics_sent_at = loop.time()
+    finally:
+        frame_task.cancel()
+
+
+async def follow_log(ws: WebSocket, record: dict, offset: int = None, metrics: bool = False) -> None:
+    """
+    Streams the output of an execution run by another worker, reading its log every config.EXECUTION_POLL_INTERVAL
+    seconds until the execution is over
+    """
+    directory = Path(record["directory"])
+    log = await run_in_threadpool(ExecutionLog.load, directory)
+    start = max(log.line_count - app_config.EXECUTION_REPLAY_LINES, 0) if offset is None else max(offset, 0)
+    metrics_sent_at = time.monotonic()
+    while True:
+        over = JobStatus(record["status"]) in FINAL_STATUSES
+        log = await run_in_threadpool(ExecutionLog.load, directory)
+        while lines := await run_in_threadpool(log.read, start, LOG_PAGE_SIZE):
+            start += len(lines)
+            for frame in join_frames(lines, app_config.EXECUTION_FRAME_SIZE):
+                await ws.send_text(frame)
+        if over:
+            break
+        if metrics and time.monotonic() - metrics_sent_at >= app_config.EXECUTION_METRICS_INTERVAL:
+            await ws.send_text(get_record_metrics_message(record, False))
+            metrics_sent_at = time.monotonic()
+        await asyncio.sleep(app_config.EXECUTION_POLL_INTERVAL)
+        record = await scheduler.get_record(record["id"])
+    if metrics:
+        await ws.send_text(get_record_metrics_message(record, True))
+
 
 @router.websocket("")
-async def handle_execution(ws: WebSocket):
+async def handle_execution(ws: WebSocket, job_id: str = None, offset: int = None, overflow: OverflowPolicy = None,
+                           metrics: bool = False):
+    """
+    Submits the Dataflow received as first message and streams the output of its execution, coalesced in frames of
+    at most config.EXECUTION_FRAME_SIZE characters or config.EXECUTION_FRAME_INTERVAL seconds.
+    If job_id is given, the output of the already submitted execution is streamed instead, starting from the given
+    line offset or, by default, from the lines kept in memory. The output of an execution submitted to another worker
+    is read from its log.
+    The overflow policy applied when the client can't keep up defaults to config.EXECUTION_OVERFLOW_POLICY.
+    If metrics is true, the resources used by the execution, the profile of its nodes and which of them were loaded
+    from a checkpoint, when requested, are also sent periodically and once it is over as JSON messages of type
+    "metrics".
+    """
     await ws.accept()
-    # TODO: Send ws exception message in case of error
-    message = await ws.receive_json()
-    await ws.send_text('Request received')
-    await asyncio.sleep(0.001)
-    config = ConfigurationSchema.parse_obj(message)
-    nodes = config.nodes
-    path = config.path
-
-    await ws.send_text('Request accepted')
-    await asyncio.sleep(0.001)
-
-    script = config_service.generate_script(nodes)
-
-    if not os.path.isdir(path):
-        os.mkdir(path)
-    with open(os.path.join(path, "script.py"), "w+") as sp:
-        sp.write(script)
-    with open(os.path.join(path, "requirements.txt"), "w+") as req:
-        req.write("\n".join(config.dependencies))
-    with open(os.path.join(path, "ui.json"), "w+") as ui:
-        ui.write(config.ui.json(separators=(',', ':')))
-
-    await ws.send_text('Files written')
-    await asyncio.sleep(0.001)
-
-    venv_loc = os.path.join(path, "venv")
-    cli_run([venv_loc])
-
-    await ws.send_text('Created virtual environment')
-    await asyncio.sleep(0.001)
-
-    if str(os.name).lower() == "nt":
-        venv_scripts_loc = "Scripts"
-    elif str(os.name).lower() == "posix":
-        venv_scripts_loc = "bin"
+    if job_id is None:
+        message = await ws.receive_json()
+        await ws.send_text('Request received')
+        config = ConfigurationSchema.parse_obj(message)
+        job = await scheduler.submit(config)
+
+        await ws.send_text('Request accepted')
+        job_id = job.id
     else:
-        raise BadRequestError("unsupported OS")
-
-    await ws.send_text('Installing requirements')
-    await asyncio.sleep(0.001)
-    pip_loc = os.path.join(venv_loc, venv_scripts_loc, 'pip')
-    os.chdir(path)
-    os.system(pip_loc + " install -r requirements.txt")
-
-    await ws.send_text('Requirements installed')
-    await asyncio.sleep(0.001)
-
-    cmd = [os.path.join(venv_loc, venv_scripts_loc, "python"), "script.py"]
-    process = subprocess.Popen(cmd, stdout=subprocess.PIPE, cwd=path, universal_newlines=True, bufsize=1)
-    await ws.send_text('Started process')
-    await asyncio.sleep(0.001)
-    lines = []
-    while True:
-        output = process.stdout.readline()
-        if output == '' and process.poll() is not None:
-            break
-        if output:
-            output = re.sub(u'\u001b\[.*?[@-~]', '', output)
-            await ws.send_text(output)
-            await asyncio.sleep(0.001)
-            line = output.strip().split("|")
-            lines.append(line)
-            print(line)
+        job = scheduler.get_local(job_id)
+    try:
+        record = await scheduler.get_record(job_id)
+    except BadRequestError as e:
+        await ws.send_text(e.msg)
+        await ws.close(status.WS_1008_POLICY_VIOLATION)
+        return
+
+    if position := record["position"]:
+        await ws.send_text(f'Execution {job_id} queued at position {position}')
+    else:
+        await ws.send_text(f'Execution {job_id} {record["status"]}')
+
+    if job is None:
+        await follow_log(ws, record, offset, metrics)
+        await ws.close()
+        return
+
+    start = job.log.tail_offset if offset is None else max(offset, 0)
+    end = job.log.line_count
+    subscriber = job.subscribe(overflow or OverflowPolicy(app_config.EXECUTION_OVERFLOW_POLICY))
+    try:
+        while start < end:
+            lines = await run_in_threadpool(job.log.read, start, min(end - start, LOG_PAGE_SIZE))
+            if not lines:
+                break
+            start += len(lines)
+            for frame in join_frames(lines, app_config.EXECUTION_FRAME_SIZE):
+                await ws.send_text(frame)
+
+        await send_frames(ws, job, subscriber, metrics)
+    finally:
+        job.unsubscribe(subscriber)
+    if metrics:
+        await ws.send_text(get_metrics_message(job, True))
+    await ws.close()
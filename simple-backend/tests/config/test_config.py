@@ -18,8 +18,13 @@
 
 import pytest
 import json
+import zipfile
+from pathlib import Path
+from simple_backend import config
 from simple_backend.config import here
 from simple_backend.controller.config_api import ConfigResponse
+from simple_backend.schemas.nodes import UI
+from simple_backend.service import config_service
 from tests.create_test_client import create_test_client, setup_dirs
 
 
@@ -48,3 +53,37 @@ class TestConfig:
             ConfigResponse.parse_obj(response.json())
         except:
             pytest.fail()
+
+    def test_generate_artifacts(self, config_json):
+        response = client.post('/api/v1/config', json=config_json).json()
+        repo_path = config.BASE_OUTPUT_DIR / config_json["repository"]
+        assert [path.name for path in repo_path.iterdir()] == [f'{response["id"]}.zip']
+        with zipfile.ZipFile(repo_path / f'{response["id"]}.zip') as zip_file:
+            assert zip_file.testzip() is None
+            assert zip_file.namelist() == ["script.py", "requirements.txt", "metadata.yml", "ui.json"]
+            assert zip_file.read("ui.json").decode() == UI.parse_obj(config_json["ui"]).json()
+
+    def test_generate_artifacts_error(self, config_json, monkeypatch):
+        def fail(fd):
+            raise OSError("disk full")
+
+        monkeypatch.setattr(config_service.os, "fsync", fail)
+        response = client.post('/api/v1/config', json=config_json)
+        assert response.status_code == 500
+        assert list(Path(config.BASE_OUTPUT_DIR / config_json["repository"]).iterdir()) == []
+
+    def test_convert_isolated_node(self, config_json):
+        isolated = {"node_id": "Isolated1", "node": "rain.nodes.sklearn.functions.TrainTestDatasetSplit",
+                    "parameters": {}}
+        response = client.post('/api/v1/config/convert', json=config_json["nodes"] + [isolated])
+        assert response.status_code == 200
+        assert 'Isolated1 = sr.TrainTestDatasetSplit(' in response.json()
+
+    def test_convert_cycle(self, config_json):
+        nodes = config_json["nodes"]
+        nodes[-1]["then"] = [{"to_node": "TrainTestDatasetSplit1", "from_port": "i1", "to_port": "dataset"}]
+        response = client.post('/api/v1/config/convert', json=nodes)
+        assert response.status_code == 400
+        assert response.json()["message"].endswith(
+            "DataFrameLengthCalculator1 -> SumOfNumbers1 -> EqualChecker1 -> TrainTestDatasetSplit1 -> "
+            "DataFrameLengthCalculator1")
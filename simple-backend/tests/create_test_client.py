@@ -24,6 +24,8 @@ from simple_backend import config
 
 
 def create_test_client():
+    config.RAIN_STRUCTURE_URL = config.here('fixtures/rain_structure.json')
+    config.CATALOGUE_DIR = Path(config.here('output_catalogue')).resolve()
     app = create_app(True)
     return TestClient(app)
 
@@ -39,6 +41,15 @@ def setup_dirs():
     archive_path = Path(base_path / ".archive").resolve()
     archive_path.mkdir(exist_ok=True)
     config.ARCHIVE_DIR = archive_path
+    config.REPOSITORY_INDEX_PATH = Path(config.here('output_repository_index.sqlite')).resolve()
+    config.REPOSITORY_LOCK_DIR = Path(config.here('output_repository_locks')).resolve()
+    config.EXECUTION_REGISTRY_PATH = Path(config.here('output_execution_registry.sqlite')).resolve()
+    for path in Path(config.here('.')).glob('output_execution_registry.sqlite*'):
+        path.unlink()
+
+    config.VENV_CACHE_DIR = Path(config.here('output_venv_cache')).resolve()
+    config.WHEELHOUSE_DIR = Path(config.here('output_wheelhouse')).resolve()
+    config.VENV_POOL_DIR = Path(config.here('output_venv_pool')).resolve()
 
     execution_path = Path(config.here('output_execution')).resolve()
     shutil.rmtree(execution_path, ignore_errors=True)
@@ -16,8 +16,10 @@
  along with this program.  If not, see <https://www.gnu.org/licenses/>.
  """
 
+import json
 import pytest
 import shutil
+import zipfile
 from simple_backend.config import here
 from simple_backend.schemas.dataflow import DataFlow
 from tests.create_test_client import create_test_client, setup_dirs
@@ -52,3 +54,77 @@ class TestDataFlow:
         response = client.get('/api/v1/repositories/test_repo').json()['content']
         assert type(response) == list
         assert len(response) == 0
+
+    def test_list_dataflows(self):
+        with open(here('../fixtures/config.json')) as f:
+            config_json = json.load(f)
+        config_json["repository"] = 'test_repo'
+        dataflow_id = client.post('/api/v1/config', json=config_json).json()["id"]
+        shutil.copyfile(here('../fixtures/dataflow.zip'), here('../output_repositories/test_repo/dataflow.zip'))
+        response = client.get('/api/v1/repositories/test_repo/dataflows', params={"sort": "id"}).json()
+        assert response["total"] == 2
+        assert [(d["id"], d["nodes"]) for d in response["dataflows"]] == \
+            [('dataflow', 7), (dataflow_id, len(config_json["ui"]["nodes"]))]
+        response = client.get('/api/v1/repositories/test_repo/dataflows', params={"sort": "created", "limit": 1,
+                                                                                  "order": "desc"}).json()
+        assert [d["id"] for d in response["dataflows"]] == ['dataflow']
+        client.delete(f'/api/v1/repositories/test_repo/dataflows/{dataflow_id}')
+        assert client.get('/api/v1/repositories/test_repo/dataflows').json()["total"] == 1
+        assert client.get('/api/v1/repositories/unknown/dataflows').status_code == 404
+
+    def test_get_dataflow_fields(self):
+        client.post('/api/v1/repositories/test_repo')
+        shutil.copyfile(here('../fixtures/dataflow.zip'), here('../output_repositories/test_repo/dataflow.zip'))
+        response = client.get('/api/v1/repositories/test_repo/dataflows/dataflow', params={"fields": "script,ui"})
+        assert response.status_code == 200
+        assert set(response.json()) == {"id", "path", "script", "ui"}
+        response = client.get('/api/v1/repositories/test_repo/dataflows/dataflow', params={"fields": "nodes"})
+        assert response.status_code == 400
+        response = client.get('/api/v1/repositories/test_repo/dataflows/dataflow').json()
+        assert set(response) == {"id", "path", "script", "metadata", "requirements", "ui"}
+
+    def test_download_archive(self):
+        client.post('/api/v1/repositories/test_repo')
+        shutil.copyfile(here('../fixtures/dataflow.zip'), here('../output_repositories/test_repo/dataflow.zip'))
+        with open(here('../fixtures/dataflow.zip'), 'rb') as f:
+            archive = f.read()
+        url = '/api/v1/repositories/test_repo/dataflows/dataflow/archive'
+        response = client.get(url)
+        assert response.status_code == 200
+        assert response.content == archive
+        assert response.headers["content-type"] == "application/zip"
+        etag = response.headers["etag"]
+        assert client.get(url, headers={"If-None-Match": etag}).status_code == 304
+        response = client.get(url, headers={"Range": "bytes=10-19"})
+        assert response.status_code == 206
+        assert response.content == archive[10:20]
+        assert response.headers["content-range"] == f"bytes 10-19/{len(archive)}"
+        assert client.get(url, headers={"Range": "bytes=-5"}).content == archive[-5:]
+        assert client.get(url, headers={"Range": "bytes=100-"}).content == archive[100:]
+        response = client.get(url, headers={"Range": "bytes=10-19", "If-Range": '"other"'})
+        assert response.status_code == 200
+        assert response.content == archive
+        response = client.get(url, headers={"Range": f"bytes={len(archive)}-"})
+        assert response.status_code == 416
+        assert response.headers["content-range"] == f"bytes */{len(archive)}"
+        assert client.get('/api/v1/repositories/test_repo/dataflows/unknown/archive').status_code == 404
+
+    def test_download_member(self):
+        client.post('/api/v1/repositories/test_repo')
+        shutil.copyfile(here('../fixtures/dataflow.zip'), here('../output_repositories/test_repo/dataflow.zip'))
+        with zipfile.ZipFile(here('../fixtures/dataflow.zip')) as archive:
+            ui = archive.read('ui.json')
+        url = '/api/v1/repositories/test_repo/dataflows/dataflow/members/ui.json'
+        response = client.get(url, headers={"Accept-Encoding": "gzip"})
+        assert response.status_code == 200
+        assert response.headers["content-encoding"] == "gzip"
+        assert response.content == ui
+        assert client.get(url, headers={"If-None-Match": response.headers["etag"]}).status_code == 304
+        response = client.get(url, headers={"Accept-Encoding": "identity"})
+        assert "content-encoding" not in response.headers
+        assert response.headers["content-type"] == "application/json"
+        assert response.content == ui
+        response = client.get(url, headers={"Accept-Encoding": "gzip;q=0, *"})
+        assert "content-encoding" not in response.headers
+        assert response.content == ui
+        assert client.get('/api/v1/repositories/test_repo/dataflows/dataflow/members/other.txt').status_code == 404
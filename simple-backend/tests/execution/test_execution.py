@@ -16,9 +16,28 @@
  along with this program.  If not, see <https://www.gnu.org/licenses/>.
  """
 
+import asyncio
+import os
 import pytest
 import json
+import shutil
+import signal
+import subprocess
+import sys
+import time
+from pathlib import Path
+from types import SimpleNamespace
+from simple_backend import config
 from simple_backend.config import here
+from simple_backend.schemas.execution import ExecutionMetrics
+from simple_backend.service.log_store import ExecutionLog
+from simple_backend.schemas.nodes import ConfigurationSchema
+from simple_backend.service import checkpoint_service, config_service, execution_registry, resource_monitor, \
+    zygote_service
+from simple_backend.service.output_channel import OutputChannel, OverflowPolicy
+from simple_backend.service.execution_service import JobStatus
+from simple_backend.service.script_generator import EVENT_MARKER
+from simple_backend.ws.execution_ws import send_frames
 from tests.create_test_client import create_test_client, setup_dirs
 
 
@@ -48,3 +67,361 @@ class TestExecution:
             websocket.send_json(config_json)
             data = websocket.receive_text()
             assert len(data) > 0
+
+    def test_submit_execution(self, config_json):
+        config_json["dependencies"] = []
+        with client:
+            response = client.post('/api/v1/executions', json=config_json)
+            assert response.status_code == 200
+            job_id = response.json()["id"]
+            for _ in range(600):
+                job = client.get(f'/api/v1/executions/{job_id}').json()
+                if job["status"] in ("done", "failed"):
+                    break
+                time.sleep(0.1)
+            assert job["status"] in ("done", "failed")
+            assert job["elapsed"] > 0
+            with client.websocket_connect(f'/ws/execution?job_id={job_id}') as websocket:
+                assert job_id in websocket.receive_text()
+                assert 'Files written' in websocket.receive_text()
+            logs = client.get(f'/api/v1/executions/{job_id}/logs', params={"offset": 1, "limit": 2}).json()
+            assert len(logs["lines"]) == 2
+            assert logs["lines"][0] == 'Preparing virtual environment\n'
+            assert logs["next_offset"] == 3
+            with client.websocket_connect(f'/ws/execution?job_id={job_id}&offset={logs["line_count"] - 1}') as ws:
+                ws.receive_text()
+                assert ws.receive_text().startswith('Execution finished')
+
+    @pytest.mark.skipif(not zygote_service.is_supported(), reason="the warm runner requires os.fork")
+    def test_warm_runner_preload_output(self, monkeypatch, tmp_path):
+        # importing this prints the Zen of Python before the runner is ready
+        monkeypatch.setattr(config, "WARM_RUNNER_PRELOAD", "this")
+        (tmp_path / "script.py").write_text("print('done')")
+
+        async def run():
+            zygote = zygote_service.Zygote(sys.executable)
+            await zygote.start()
+            try:
+                reader, writer = await zygote.run(str(tmp_path / "script.py"), str(tmp_path))
+                output = await reader.read()
+                writer.close()
+                return output
+            finally:
+                zygote.stop()
+
+        assert b"done\n" in asyncio.run(run())
+
+    @pytest.mark.skipif(not zygote_service.is_supported(), reason="the warm runner requires os.fork")
+    def test_warm_execution(self, config_json):
+        config_json["dependencies"] = []
+        config_json["warm"] = True
+        with client:
+            for _ in range(2):
+                job_id = client.post('/api/v1/executions', json=config_json).json()["id"]
+                for _ in range(600):
+                    job = client.get(f'/api/v1/executions/{job_id}').json()
+                    if job["status"] in ("done", "failed"):
+                        break
+                    time.sleep(0.1)
+                assert job["return_code"] is not None
+                logs = client.get(f'/api/v1/executions/{job_id}/logs').json()
+                assert 'Started process in warm runner\n' in logs["lines"]
+                assert logs["lines"][-1] == f'Execution finished with exit code {job["return_code"]}\n'
+
+    def test_execution_metrics(self, config_json):
+        config_json["dependencies"] = []
+        with client:
+            with client.websocket_connect('/ws/execution?metrics=true') as websocket:
+                websocket.send_json(config_json)
+                messages = []
+                while not (messages and messages[-1].startswith('{"type": "metrics"')):
+                    messages.append(websocket.receive_text())
+            metrics = json.loads(messages[-1])
+            assert metrics["final"]
+            assert set(metrics["metrics"]["stages"]) == {"venv", "install", "run"}
+            job = client.get(f'/api/v1/executions/{metrics["id"]}').json()
+            assert job["metrics"] == metrics["metrics"]
+        with open(here(f'../output_execution/logs/{metrics["id"]}/metrics.json')) as f:
+            summary = json.load(f)
+        assert summary["return_code"] == job["return_code"]
+        assert summary["stages"] == metrics["metrics"]["stages"]
+
+    def test_execution_profile(self, config_json):
+        config_json["dependencies"] = []
+        config_json["profile"] = True
+        shutil.copy(here('../fixtures/rain.py'), config_json["path"])
+        with client:
+            with client.websocket_connect('/ws/execution?metrics=true') as websocket:
+                websocket.send_json(config_json)
+                messages = []
+                while not (messages and messages[-1].startswith('{"type": "metrics"')):
+                    messages.append(websocket.receive_text())
+        output = "".join(messages[:-1])
+        assert 'executing DatasetCreator1' in output
+        assert EVENT_MARKER.strip() not in output
+        profile = json.loads(messages[-1])["profile"]
+        assert set(profile) == {node["node_id"] for node in config_json["nodes"]}
+        assert all(node["duration"] >= 0 and not node["failed"] for node in profile.values())
+        with open(here(f'../output_execution/logs/{json.loads(messages[-1])["id"]}/profile.json')) as f:
+            assert json.load(f) == profile
+
+    def test_execution_checkpoints(self, config_json, monkeypatch):
+        monkeypatch.setattr(config, "CHECKPOINT_DIR", Path(here('../output_checkpoints')).resolve())
+        checkpoint_service.purge()
+        config_json["dependencies"] = []
+        config_json["checkpoint"] = True
+        shutil.copy(here('../fixtures/rain.py'), config_json["path"])
+
+        def execute():
+            job_id = client.post('/api/v1/executions', json=config_json).json()["id"]
+            for _ in range(600):
+                job = client.get(f'/api/v1/executions/{job_id}').json()
+                if job["status"] in ("done", "failed"):
+                    break
+                time.sleep(0.1)
+            assert job["status"] == "done"
+            return job["checkpoints"]
+
+        with client:
+            checkpoints = execute()
+            # EqualChecker1 has no outputs, so it isn't checkpointed
+            assert set(checkpoints) == {n["node_id"] for n in config_json["nodes"]} - {"EqualChecker1"}
+            assert not any(checkpoints.values())
+            assert all(execute().values())
+
+            # changing a node executes again the nodes depending on it
+            node = next(n for n in config_json["nodes"] if n["node_id"] == "TrainTestDatasetSplit1")
+            node["parameters"]["shuffle"] = False
+            checkpoints = execute()
+            hits = {node_id for node_id, hit in checkpoints.items() if hit}
+            assert hits == {"DatasetCreator1", "DataFrameLengthCalculator3"}
+
+            monkeypatch.setattr(config, "CHECKPOINT_MAX_ENTRIES", 2)
+            assert len(checkpoint_service.evict()) == 8
+            assert len(checkpoint_service.list_checkpoints()) == 2
+
+    def test_checkpoint_outputs(self, config_json, monkeypatch):
+        monkeypatch.setattr(config, "CHECKPOINT_DIR", Path(here('../output_checkpoints')).resolve())
+        checkpoint_service.purge()
+        config_json["dependencies"] = []
+        config_json["checkpoint"] = True
+        shutil.copy(here('../fixtures/rain.py'), config_json["path"])
+        full = json.loads(json.dumps(config_json))
+        # the test_dataset output of TrainTestDatasetSplit1 isn't used, so it isn't saved by the first execution
+        nodes = {node["node_id"]: node for node in config_json["nodes"]}
+        nodes["TrainTestDatasetSplit1"]["then"] = [t for t in nodes["TrainTestDatasetSplit1"]["then"]
+                                                   if t["from_port"] != "test_dataset"]
+        nodes["DatasetCreator1"]["then"].append({"to_node": "DataFrameLengthCalculator2", "from_port": "dataset",
+                                                 "to_port": "dataset"})
+
+        def execute(configuration):
+            job_id = client.post('/api/v1/executions', json=configuration).json()["id"]
+            for _ in range(600):
+                job = client.get(f'/api/v1/executions/{job_id}').json()
+                if job["status"] in ("done", "failed"):
+                    break
+                time.sleep(0.1)
+            assert job["status"] == "done"
+            return job["checkpoints"]
+
+        with client:
+            execute(config_json)
+            checkpoints = execute(full)
+        assert not checkpoints["TrainTestDatasetSplit1"]
+
+    def test_checkpoint_writer(self, config_json, monkeypatch, tmp_path):
+        monkeypatch.setattr(config, "CHECKPOINT_DIR", Path(here('../output_checkpoints')).resolve())
+        checkpoint_service.purge()
+        config_json["dependencies"] = []
+        config_json["checkpoint"] = True
+        shutil.copy(here('../fixtures/rain.py'), config_json["path"])
+        output = tmp_path / "written.csv"
+        config_json["nodes"].append({"node_id": "Writer1", "node": "rain.nodes.custom.custom.CustomNode",
+                                     "parameters": {"path": str(output)}, "function_name": "write",
+                                     "code": "def write(i, o):\n    pass", "then": []})
+        nodes = {node["node_id"]: node for node in config_json["nodes"]}
+        nodes["DatasetCreator1"]["then"].append({"to_node": "Writer1", "from_port": "dataset", "to_port": "dataset"})
+
+        with client:
+            for _ in range(2):
+                job_id = client.post('/api/v1/executions', json=config_json).json()["id"]
+                for _ in range(600):
+                    job = client.get(f'/api/v1/executions/{job_id}').json()
+                    if job["status"] in ("done", "failed"):
+                        break
+                    time.sleep(0.1)
+                assert job["status"] == "done"
+        assert job["checkpoints"]["DatasetCreator1"] and "Writer1" not in job["checkpoints"]
+        assert output.read_text() == "Writer1\nWriter1\n"
+
+    def test_parallel_execution(self, config_json):
+        config_json["dependencies"] = []
+        config_json["workers"] = 2
+        shutil.copy(here('../fixtures/rain.py'), config_json["path"])
+        dag = config_service.check_dag(ConfigurationSchema.parse_obj(config_json).nodes)
+        assert dag.get_levels()[:2] == [["DatasetCreator1"], ["TrainTestDatasetSplit1", "DataFrameLengthCalculator3"]]
+        with client:
+            job_id = client.post('/api/v1/executions', json=config_json).json()["id"]
+            for _ in range(600):
+                job = client.get(f'/api/v1/executions/{job_id}').json()
+                if job["status"] in ("done", "failed"):
+                    break
+                time.sleep(0.1)
+            assert job["status"] == "done"
+            lines = client.get(f'/api/v1/executions/{job_id}/logs').json()["lines"]
+        executed = [line.split()[1] for line in lines if line.startswith("executing")]
+        assert sorted(executed) == sorted(node["node_id"] for node in config_json["nodes"])
+        assert executed[0] == "DatasetCreator1" and executed[-1] == "EqualChecker1"
+
+    @pytest.mark.skipif(not resource_monitor.is_supported(), reason="the monitor requires /proc")
+    def test_process_tree_monitor(self):
+        process = subprocess.Popen([sys.executable, "-c", "import time; x = bytearray(64 * 1024 * 1024); "
+                                    "print(flush=True); time.sleep(5)"], stdout=subprocess.PIPE,
+                                   start_new_session=True)
+        try:
+            process.stdout.readline()
+            monitor = resource_monitor.ProcessTreeMonitor(process.pid)
+            monitor.sample()
+            metrics = ExecutionMetrics()
+            monitor.update(metrics)
+            assert metrics.processes == 1
+            assert metrics.peak_rss > 64 * 1024 * 1024
+        finally:
+            process.kill()
+            process.wait()
+
+    @pytest.mark.skipif(os.name != "posix", reason="the limits are applied with setrlimit")
+    def test_cpu_limit(self, tmp_path):
+        (tmp_path / "script.py").write_text("while True: pass")
+        process = subprocess.run(resource_monitor.get_command(sys.executable, "script.py", {"cpu": 1}), timeout=30,
+                                 cwd=tmp_path)
+        assert process.returncode in (-signal.SIGXCPU, -signal.SIGKILL)
+
+    def test_cancel_queued_execution(self, config_json):
+        max_concurrent_executions = config.MAX_CONCURRENT_EXECUTIONS
+        config.MAX_CONCURRENT_EXECUTIONS = 0
+        try:
+            with client:
+                job = client.post('/api/v1/executions', json=config_json, params={"priority": 1}).json()
+                assert job["status"] == "queued"
+                assert job["position"] == 1
+                response = client.delete(f'/api/v1/executions/{job["id"]}')
+                assert response.status_code == 200
+                assert response.json()["status"] == "cancelled"
+        finally:
+            config.MAX_CONCURRENT_EXECUTIONS = max_concurrent_executions
+
+    def test_executions_of_other_workers(self, config_json, monkeypatch, tmp_path):
+        monkeypatch.setattr(config, "MAX_CONCURRENT_EXECUTIONS", 1)
+        config_json["dependencies"] = []
+        shutil.copy(here('../fixtures/rain.py'), config_json["path"])
+        # an execution running in another worker, which wrote part of its output
+        log = ExecutionLog(tmp_path, 1024, 10)
+        for i in range(3):
+            log.append(f"line {i}\n")
+        log.flush()
+        execution_registry.add("other", "worker", str(tmp_path), 0, time.time())
+        execution_registry.dispatch("worker", 1, {})
+        with client:
+            assert client.get('/api/v1/executions/other').json()["status"] == "running"
+            logs = client.get('/api/v1/executions/other/logs', params={"offset": 1}).json()
+            assert logs["line_count"] == 3 and logs["lines"] == ["line 1\n", "line 2\n"]
+            # the slot is taken by the other worker
+            job = client.post('/api/v1/executions', json=config_json).json()
+            time.sleep(2 * config.EXECUTION_POLL_INTERVAL)
+            assert client.get(f'/api/v1/executions/{job["id"]}').json()["status"] == "queued"
+            assert client.delete('/api/v1/executions/other').status_code == 200
+            started, cancelled = execution_registry.dispatch("worker", 1, {})
+            assert cancelled == ["other"]
+            log.append("line 3\n")
+            log.close()
+            execution_registry.update("other", "cancelled", time.time(), time.time(), None, None, {})
+            with client.websocket_connect('/ws/execution?job_id=other&offset=1') as websocket:
+                assert websocket.receive_text() == 'Execution other cancelled'
+                assert websocket.receive_text() == 'line 1\nline 2\nline 3\n'
+            for _ in range(600):
+                status = client.get(f'/api/v1/executions/{job["id"]}').json()["status"]
+                if status in ("done", "failed"):
+                    break
+                time.sleep(0.1)
+            assert status == "done"
+        # a worker that stops sending heartbeats is considered stopped
+        execution_registry.add("orphan", "stopped", str(tmp_path), 0, time.time())
+        monkeypatch.setattr(execution_registry, "WORKER_TIMEOUT", -1)
+        assert client.get('/api/v1/executions/orphan').json()["status"] == "failed"
+
+    def test_forget_executions(self, tmp_path):
+        for i in range(3):
+            (tmp_path / f"job{i}").mkdir()
+            execution_registry.add(f"job{i}", "worker", str(tmp_path / f"job{i}"), 0, time.time())
+            execution_registry.update(f"job{i}", "done", time.time(), time.time() + i, 0, None, {})
+        execution_registry.forget(1)
+        assert [record["id"] for record in execution_registry.get_all(10)] == ["job2"]
+        assert [path.name for path in tmp_path.iterdir()] == ["job2"]
+
+    def test_unknown_execution(self):
+        response = client.get('/api/v1/executions/unknown')
+        assert response.status_code == 404
+
+    @pytest.mark.parametrize("policy, expected", [
+        (OverflowPolicy.DROP_OLDEST, "[3 lines dropped]\n3\n4\n"),
+        (OverflowPolicy.SUMMARIZE, "0\n1\n[3 lines dropped]\n"),
+    ])
+    def test_output_channel_overflow(self, policy, expected):
+        async def consume():
+            channel = OutputChannel(4, policy)
+            for i in range(5):
+                await channel.put(f"{i}\n")
+            channel.close()
+            frames = []
+            while (frame := await channel.get_frame(1024, 0.01)) is not None:
+                frames.append(frame)
+            return "".join(frames)
+
+        assert asyncio.run(consume()) == expected
+
+    def test_single_writer(self, monkeypatch):
+        monkeypatch.setattr(config, "EXECUTION_METRICS_INTERVAL", 0.01)
+
+        class WebSocket:
+            def __init__(self):
+                self.sending = False
+                self.messages = []
+
+            async def send_text(self, text):
+                assert not self.sending
+                self.sending = True
+                await asyncio.sleep(0.005)
+                self.messages.append(text)
+                self.sending = False
+
+        async def stream():
+            ws = WebSocket()
+            job = SimpleNamespace(id="job", status=JobStatus.RUNNING, metrics=ExecutionMetrics(), profile={},
+                                  checkpoints={})
+            channel = OutputChannel(1024, OverflowPolicy.BLOCK)
+            sender = asyncio.ensure_future(send_frames(ws, job, channel, True))
+            for i in range(20):
+                await channel.put(f"{i}\n")
+                await asyncio.sleep(0.005)
+            channel.close()
+            await sender
+            return ws.messages
+
+        messages = asyncio.run(stream())
+        assert any(message.startswith('{"type": "metrics"') for message in messages)
+        assert "".join(m for m in messages if not m.startswith("{")) == "".join(f"{i}\n" for i in range(20))
+
+    def test_execution_log_segments(self, tmp_path):
+        log = ExecutionLog(tmp_path, 10, 2)
+        for i in range(20):
+            log.append(f"line {i}\n")
+        log.close()
+        assert len(list(tmp_path.iterdir())) == 10
+        assert log.read(3, 4) == [f"line {i}\n" for i in range(3, 7)]
+        assert log.read(17, 10) == ["line 17\n", "line 18\n", "line 19\n"]
+        assert log.read(20, 10) == []
+        loaded = ExecutionLog.load(tmp_path)
+        assert loaded.line_count == 20
+        assert loaded.read(3, 4) == log.read(3, 4)
+        assert loaded.read(17, 10) == log.read(17, 10)
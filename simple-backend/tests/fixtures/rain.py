@@ -0,0 +1,73 @@
+"""
+ Copyright (C) 2023 Università degli Studi di Camerino and Sigma S.p.A.
+ Authors: Alessandro Antinori, Rosario Capparuccia, Riccardo Coltrinari, Flavio Corradini, Marco Piangerelli, Barbara Re, Marco Scarpetta
+
+ This program is free software: you can redistribute it and/or modify
+ it under the terms of the GNU Affero General Public License as
+ published by the Free Software Foundation, either version 3 of the
+ License, or (at your option) any later version.
+
+ This program is distributed in the hope that it will be useful,
+ but WITHOUT ANY WARRANTY; without even the implied warranty of
+ MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+ GNU Affero General Public License for more details.
+
+ You should have received a copy of the GNU Affero General Public License
+ along with this program.  If not, see <https://www.gnu.org/licenses/>.
+ """
+
+# Minimal stand-in for rain used by the execution tests: the generated script imports it from its own directory.
+# Every node sets its output variables to "{node_id}.{variable}" and the data flow passes them along the edges.
+# A node with a path parameter appends its id to the file, as a writer would.
+
+
+class Port:
+    def __init__(self, node, var):
+        self.node = node
+        self.var = var
+
+    def __gt__(self, other):
+        return self, other
+
+
+class Node:
+    def __init__(self, node_id, use_function=None, path=None, **kwargs):
+        self.node_id = node_id
+        self.path = path
+        self.outputs = []
+        DataFlow.nodes.append(self)
+
+    def execute(self):
+        print(f"executing {self.node_id}\n", end="", flush=True)
+        if self.path is not None:
+            with open(self.path, "a") as f:
+                f.write(f"{self.node_id}\n")
+        for var in self.outputs:
+            setattr(self, var, f"{self.node_id}.{var}")
+
+    def __matmul__(self, var):
+        return Port(self, var)
+
+
+class DataFlow:
+    nodes = []
+
+    def __init__(self, name):
+        self.name = name
+        self.edges = []
+
+    def add_edges(self, edges):
+        for source, destination in edges:
+            source.node.outputs.append(source.var)
+            self.edges.append((source, destination))
+
+    def execute(self):
+        for node in self.nodes:
+            node.execute()
+            for source, destination in self.edges:
+                if source.node is node:
+                    setattr(destination.node, destination.var, getattr(node, source.var))
+
+
+def __getattr__(name):
+    return Node
@@ -16,15 +16,58 @@
  along with this program.  If not, see <https://www.gnu.org/licenses/>.
  """
 
+import hashlib
+import json
+import shutil
+import threading
 import pytest
+from http.server import HTTPServer, SimpleHTTPRequestHandler
+from simple_backend import config
 from simple_backend.config import here
 from simple_backend.schemas.nodes import NodeStructure, CustomNodeIOParams
+from simple_backend.service import catalogue_service, node_service
+from simple_backend.service.lru_cache import LRUCache
+from simple_backend.service.node_catalogue import NodeCatalogue
 from tests.create_test_client import create_test_client
 
 
 client = create_test_client()
 
 
+@pytest.fixture
+def catalogue_dir(tmp_path):
+    source, catalogue_dir, interval = config.RAIN_STRUCTURE_URL, config.CATALOGUE_DIR, config.CATALOGUE_REFRESH_INTERVAL
+    shutil.copy(here('../fixtures/rain_structure.json'), tmp_path / "source.json")
+    config.RAIN_STRUCTURE_URL = str(tmp_path / "source.json")
+    config.CATALOGUE_DIR = tmp_path / "catalogue"
+    try:
+        yield tmp_path
+    finally:
+        config.RAIN_STRUCTURE_URL, config.CATALOGUE_DIR, config.CATALOGUE_REFRESH_INTERVAL = source, catalogue_dir, \
+            interval
+
+
+class StructureHandler(SimpleHTTPRequestHandler):
+
+    def do_GET(self):
+        with open(self.directory + "/source.json", "rb") as f:
+            data = f.read()
+        etag = f'"{hashlib.sha256(data).hexdigest()}"'
+        self.server.requests.append(self.headers.get("If-None-Match"))
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("ETag", etag)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
 @pytest.fixture
 def custom_txt():
     with open(file=here('../fixtures/custom.txt'), mode='r') as custom:
@@ -43,6 +86,69 @@ class TestNode:
         except:
             pytest.fail()
 
+    def test_node_all_cached(self):
+        response = client.get('/api/v1/nodes', headers={"Accept-Encoding": "gzip"})
+        assert response.headers["Content-Encoding"] == "gzip"
+        assert response.headers["Cache-Control"].startswith("public")
+        assert len(response.json()) == len(node_service.catalogue)
+        etag = response.headers["ETag"]
+        cached = client.get('/api/v1/nodes', headers={"Accept-Encoding": "gzip", "If-None-Match": etag})
+        assert cached.status_code == 304
+        assert cached.content == b''
+        assert "Content-Encoding" not in cached.headers
+        excluded = client.get('/api/v1/nodes', headers={"Accept-Encoding": "br;q=0, gzip;q=0, *"})
+        assert "Content-Encoding" not in excluded.headers
+        identity = client.get('/api/v1/nodes', headers={"Accept-Encoding": "identity", "If-None-Match": etag})
+        assert identity.status_code == 200
+        assert "Content-Encoding" not in identity.headers
+        assert identity.json() == response.json()
+
+    def test_existing_node_cached(self):
+        response = client.get('/api/v1/nodes/PandasCSVLoader')
+        assert response.json()["clazz"] == 'PandasCSVLoader'
+        cached = client.get('/api/v1/nodes/PandasCSVLoader', headers={"If-None-Match": response.headers["ETag"]})
+        assert cached.status_code == 304
+        other = client.get('/api/v1/nodes/TrainTestDatasetSplit', headers={"If-None-Match": response.headers["ETag"]})
+        assert other.status_code == 200
+
+    def test_search_nodes(self):
+        response = client.get('/api/v1/nodes/search', params={"q": "csv load"}).json()
+        assert response["total"] == 1
+        assert response["nodes"][0]["clazz"] == 'PandasCSVLoader'
+        assert client.get('/api/v1/nodes/search', params={"q": "delim"}).json()["nodes"][0]["clazz"] == \
+            'PandasCSVLoader'
+
+        response = client.get('/api/v1/nodes/search').json()
+        assert response["total"] == len(node_service.catalogue)
+        assert sum(response["facets"]["library"].values()) == response["total"]
+
+        response = client.get('/api/v1/nodes/search', params={"library": "pandas", "limit": 1}).json()
+        assert [n["tags"]["library"] for n in response["nodes"]] == ['Pandas']
+        assert response["facets"]["type"] == {"Input": 1}
+        assert response["facets"]["library"] == {"Base": 1, "Pandas": 1, "Scikit-Learn": 1}
+
+        assert client.get('/api/v1/nodes/search', params={"q": "unknownword"}).json()["total"] == 0
+        assert client.get('/api/v1/nodes/search', params={"limit": 0}).status_code == 422
+
+    def test_search_ranking(self):
+        structure = {"nodes": [
+            {"clazz": "Reader", "package": "a.Reader", "description": "Reads a table.", "parameter": [],
+             "tags": {"library": "A", "type": "Input"}},
+            {"clazz": "TableWriter", "package": "a.TableWriter", "description": "Writes.", "parameter": [],
+             "tags": {"library": "A", "type": "Output"}},
+            {"clazz": "Splitter", "package": "a.Splitter", "description": "Splits.",
+             "parameter": [{"name": "table_name"}], "tags": {"library": "B", "type": "Transformer"}},
+        ]}
+        catalogue = NodeCatalogue(structure)
+        total, nodes, facets = catalogue.search("tab")
+        assert total == 3
+        assert [n["clazz"] for n in nodes] == ['TableWriter', 'Splitter', 'Reader']
+        assert facets == {"library": {"A": 2, "B": 1}, "type": {"Input": 1, "Output": 1, "Transformer": 1}}
+        total, nodes, facets = catalogue.search("tab", types=["output"], offset=0, limit=10)
+        assert [n["clazz"] for n in nodes] == ['TableWriter']
+        assert facets["type"] == {"Input": 1, "Output": 1, "Transformer": 1}
+        assert catalogue.search("tab writ")[0] == 1
+
     def test_unknown_node(self):
         response = client.get('/api/v1/nodes/unknown')
         assert response.status_code == 404
@@ -59,3 +165,128 @@ class TestNode:
             CustomNodeIOParams.parse_obj(response.json())
         except:
             pytest.fail()
+
+    def test_custom_node_io(self):
+        code = """
+import pandas as pd
+
+
+def load(data, key="ignored"):
+    return data.get("from_helper")
+
+
+def unused(i, o):
+    o["not_an_output"] = i["not_an_input"]
+
+
+def node(i, o, threshold=1):
+    df = i["dataset"]
+    other = i.get('other', None)
+    inp = i
+    extra = inp["aliased"], load(inp), load(data=i)
+
+    def nested(i):
+        return i["shadowed"]
+
+    def closure():
+        o["from_closure"] = df
+
+    fn = lambda o: o["shadowed"]
+    out = o
+    out["result"] = df
+    o["result"] = other
+    o[threshold] = i["dataset"]
+    inp = None
+    inp["reassigned"] = 1
+"""
+        params = node_service.get_custom_node_analysis(code, "node").io_params
+        assert params.inputs == ['dataset', 'other', 'aliased', 'from_helper']
+        assert params.outputs == ['from_closure', 'result']
+        assert params.params == ['threshold']
+
+    def test_custom_node_cache(self, custom_txt):
+        node_service.custom_node_cache.clear()
+        body = {"function_name": "print_dataset", "code": custom_txt, "language": "python"}
+        first = client.post('/api/v1/nodes/custom', json=body).json()
+        assert client.post('/api/v1/nodes/custom', json=body).json() == first
+        stats = client.get('/api/v1/nodes/custom/cache').json()
+        assert stats["hits"] == 1 and stats["misses"] == 1 and stats["size"] == 1
+        assert stats["hit_rate"] == 0.5
+        analysis = node_service.get_custom_node_analysis(custom_txt, "print_dataset")
+        assert analysis.requirements == node_service.parse_custom_node_requirements(custom_txt)
+        assert analysis.function.name == "print_dataset"
+
+        body["code"] = custom_txt.replace("print_dataset", "print_dataset_bad").replace("(i, o)", "(i)")
+        body["function_name"] = "print_dataset_bad"
+        assert client.post('/api/v1/nodes/custom', json=body).status_code == 400
+
+    def test_lru_cache(self):
+        cache = LRUCache(2)
+        assert cache.get("a", lambda: 1) == 1
+        assert cache.get("b", lambda: 2) == 2
+        assert cache.get("a", lambda: 3) == 1
+        assert cache.get("c", lambda: 4) == 4
+        assert cache.get("b", lambda: 5) == 5
+        assert cache.get_stats() == {"size": 2, "max_size": 2, "hits": 1, "misses": 4, "hit_rate": 0.2}
+
+    def test_catalogue(self):
+        catalogue = node_service.catalogue
+        node = catalogue.get_node('PandasCSVLoader')
+        assert catalogue.get_node_by_package(node["package"]) is node
+        assert catalogue.get_parameter('PandasCSVLoader', 'delim')["default_value"] == ','
+        assert catalogue.get_parameter('PandasCSVLoader', 'unknown') is None
+        assert catalogue.get_library_dependencies('Pandas') == ('pandas==1.3.5',)
+        assert catalogue.get_library_dependencies('unknown') == ()
+        assert node_service.get_node_param_value_and_type('PandasCSVLoader', 'delim', '";"') == (';', None)
+
+    def test_catalogue_cache(self, catalogue_dir):
+        catalogue = catalogue_service.load()
+        data = (catalogue_dir / "source.json").read_bytes()
+        assert catalogue.version == hashlib.sha256(data).hexdigest()
+        assert (catalogue_dir / "catalogue" / catalogue_service.STRUCTURE_FILE).read_bytes() == data
+
+        structure = json.loads(data)
+        structure["nodes"] = structure["nodes"][:1]
+        (catalogue_dir / "source.json").write_text(json.dumps(structure))
+        assert catalogue_service.load().version == catalogue.version
+
+        config.CATALOGUE_REFRESH_INTERVAL = 0
+        refreshed = catalogue_service.refresh(catalogue.version)
+        assert refreshed.version != catalogue.version
+        assert len(refreshed) == 1
+        assert catalogue_service.refresh(refreshed.version) is None
+        assert catalogue_service.load().version == refreshed.version
+
+    def test_catalogue_conditional_request(self, catalogue_dir):
+        server = HTTPServer(("127.0.0.1", 0), lambda *args: StructureHandler(*args, directory=str(catalogue_dir)))
+        server.requests = []
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        try:
+            config.RAIN_STRUCTURE_URL = f"http://127.0.0.1:{server.server_port}/rain_structure.json"
+            config.CATALOGUE_REFRESH_INTERVAL = 0
+            catalogue = catalogue_service.load()
+            assert catalogue_service.refresh(catalogue.version) is None
+            assert server.requests == [None, f'"{catalogue.version}"']
+            assert catalogue_service.read_meta()["etag"] == f'"{catalogue.version}"'
+        finally:
+            server.shutdown()
+            server.server_close()
+
+    def test_catalogue_concurrent_load(self, catalogue_dir):
+        server = HTTPServer(("127.0.0.1", 0), lambda *args: StructureHandler(*args, directory=str(catalogue_dir)))
+        server.requests = []
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        try:
+            config.RAIN_STRUCTURE_URL = f"http://127.0.0.1:{server.server_port}/rain_structure.json"
+            loaded = []
+            threads = [threading.Thread(target=lambda: loaded.append(catalogue_service.load().version))
+                       for _ in range(4)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            assert len(set(loaded)) == 1 and len(loaded) == 4
+            assert server.requests == [None]
+        finally:
+            server.shutdown()
+            server.server_close()
@@ -16,14 +16,47 @@
  along with this program.  If not, see <https://www.gnu.org/licenses/>.
  """
 
+import json
+import multiprocessing
+import os
+import shutil
+import time
 import pytest
+from types import SimpleNamespace
+from simple_backend import config
+from simple_backend.config import here
 from simple_backend.schemas.repository_schemas import RepositoryPost
+from simple_backend.service import config_service, repository_index
 from tests.create_test_client import create_test_client, setup_dirs
 
 
 client = create_test_client()
 
 
+def stress_repository(paths: tuple, worker: int, operations: int) -> tuple:
+    """
+    Archives and unarchives the stress repository if worker is 0, otherwise saves Dataflows in it, all in the same
+    millisecond, and deletes every third one. Returns the saved and deleted ids
+    """
+    config.BASE_OUTPUT_DIR, config.ARCHIVE_DIR, config.REPOSITORY_INDEX_PATH, config.REPOSITORY_LOCK_DIR = paths
+    config_service.time = SimpleNamespace(time=lambda: 1700000000.0, localtime=time.localtime)
+    with open(here('../fixtures/config.json')) as f:
+        config_json = json.load(f)
+    config_json["repository"] = "stress"
+    saved, deleted = [], []
+    for n in range(operations):
+        if worker == 0:
+            assert client.delete('/api/v1/repositories/stress', params={"shallow": True}).status_code in (204, 404)
+            assert client.post('/api/v1/repositories/archived/stress').status_code in (200, 404)
+            continue
+        response = client.post('/api/v1/config', json=config_json)
+        assert response.status_code == 200
+        saved.append(response.json()["id"])
+        if n % 3 == 0 and client.delete(f'/api/v1/repositories/stress/dataflows/{saved[-1]}').status_code == 204:
+            deleted.append(saved[-1])
+    return saved, deleted
+
+
 class TestRepository:
 
     def setup_method(self):
@@ -57,6 +90,11 @@ class TestRepository:
         response_create2 = client.post('/api/v1/repositories/test_repo')
         assert response_create2.status_code == 404
 
+    def test_reserved_name(self):
+        for name in ['summary', 'archived']:
+            assert client.post(f'/api/v1/repositories/{name}').status_code == 404
+            assert not (config.BASE_OUTPUT_DIR / name).exists()
+
     def test_unknown_repo(self):
         response_create = client.get('/api/v1/repositories/unknown')
         assert response_create.status_code == 404
@@ -92,3 +130,62 @@ class TestRepository:
         assert len(repos) == 1
         repos = client.get('/api/v1/repositories/archived').json()
         assert len(repos) == 0
+
+    def test_repositories_summary(self):
+        for name in ['repo_b', 'repo_a', 'other']:
+            client.post(f'/api/v1/repositories/{name}')
+        shutil.copyfile(here('../fixtures/dataflow.zip'), here('../output_repositories/repo_b/dataflow.zip'))
+        params = {"name": "repo", "sort": "size", "order": "desc", "limit": 1}
+        response = client.get('/api/v1/repositories/summary', params=params).json()
+        assert response["total"] == 2
+        assert [r["name"] for r in response["repositories"]] == ['repo_b']
+        assert response["repositories"][0]["dataflows"] == 1
+        assert response["repositories"][0]["size"] == os.path.getsize(here('../fixtures/dataflow.zip'))
+        response = client.get('/api/v1/repositories/summary', params={"offset": 1}).json()
+        assert [r["name"] for r in response["repositories"]] == ['repo_a', 'repo_b']
+        assert client.get('/api/v1/repositories/summary', params={"sort": "unknown"}).status_code == 400
+
+        client.delete('/api/v1/repositories/repo_b', params={"shallow": True})
+        response = client.get('/api/v1/repositories/summary', params={"archived": True}).json()
+        assert [(r["name"], r["archived"], r["dataflows"]) for r in response["repositories"]] == \
+            [('repo_b', True, 1)]
+        assert client.get('/api/v1/repositories/summary').json()["total"] == 2
+
+    def test_rebuild_index(self):
+        client.post('/api/v1/repositories/test_repo')
+        shutil.copyfile(here('../fixtures/dataflow.zip'), here('../output_repositories/test_repo/dataflow1.zip'))
+        shutil.copyfile(here('../fixtures/dataflow.zip'), here('../output_repositories/test_repo/dataflow2.zip'))
+        os.remove(config.REPOSITORY_INDEX_PATH)
+        assert repository_index.rebuild() == (1, 2)
+        total, dataflows = repository_index.list_dataflows('test_repo', sort="id", order="desc")
+        assert total == 2
+        assert [d["id"] for d in dataflows] == ['dataflow2', 'dataflow1']
+        assert dataflows[0]["nodes"] == 7
+
+    def test_index_updated_on_save(self, monkeypatch):
+        monkeypatch.setattr(repository_index, "RACY_INTERVAL", -1)
+        with open(here('../fixtures/config.json')) as f:
+            config_json = json.load(f)
+        client.post('/api/v1/repositories/abc')
+        assert repository_index.list_dataflows('abc')[0] == 0
+        dataflow_id = client.post('/api/v1/config', json=config_json).json()["id"]
+        monkeypatch.setattr(repository_index, "_scan_repository", None)
+        total, dataflows = repository_index.list_dataflows('abc')
+        assert total == 1 and dataflows[0]["id"] == dataflow_id
+        assert client.delete(f'/api/v1/repositories/abc/dataflows/{dataflow_id}').status_code == 204
+        assert repository_index.list_dataflows('abc')[0] == 0
+
+    def test_concurrent_changes(self):
+        paths = (config.BASE_OUTPUT_DIR, config.ARCHIVE_DIR, config.REPOSITORY_INDEX_PATH, config.REPOSITORY_LOCK_DIR)
+        with multiprocessing.get_context("spawn").Pool(4) as pool:
+            results = pool.starmap(stress_repository, [(paths, worker, 10) for worker in range(4)])
+        saved = [dataflow_id for worker_saved, _ in results for dataflow_id in worker_saved]
+        deleted = {dataflow_id for _, worker_deleted in results for dataflow_id in worker_deleted}
+        assert len(saved) == len(set(saved)) == 30
+        files = [path.name for directory in (config.BASE_OUTPUT_DIR / 'stress', config.ARCHIVE_DIR / 'stress')
+                 if directory.is_dir() for path in directory.iterdir()]
+        assert sorted(files) == sorted(f'{dataflow_id}.zip' for dataflow_id in set(saved) - deleted)
+        indexed = [dataflow["id"] for archived in (False, True)
+                   if 'stress' in repository_index.get_repository_names(archived)
+                   for dataflow in repository_index.list_dataflows('stress', archived)[1]]
+        assert sorted(indexed) == sorted(set(saved) - deleted)
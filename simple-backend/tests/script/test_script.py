@@ -19,6 +19,7 @@
 import pytest
 from simple_backend.config import here
 from simple_backend.schemas.script import ReversedScript
+from simple_backend.service.dag_layout import layered_layout
 from tests.create_test_client import create_test_client
 
 
@@ -52,3 +53,56 @@ class TestScript:
             ReversedScript.parse_obj(response.json())
         except:
             pytest.fail()
+
+    def test_script_multiline_params(self):
+        script = """
+import rain
+
+
+def identity(i, o):
+    o['x'] = i['x']
+
+
+df = rain.DataFlow("dataflow")
+Loader = rain.PandasCSVLoader(node_id="Loader", path="data.csv", delim=";")
+Split = rain.TrainTestDatasetSplit(
+    node_id="Split",
+    test_size=[0.2,
+               0.3],
+)
+Identity = rain.CustomNode(node_id="Identity", use_function=identity)
+df.add_edges([Loader @ 'dataset' > Split @ 'dataset', Split @ 'train_dataset' > Identity @ 'x'])
+df.add_edge(Split @ 'test_dataset' > Identity @ 'x')
+"""
+        response = client.post('/api/v1/script', json={"script": script}).json()
+        nodes = {n["node"]: n for n in response["nodes"]}
+        assert list(nodes) == ['Loader', 'Split', 'Identity']
+        assert nodes["Loader"]["params"] == [{"key": "path", "value": "data.csv", "type": None},
+                                             {"key": "delim", "value": ";", "type": None}]
+        assert nodes["Split"]["params"][0]["value"] == [0.2, 0.3]
+        assert nodes["Identity"]["clazz"] == 'Identity'
+        assert response["custom"][0]["inputs"] == ['x'] and response["custom"][0]["outputs"] == ['x']
+        assert [(e["from_node"], e["to_var"]) for e in response["edges"]] == \
+            [('Loader', 'dataset'), ('Split', 'x'), ('Split', 'x')]
+
+    def test_script_invalid_edge(self):
+        with pytest.raises(ValueError):
+            client.post('/api/v1/script', json={"script": "import rain as r\nA = r.Node()\nr.add_edges([A > A])"})
+
+    def test_script_layered_layout(self, script_txt):
+        response = client.post('/api/v1/script', json={"script": script_txt, "layout": "layered"})
+        assert response.status_code == 200
+        pos = {n["node"]: n["pos"] for n in response.json()["nodes"]}
+        assert client.post('/api/v1/script', json={"script": script_txt, "layout": "layered"}).json()["nodes"] == \
+            response.json()["nodes"]
+        for edge in response.json()["edges"]:
+            assert pos[edge["from_node"]][0] < pos[edge["to_node"]][0]
+        assert pos["DatasetCreator1"][0] < pos["TrainTestDatasetSplit1"][0] < pos["DataFrameLengthCalculator1"][0]
+        assert len({tuple(p) for p in pos.values()}) == len(pos)
+        assert client.post('/api/v1/script', json={"script": script_txt, "layout": "unknown"}).status_code == 400
+
+    def test_layered_layout_cycle(self):
+        pos = layered_layout(['A', 'B', 'C', 'D'], [('A', 'B'), ('B', 'C'), ('C', 'B'), ('A', 'A'), ('D', 'A')])
+        assert pos['D'][0] < pos['A'][0] < pos['B'][0] < pos['C'][0]
+        assert layered_layout([], []) == {}
+        assert layered_layout(['A', 'B', 'A'], [('A', 'B')]) == layered_layout(['A', 'B'], [('A', 'B')])
@@ -0,0 +1,91 @@
+"""
+ Copyright (C) 2023 Università degli Studi di Camerino and Sigma S.p.A.
+ Authors: Alessandro Antinori, Rosario Capparuccia, Riccardo Coltrinari, Flavio Corradini, Marco Piangerelli, Barbara Re, Marco Scarpetta
+
+ This program is free software: you can redistribute it and/or modify
+ it under the terms of the GNU Affero General Public License as
+ published by the Free Software Foundation, either version 3 of the
+ License, or (at your option) any later version.
+
+ This program is distributed in the hope that it will be useful,
+ but WITHOUT ANY WARRANTY; without even the implied warranty of
+ MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+ GNU Affero General Public License for more details.
+
+ You should have received a copy of the GNU Affero General Public License
+ along with this program.  If not, see <https://www.gnu.org/licenses/>.
+ """
+
+import shutil
+import subprocess
+from simple_backend import config
+from simple_backend.schemas.venv import VenvCacheEntry
+from simple_backend.service import venv_pool, venv_service
+from tests.create_test_client import create_test_client, setup_dirs
+
+
+client = create_test_client()
+
+
+class TestVenvs:
+
+    def setup_method(self):
+        setup_dirs()
+        venv_service.purge()
+
+    def test_cache_key(self):
+        key = venv_service.get_cache_key(['pandas==1.3.5', ' rain', '', 'pandas==1.3.5'])
+        assert key == venv_service.get_cache_key(['rain', 'pandas==1.3.5'])
+        assert key != venv_service.get_cache_key(['rain'])
+
+    def test_lease_and_reuse(self):
+        with venv_service.lease_venv([]) as venv:
+            assert not venv.cached
+            assert venv.path.is_dir()
+            entries = client.get('/api/v1/venvs').json()
+            assert len(entries) == 1
+            assert VenvCacheEntry.parse_obj(entries[0]).leases == 1
+            response = client.delete(f'/api/v1/venvs/{venv.key}')
+            assert response.status_code == 409
+        with venv_service.lease_venv(['']) as venv:
+            assert venv.cached
+        response = client.delete(f'/api/v1/venvs/{venv.key}')
+        assert response.status_code == 204
+        assert len(client.get('/api/v1/venvs').json()) == 0
+
+    def test_eviction(self):
+        max_entries = config.VENV_CACHE_MAX_ENTRIES
+        config.VENV_CACHE_MAX_ENTRIES = 0
+        try:
+            with venv_service.lease_venv([]):
+                pass
+            assert len(venv_service.list_entries()) == 0
+        finally:
+            config.VENV_CACHE_MAX_ENTRIES = max_entries
+
+    def test_unknown_venv(self):
+        response = client.delete('/api/v1/venvs/unknown')
+        assert response.status_code == 404
+
+    def test_pool_lease(self, tmp_path, monkeypatch):
+        shutil.rmtree(config.VENV_POOL_DIR, ignore_errors=True)
+        monkeypatch.setattr(config, "VENV_POOL_SIZE", 1)
+        rain_requirement = config.RAIN_REQUIREMENT
+        config.RAIN_REQUIREMENT = '# rain'
+        try:
+            names = venv_pool.manager.refill()
+            assert len(names) == min(config.VENV_POOL_SIZE, config.VENV_POOL_REFILL_CONCURRENCY)
+            for name in names:
+                venv_pool.build_venv(name)
+            assert len(venv_pool.get_ready_venvs()) == len(names)
+            assert venv_pool.lease(tmp_path / "venv")
+            python = venv_service.get_venv_executable(tmp_path / "venv", "python")
+            prefix = subprocess.run([python, "-c", "import sys; print(sys.prefix)"], capture_output=True, text=True)
+            assert prefix.stdout.strip() == str(tmp_path / "venv")
+        finally:
+            config.RAIN_REQUIREMENT = rain_requirement
+
+    def test_pool_backoff(self, monkeypatch):
+        monkeypatch.setattr(config, "VENV_POOL_CHECK_INTERVAL", 30)
+        assert [venv_pool.get_check_interval(n) for n in range(3)] == [30, 60, 120]
+        assert venv_pool.get_check_interval(20) == venv_pool.MAX_BACKOFF
@@ -0,0 +1,64 @@
+"""
+ Copyright (C) 2023 Università degli Studi di Camerino and Sigma S.p.A.
+ Authors: Alessandro Antinori, Rosario Capparuccia, Riccardo Coltrinari, Flavio Corradini, Marco Piangerelli, Barbara Re, Marco Scarpetta
+
+ This program is free software: you can redistribute it and/or modify
+ it under the terms of the GNU Affero General Public License as
+ published by the Free Software Foundation, either version 3 of the
+ License, or (at your option) any later version.
+
+ This program is distributed in the hope that it will be useful,
+ but WITHOUT ANY WARRANTY; without even the implied warranty of
+ MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+ GNU Affero General Public License for more details.
+
+ You should have received a copy of the GNU Affero General Public License
+ along with this program.  If not, see <https://www.gnu.org/licenses/>.
+ """
+
+import shutil
+from simple_backend import config
+from simple_backend.service import wheelhouse_service
+from tests.create_test_client import create_test_client, setup_dirs
+
+
+client = create_test_client()
+
+
+class TestWheelhouse:
+
+    def setup_method(self):
+        setup_dirs()
+        shutil.rmtree(config.WHEELHOUSE_DIR, ignore_errors=True)
+
+    def test_requirement_name(self):
+        assert wheelhouse_service.get_requirement_name("git+https://github.com/SIMPLE-DVS/rain@master#egg=rain") \
+               == "rain"
+        assert wheelhouse_service.get_requirement_name("scikit_learn==0.24.2") == "scikit-learn"
+        assert wheelhouse_service.get_requirement_name("Pandas[performance]>=1.3") == "pandas"
+        assert wheelhouse_service.get_requirement_name("https://example.com/archive.zip") is None
+
+    def test_offline_requirements(self):
+        config.WHEELHOUSE_DIR.mkdir()
+        (config.WHEELHOUSE_DIR / "rain-0.1-py3-none-any.whl").touch()
+        (config.WHEELHOUSE_DIR / "scikit_learn-0.24.2-cp39-cp39-linux_x86_64.whl").touch()
+        requirements = ["git+https://github.com/SIMPLE-DVS/rain@master#egg=rain", "scikit-learn==0.24.2"]
+        assert wheelhouse_service.get_offline_requirements(requirements) == ["rain", "scikit-learn==0.24.2"]
+        assert wheelhouse_service.get_offline_requirements(requirements + ["pandas"]) is None
+
+    def test_get_wheelhouse(self):
+        response = client.get('/api/v1/wheelhouse')
+        assert response.status_code == 200
+        assert response.json()["hits"] == 0
+        assert response.json()["wheels"] == {}
+
+    def test_warm_wheelhouse(self):
+        client.post('/api/v1/repositories/test_repo')
+        response = client.post('/api/v1/wheelhouse/warm', json=["test_repo"])
+        assert response.status_code == 200
+        assert response.json() == {"requirements": [], "added": []}
+        response = client.post('/api/v1/wheelhouse/warm', json=["unknown"])
+        assert response.status_code == 404
+        for path in [".", f"../{config.BASE_OUTPUT_DIR.name}", "test_repo/."]:
+            response = client.post('/api/v1/wheelhouse/warm', json=[path])
+            assert response.status_code == 404